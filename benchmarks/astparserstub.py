@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import json
+import zlib
+import base64
+import struct
+
+frame_header = struct.Struct('>4sIIB')
+
+def parse_source(source):
+	"""
+	Extracts a small AST from the source of a java file.
+
+	:param source: the contents of the java file.
+	:returns: the AST of the file in JSON format.
+	"""
+	package = re.search(r'^\s*package\s+([\w.]+)\s*;', source, re.MULTILINE)
+	classname = re.search(r'\b(?:class|interface|enum)\s+(\w+)', source)
+	return {'package': package.group(1) if package else '',
+		'imports': re.findall(r'^\s*import\s+([\w.*]+)\s*;', source, re.MULTILINE),
+		'class': {'name': classname.group(1) if classname else '', 'methods': [{'name': name} for name in re.findall(r'\b(\w+)\s*\([^;{)]*\)\s*\{', source)
+			if name not in ('for', 'while', 'if', 'switch', 'catch')], 'innerclasses': []}}
+
+def parse_file(path):
+	"""
+	Parses a java file.
+
+	:param path: the path of the java file.
+	:returns: the AST of the file in JSON format.
+	"""
+	with open(path, encoding = 'utf-8', errors = 'replace') as infile:
+		return parse_source(infile.read())
+
+def handle_message(message):
+	"""
+	Computes the response to a message.
+
+	:param message: the message.
+	:returns: the response to the message.
+	"""
+	if message in ("START_OF_TRANSMISSION", "END_OF_TRANSMISSION"):
+		return message
+	command, _, argument = message.partition("_-_")
+	try:
+		if command == "PARSE_FILE":
+			return json.dumps(parse_file(argument))
+		if command == "PARSE_STRING":
+			return json.dumps(parse_source(argument))
+		if command == "PARSE_FOLDER":
+			asts = {}
+			for dirpath, _, filenames in os.walk(argument):
+				for filename in filenames:
+					if filename.endswith('.java'):
+						asts[os.path.join(dirpath, filename)] = parse_file(os.path.join(dirpath, filename))
+			return json.dumps(asts)
+	except OSError:
+		pass
+	return ""
+
+def main():
+	"""
+	Runs a stand-in for the ASTParser jar that speaks the same pipe protocol (base64 lines and, if negotiated,
+	framed messages) and returns small ASTs extracted with regular expressions, so that the rest of the system
+	can be benchmarked without a JVM. The messages of the standard input are served until the end of the
+	transmission.
+	"""
+	instream, outstream = sys.stdin.buffer, sys.stdout.buffer
+	framed, compress = False, False
+	while not framed:
+		line = instream.readline()
+		if not line:
+			return
+		message = base64.b64decode(line.strip()).decode('utf-8')
+		if message.startswith("SET_PROTOCOL_-_FRAMED_V1"):
+			compress = message.endswith(",ZLIB")
+			response = "FRAMED_V1,ZLIB" if compress else "FRAMED_V1"
+			framed = True
+		else:
+			response = handle_message(message)
+		outstream.write(base64.b64encode(response.encode('utf-8')) + b"\r\n")
+		outstream.flush()
+		if message == "END_OF_TRANSMISSION":
+			return
+	while True:
+		header = instream.read(frame_header.size)
+		if len(header) < frame_header.size:
+			return
+		magic, requestid, length, flags = frame_header.unpack(header)
+		payload = instream.read(length)
+		if flags & 1:
+			payload = zlib.decompress(payload)
+		message = payload.decode('utf-8')
+		response, flags = handle_message(message).encode('utf-8'), 0
+		if compress and len(response) >= 4096:
+			response, flags = zlib.compress(response), 1
+		outstream.write(frame_header.pack(magic, requestid, len(response), flags) + response)
+		outstream.flush()
+		if message == "END_OF_TRANSMISSION":
+			return
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import resource
+import subprocess
+from contextlib import contextmanager
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from libs.metrics import metrics
+from benchmarks.githubstub import start_github_stub
+from benchmarks.elasticsearchstub import start_elasticsearch_stub
+from benchmarks.repogenerator import generate_repository, modify_repository
+
+def get_rss(pid):
+	"""
+	Returns the resident set size of a process.
+
+	:param pid: the id of the process.
+	:returns: the resident set size of the process in bytes, or 0 if the process has terminated.
+	"""
+	try:
+		with open('/proc/%d/status' % pid) as infile:
+			for line in infile:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) * 1024
+	except (OSError, ValueError):
+		pass
+	return 0
+
+def get_descendants(pid):
+	"""
+	Returns the running descendants of a process (git, parser).
+
+	:param pid: the id of the process.
+	:returns: a list with the ids of the child processes of the process and of their own child processes.
+	"""
+	children = {}
+	for entry in os.listdir('/proc'):
+		if entry.isdigit():
+			try:
+				with open('/proc/%s/stat' % entry) as infile:
+					children.setdefault(int(infile.read().rsplit(')', 1)[1].split()[1]), []).append(int(entry))
+			except (OSError, IndexError, ValueError):
+				pass
+	descendants, stack = [], [pid]
+	while stack:
+		for child in children.get(stack.pop(), []):
+			descendants.append(child)
+			stack.append(child)
+	return descendants
+
+class RSSSampler(object):
+	"""
+	Samples the resident set size of this process and of its running child processes (git, parser) in a thread,
+	so that each scenario reports its own peak instead of the peak of the whole benchmark. When /proc is not
+	available (e.g. on macOS), the peaks are taken from getrusage and are the peaks since the start of the benchmark.
+	"""
+	def __init__(self, interval = 0.05):
+		"""
+		Initializes this sampler.
+
+		:param interval: the time between two samples in seconds.
+		"""
+		self.interval = interval
+		self.peakrss = 0
+		self.peakrsschildren = 0
+		self.stopped = threading.Event()
+		self.thread = None
+
+	def sample(self):
+		"""
+		Updates the peaks with the current resident set sizes.
+		"""
+		pid = os.getpid()
+		self.peakrss = max(self.peakrss, get_rss(pid))
+		self.peakrsschildren = max(self.peakrsschildren, sum(get_rss(child) for child in get_descendants(pid)))
+
+	def run(self):
+		"""
+		Samples the resident set sizes until the sampler is stopped.
+		"""
+		while not self.stopped.wait(self.interval):
+			self.sample()
+
+	def __enter__(self):
+		if os.path.isdir('/proc/self'):
+			self.sample()
+			self.thread = threading.Thread(target = self.run)
+			self.thread.daemon = True
+			self.thread.start()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self.thread:
+			self.stopped.set()
+			self.thread.join()
+			self.sample()
+		else:
+			scale = 1 if sys.platform == 'darwin' else 1024
+			self.peakrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+			self.peakrsschildren = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+
+def get_metric_values():
+	"""
+	Returns the current values of the counters and the total durations of the histograms of the metrics registry.
+
+	:returns: a dict mapping the names and the labels of the metrics to their values.
+	"""
+	values = {}
+	statistics = metrics.get_statistics()
+	for metric in statistics['counters']:
+		values[metric['name'] + json.dumps(metric['labels'], sort_keys = True)] = metric['value']
+	for metric in statistics['histograms']:
+		values[metric['name'] + json.dumps(metric['labels'], sort_keys = True)] = metric['sum']
+	return values
+
+def get_source_size(path):
+	"""
+	Computes the number and the total size of the java files of a repository.
+
+	:param path: the path of the repository.
+	:returns: a tuple of the form (numfiles, numbytes).
+	"""
+	numfiles, numbytes = 0, 0
+	for dirpath, dirnames, filenames in os.walk(path):
+		dirnames[:] = [dirname for dirname in dirnames if dirname != '.git']
+		for filename in filenames:
+			if filename.endswith('.java'):
+				numfiles += 1
+				numbytes += os.path.getsize(os.path.join(dirpath, filename))
+	return numfiles, numbytes
+
+@contextmanager
+def redirect_stdout(verbose):
+	"""
+	Suppresses the progress output of the system unless verbose output is requested.
+
+	:param verbose: boolean indicating whether the output is kept (True) or not (False).
+	"""
+	if verbose:
+		yield
+		return
+	stdout = sys.stdout
+	with open(os.devnull, 'w') as devnull:
+		sys.stdout = devnull
+		try:
+			yield
+		finally:
+			sys.stdout = stdout
+
+def create_java_command(workdir):
+	"""
+	Creates an executable that runs the stub parser in place of java.
+
+	:param workdir: the directory where the executable is created.
+	:returns: the path of the executable.
+	"""
+	path = os.path.join(workdir, 'java-stub')
+	with open(path, 'w') as outfile:
+		outfile.write('#!/bin/sh\nexec "%s" "%s"\n' % (sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astparserstub.py')))
+	os.chmod(path, 0o755)
+	return path
+
+def run_scenario(dbmanager, name, project_url, numfiles, numbytes, verbose):
+	"""
+	Adds a project once and measures the duration, the throughput and the resources of the run.
+
+	:param dbmanager: the controller used to add the project.
+	:param name: the name of the scenario.
+	:param project_url: the URL of the project.
+	:param numfiles: the number of source files that the scenario processes.
+	:param numbytes: the total size of the source files that the scenario processes.
+	:param verbose: boolean indicating whether the progress output is kept (True) or not (False).
+	:returns: a dict with the results of the scenario.
+	"""
+	before = get_metric_values()
+	started = time.time()
+	with RSSSampler() as sampler, redirect_stdout(verbose):
+		dbmanager.add_project(project_url)
+	elapsed = time.time() - started
+	after = get_metric_values()
+	breakdown = {key: after[key] - before.get(key, 0) for key in sorted(after) if after[key] != before.get(key, 0)}
+	return {'scenario': name, 'seconds': elapsed, 'files': numfiles, 'bytes': numbytes,
+		'filespersecond': numfiles / elapsed if elapsed else 0, 'mbpersecond': numbytes / 1048576.0 / elapsed if elapsed else 0,
+		'peakrss': sampler.peakrss, 'peakrsschildren': sampler.peakrsschildren, 'breakdown': breakdown}
+
+def get_commit():
+	"""
+	Returns the commit of the working tree of the system.
+
+	:returns: the sha of the HEAD commit, followed by '-dirty' if the working tree has changes, or 'unknown'.
+	"""
+	cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	try:
+		sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = cwd, stderr = subprocess.DEVNULL).decode().strip()
+		dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = cwd, stderr = subprocess.DEVNULL).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+	return sha + ('-dirty' if dirty else '')
+
+def print_results(results, baseline = None):
+	"""
+	Prints the results of the scenarios and their differences from the results of a previous run.
+
+	:param results: the list of the results of the scenarios.
+	:param baseline: the results of a previous run in JSON format, or None.
+	"""
+	previous = {result['scenario']: result for result in baseline['results']} if baseline else {}
+	for result in results:
+		line = '%-10s %8.3fs %8d files %9.1f files/s %7.2f MB/s peak RSS %6.1f MB' % (result['scenario'], result['seconds'], result['files'],
+			result['filespersecond'], result['mbpersecond'], result['peakrss'] / 1048576.0)
+		if result['scenario'] in previous and previous[result['scenario']]['seconds']:
+			line += ' (%+.1f%% vs %s)' % (100.0 * (result['seconds'] / previous[result['scenario']]['seconds'] - 1), baseline['commit'])
+		print(line)
+		for key, value in result['breakdown'].items():
+			if '_seconds' in key:
+				print('    %-60s %8.3fs' % (key, value))
+
+def main():
+	"""
+	Runs the benchmark scenarios (cold add, no-op refresh and small-diff refresh) on a synthetic repository and
+	saves their results.
+	"""
+	parser = argparse.ArgumentParser(description = 'Benchmark of adding and refreshing a project.')
+	parser.add_argument('--files', type = int, default = 1000, help = 'number of java files of the synthetic repository')
+	parser.add_argument('--file-size', type = int, default = 4096, help = 'approximate size of each java file in bytes')
+	parser.add_argument('--changes', type = int, default = 10, help = 'number of files changed for the small-diff refresh')
+	parser.add_argument('--elasticsearch', help = 'host:port of a local Elasticsearch server (the in-process stub is used if not set)')
+	parser.add_argument('--jar', help = 'path to the ASTParser jar (the stub parser is used if not set)')
+	parser.add_argument('--property', action = 'append', default = [], help = 'extra property of the system as key=value')
+	parser.add_argument('--results-dir', default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'), help = 'directory where results are saved')
+	parser.add_argument('--compare', help = 'results file of a previous run to compare with')
+	parser.add_argument('--verbose', action = 'store_true', help = 'keep the progress output of the system')
+	args = parser.parse_args()
+
+	workdir = tempfile.mkdtemp(prefix = 'agora-benchmark-')
+	try:
+		origin = os.path.join(workdir, 'origin', 'benchmark', 'project')
+		filepaths = generate_repository(origin, args.files, args.file_size)
+		github = start_github_stub({'benchmark/project': {'path': origin, 'branch': 'master'}})
+		if args.elasticsearch:
+			host, port = args.elasticsearch.rsplit(':', 1)
+		else:
+			elasticsearch = start_elasticsearch_stub()
+			host, port = '127.0.0.1', str(elasticsearch.server_address[1])
+		properties = {'sourcecodedir': os.path.join(workdir, 'src'), 'gitcommand': 'git', 'GitHubUsername': '', 'GitHubPassword': '',
+			'githubapiurl': 'http://127.0.0.1:%d' % github.server_address[1], 'host': host, 'port': port, 'AGORAUsername': '', 'AGORAPassword': '',
+			'indexname': 'agora-benchmark', 'backupdir': os.path.join(workdir, 'backup'), 'incrementalrefresh': 'True',
+			'ASTParserPath': args.jar or 'astparserstub.jar', 'javacommand': 'java' if args.jar else create_java_command(workdir)}
+		properties.update(argument.split('=', 1) for argument in args.property)
+
+		os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+		from dbmanager import DBManager
+		dbmanager = DBManager(properties)
+		with redirect_stdout(args.verbose):
+			if dbmanager.esclient.client.indices.exists(index = properties['indexname']):
+				dbmanager.delete_index()
+			dbmanager.create_index()
+		project_url = 'https://github.com/benchmark/project'
+		numfiles, numbytes = get_source_size(origin)
+		results = [run_scenario(dbmanager, 'cold', project_url, numfiles, numbytes, args.verbose)]
+		results.append(run_scenario(dbmanager, 'noop', project_url, 0, 0, args.verbose))
+		modify_repository(origin, filepaths, args.changes, args.file_size)
+		results.append(run_scenario(dbmanager, 'smalldiff', project_url, args.changes, args.changes * args.file_size, args.verbose))
+		if args.elasticsearch:
+			with redirect_stdout(args.verbose):
+				dbmanager.delete_index()
+		dbmanager.javaparser.ast_parser.close()
+	finally:
+		shutil.rmtree(workdir, ignore_errors = True)
+
+	report = {'commit': get_commit(), 'time': time.time(), 'arguments': vars(args), 'results': results}
+	baseline = None
+	if args.compare:
+		with open(args.compare) as infile:
+			baseline = json.load(infile)
+	print_results(results, baseline)
+	os.makedirs(args.results_dir, exist_ok = True)
+	path = os.path.join(args.results_dir, '%s-%d.json' % (report['commit'], report['time']))
+	with open(path, 'w') as outfile:
+		json.dump(report, outfile, indent = 2)
+	print('Results saved to ' + path)
+
+if __name__ == "__main__":
+	main()
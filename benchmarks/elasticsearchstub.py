@@ -0,0 +1,406 @@
+import re
+import gzip
+import json
+import time
+import threading
+from fnmatch import fnmatch
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class ElasticsearchStub:
+	"""
+	Class that implements an in-memory stand-in for the subset of the Elasticsearch 5 REST API that is used by the
+	client, i.e. the index, alias, mapping, document, multi get, bulk, search, scroll, count, reindex, delete by
+	query, task, snapshot and cluster health endpoints. Snapshots are stored in memory. The cluster health is given
+	by the health attribute, which is 'green' unless a test changes it.
+	Queries support only the match_all, term, terms, ids and bool clauses. Tasks are completed immediately.
+	"""
+	def __init__(self):
+		"""
+		Initializes this stub.
+		"""
+		self.indices = {}
+		self.aliases = {}
+		self.repositories = {}
+		self.scrolls = {}
+		self.tasks = {}
+		self.health = 'green'
+		self.lock = threading.Lock()
+		self.numrequests = 0
+		self.numbytes = 0
+
+	def resolve_index(self, name):
+		"""
+		Resolves the name of an index or an alias.
+
+		:param name: the name of an index or an alias.
+		:returns: the name of the index, or of the first index of the alias.
+		"""
+		if name in self.aliases and self.aliases[name]:
+			return sorted(self.aliases[name])[0]
+		return name
+
+	def run_task(self, params, response):
+		"""
+		Returns the response of an operation, or registers it as a completed task if it is not waited for.
+
+		:param params: a dict with the query parameters of the request.
+		:param response: the response of the operation.
+		:returns: a tuple of the form (status, response).
+		"""
+		if params.get('wait_for_completion') == 'false':
+			task_id = 'stub:%d' % (len(self.tasks) + 1)
+			self.tasks[task_id] = response
+			return 200, {'task': task_id}
+		return 200, response
+
+	def get_documents(self, index, doc_type):
+		"""
+		Returns the documents of a type of an index.
+
+		:param index: the name of the index.
+		:param doc_type: the type of the documents.
+		:returns: a dict mapping the ids of the documents to dicts with their source, parent and routing.
+		"""
+		return self.indices.setdefault(self.resolve_index(index), {'settings': {}, 'mappings': {}, 'docs': {}})['docs'].setdefault(doc_type, {})
+
+	def flatten_settings(self, settings, prefix = 'index.'):
+		"""
+		Converts nested index settings to flat settings, e.g. {'index': {'refresh_interval': '1s'}} to
+		{'index.refresh_interval': '1s'}.
+
+		:param settings: the settings in nested or flat form.
+		:param prefix: the prefix of the keys of the settings.
+		:returns: a dict with the flat settings.
+		"""
+		flat = {}
+		for key, value in settings.items():
+			if key == 'index':
+				flat.update(self.flatten_settings(value))
+			elif isinstance(value, dict) and key != 'analysis':
+				flat.update(self.flatten_settings(value, prefix + key + '.'))
+			else:
+				flat[key if key.startswith('index.') else prefix + key] = value
+		return flat
+
+	def matches(self, query, fields):
+		"""
+		Checks whether a document matches a query.
+
+		:param query: the query in JSON format.
+		:param fields: the fields of the document, including its _id and _routing.
+		:returns: True if the document matches the query, or False otherwise.
+		"""
+		if not query or 'match_all' in query:
+			return True
+		if 'term' in query:
+			field, value = list(query['term'].items())[0]
+			return fields.get(field) == (value['value'] if isinstance(value, dict) else value)
+		if 'terms' in query:
+			field, values = list(query['terms'].items())[0]
+			return fields.get(field) in values
+		if 'ids' in query:
+			return fields['_id'] in query['ids']['values']
+		if 'bool' in query:
+			clauses = []
+			for key in ('must', 'filter'):
+				value = query['bool'].get(key, [])
+				clauses += value if isinstance(value, list) else [value]
+			return all(self.matches(clause, fields) for clause in clauses)
+		return True
+
+	def search(self, index, doc_type, body):
+		"""
+		Finds the documents that match the query of a search request.
+
+		:param index: the name of the index.
+		:param doc_type: the type of the documents, or None for all types.
+		:param body: the body of the search request.
+		:returns: a list of the hits of the search.
+		"""
+		body = body or {}
+		hits = []
+		for currenttype, docs in self.indices.get(self.resolve_index(index), {'docs': {}})['docs'].items():
+			if doc_type and currenttype != doc_type:
+				continue
+			for doc_id, doc in docs.items():
+				fields = dict(doc['_source'], _id = doc_id, _routing = doc['_routing'], _parent = doc['_parent'])
+				if self.matches(body.get('query'), fields):
+					source = doc['_source']
+					if isinstance(body.get('_source'), list):
+						source = {key: value for key, value in source.items() if key in body['_source']}
+					hits.append({'_index': index, '_type': currenttype, '_id': doc_id, '_source': source})
+		return hits
+
+	def handle(self, method, path, params, body):
+		"""
+		Handles a request.
+
+		:param method: the HTTP method of the request.
+		:param path: the path of the request.
+		:param params: a dict with the query parameters of the request.
+		:param body: the body of the request, parsed as JSON if possible.
+		:returns: a tuple of the form (status, response).
+		"""
+		parts = [unquote(part) for part in path.split('/') if part]
+		if parts and not parts[0].startswith('_'):
+			parts[0] = self.resolve_index(parts[0])
+		if parts and parts[-1] == '_bulk':
+			return self.bulk(body)
+		if len(parts) == 3 and parts[2] == '_mget':
+			docs = self.get_documents(parts[0], parts[1])
+			return 200, {'docs': [{'_index': parts[0], '_type': parts[1], '_id': doc_id, 'found': doc_id in docs} for doc_id in body['ids']]}
+		if parts and parts[0] == '_tasks' and len(parts) == 2:
+			if parts[1] not in self.tasks:
+				return 404, {'error': 'resource_not_found_exception'}
+			return 200, {'completed': True, 'task': {'id': parts[1], 'status': {}}, 'response': self.tasks[parts[1]]}
+		if parts and parts[0] == '_alias' and len(parts) == 2:
+			if not self.aliases.get(parts[1]):
+				return 404, {'error': 'alias [%s] missing' % parts[1]}
+			return 200, {index: {'aliases': {parts[1]: {}}} for index in self.aliases[parts[1]]}
+		if len(parts) == 2 and parts[1] == '_alias':
+			return 200, {index: {'aliases': {alias: {} for alias, indices in self.aliases.items() if index in indices}}
+				for index in self.indices if fnmatch(index, parts[0])}
+		if parts == ['_aliases']:
+			for action in body['actions']:
+				for name, alias in action.items():
+					if name == 'add':
+						self.aliases.setdefault(alias['alias'], set()).add(alias['index'])
+					elif name == 'remove':
+						self.aliases.get(alias['alias'], set()).discard(alias['index'])
+					elif name == 'remove_index':
+						self.indices.pop(alias['index'], None)
+			return 200, {'acknowledged': True}
+		if parts and parts[0] == '_snapshot':
+			return self.handle_snapshot(method, parts, body)
+		if parts[:2] == ['_cluster', 'health']:
+			statuses = ['red', 'yellow', 'green']
+			timed_out = statuses.index(self.health) < statuses.index(params.get('wait_for_status', 'red'))
+			return (408 if timed_out else 200), {'status': self.health, 'timed_out': timed_out}
+		if parts == ['_reindex']:
+			source, dest = self.resolve_index(body['source']['index']), self.resolve_index(body['dest']['index'])
+			created = 0
+			for doc_type, docs in self.indices.get(source, {'docs': {}})['docs'].items():
+				for doc_id, doc in docs.items():
+					doc = json.loads(json.dumps(doc))
+					for field in body.get('script', {}).get('params', {}).get('fields', []):
+						doc['_source'].pop(field, None)
+					self.get_documents(dest, doc_type)[doc_id] = doc
+					created += 1
+			return self.run_task(params, {'total': created, 'created': created, 'updated': 0, 'failures': []})
+		if parts[:2] == ['_search', 'scroll']:
+			scroll_id = body if isinstance(body, str) else (params.get('scroll_id') or (body or {}).get('scroll_id'))
+			if method == 'DELETE':
+				self.scrolls.pop(scroll_id, None)
+				return 200, {'succeeded': True}
+			hits, size = self.scrolls.get(scroll_id, ([], 10))
+			self.scrolls[scroll_id] = (hits[size:], size)
+			return 200, {'_scroll_id': scroll_id, 'hits': {'total': len(hits), 'hits': hits[:size]}}
+		if parts and parts[-1] in ('_search', '_count', '_delete_by_query'):
+			doc_type = parts[1] if len(parts) == 3 else None
+			hits = self.search(parts[0], doc_type, body)
+			if parts[-1] == '_count':
+				return 200, {'count': len(hits)}
+			if parts[-1] == '_delete_by_query':
+				for hit in hits:
+					del self.get_documents(parts[0], hit['_type'])[hit['_id']]
+				return self.run_task(params, {'total': len(hits), 'deleted': len(hits), 'failures': []})
+			size = int(params.get('size', (body or {}).get('size', 10)))
+			response = {'hits': {'total': len(hits), 'hits': hits[:size]}}
+			if 'scroll' in params:
+				response['_scroll_id'] = 'scroll%d' % len(self.scrolls)
+				self.scrolls[response['_scroll_id']] = (hits[size:], size)
+			return 200, response
+		if len(parts) == 1 and not parts[0].startswith('_'):
+			if method == 'HEAD':
+				return (200 if parts[0] in self.indices else 404), {}
+			if method == 'PUT':
+				body = body or {}
+				self.indices[parts[0]] = {'settings': self.flatten_settings(body.get('settings', {})), 'mappings': body.get('mappings', {}), 'docs': {}}
+				return 200, {'acknowledged': True}
+			if method == 'DELETE':
+				if self.indices.pop(parts[0], None) is None:
+					return 404, {'error': 'index_not_found_exception'}
+				for indices in self.aliases.values():
+					indices.discard(parts[0])
+				return 200, {'acknowledged': True}
+		if len(parts) >= 2 and parts[1] in ('_mapping', '_settings', '_refresh', '_flush', '_forcemerge'):
+			index = self.indices.get(parts[0])
+			if index is None:
+				return 404, {'error': 'index_not_found_exception'}
+			if parts[1] == '_mapping':
+				if method == 'GET':
+					return 200, {parts[0]: {'mappings': index['mappings']}}
+				index['mappings'].update(body if len(parts) == 2 else {parts[2]: body})
+			elif parts[1] == '_settings':
+				if method == 'GET':
+					if params.get('flat_settings') == 'true':
+						return 200, {parts[0]: {'settings': index['settings']}}
+					return 200, {parts[0]: {'settings': {'index': {key[6:]: value for key, value in index['settings'].items()}}}}
+				for key, value in self.flatten_settings(body).items():
+					if value is None:
+						index['settings'].pop(key, None)
+					else:
+						index['settings'][key] = value
+			return 200, {'acknowledged': True}
+		if len(parts) >= 3:
+			return self.handle_document(method, parts, params, body)
+		return 400, {'error': 'unsupported request %s %s' % (method, path)}
+
+	def handle_snapshot(self, method, parts, body):
+		"""
+		Handles a request on a snapshot repository or a snapshot.
+
+		:param method: the HTTP method of the request.
+		:param parts: the parts of the path of the request.
+		:param body: the body of the request.
+		:returns: a tuple of the form (status, response).
+		"""
+		if len(parts) == 2:
+			if method == 'PUT':
+				self.repositories[parts[1]] = {'settings': body, 'snapshots': {}}
+				return 200, {'acknowledged': True}
+			if parts[1] not in self.repositories:
+				return 404, {'error': 'repository_missing_exception'}
+			return 200, {parts[1]: self.repositories[parts[1]]['settings']}
+		if parts[1] not in self.repositories:
+			return 404, {'error': 'repository_missing_exception'}
+		snapshots = self.repositories[parts[1]]['snapshots']
+		if parts[2] == '_all':
+			return 200, {'snapshots': [snapshot['info'] for snapshot in snapshots.values()]}
+		if parts[2] not in snapshots and method != 'PUT':
+			return 404, {'error': 'snapshot_missing_exception'}
+		if method == 'PUT':
+			indices = [self.resolve_index(name) for name in body['indices'].split(',')]
+			snapshots[parts[2]] = {'indices': json.loads(json.dumps({name: self.indices[name] for name in indices})),
+				'info': {'snapshot': parts[2], 'state': 'SUCCESS', 'indices': indices, 'start_time_in_millis': int(time.time() * 1000)}}
+			return 200, {'accepted': True}
+		if method == 'DELETE':
+			del snapshots[parts[2]]
+			return 200, {'acknowledged': True}
+		if len(parts) == 4 and parts[3] == '_status':
+			return 200, {'snapshots': [{'snapshot': parts[2], 'state': 'SUCCESS', 'shards_stats': {'done': 1, 'total': 1}}]}
+		if len(parts) == 4 and parts[3] == '_restore':
+			for name in body['indices'].split(','):
+				self.indices[re.sub(body['rename_pattern'], body['rename_replacement'], name)] = json.loads(json.dumps(snapshots[parts[2]]['indices'][name]))
+			return 200, {'accepted': True}
+		return 200, {'snapshots': [snapshots[parts[2]]['info']]}
+
+	def handle_document(self, method, parts, params, body):
+		"""
+		Handles a request on a single document.
+
+		:param method: the HTTP method of the request.
+		:param parts: the parts of the path of the request.
+		:param params: a dict with the query parameters of the request.
+		:param body: the body of the request.
+		:returns: a tuple of the form (status, response).
+		"""
+		index, doc_type, doc_id = parts[0], parts[1], parts[2]
+		action = parts[3] if len(parts) > 3 else None
+		docs = self.get_documents(index, doc_type)
+		if method == 'HEAD':
+			return (200 if doc_id in docs else 404), {}
+		if method == 'GET':
+			if doc_id in docs:
+				return 200, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': True, '_source': docs[doc_id]['_source']}
+			return 404, {'_index': index, '_type': doc_type, '_id': doc_id, 'found': False}
+		if method == 'DELETE':
+			if docs.pop(doc_id, None) is None:
+				return 404, {'found': False}
+			return 200, {'found': True}
+		if action == '_update':
+			if doc_id not in docs:
+				return 404, {'error': 'document_missing_exception'}
+			docs[doc_id]['_source'].update(body['doc'])
+			return 200, {'_id': doc_id, 'result': 'updated'}
+		if (action == '_create' or params.get('op_type') == 'create') and doc_id in docs:
+			return 409, {'error': 'version_conflict_engine_exception'}
+		docs[doc_id] = {'_source': body, '_parent': params.get('parent'), '_routing': params.get('routing') or params.get('parent') or doc_id}
+		return 201, {'_id': doc_id, 'created': True}
+
+	def bulk(self, body):
+		"""
+		Handles a bulk request.
+
+		:param body: the body of the request as newline delimited JSON.
+		:returns: a tuple of the form (status, response).
+		"""
+		lines = [line for line in body.split('\n') if line.strip()]
+		items = []
+		errors = False
+		i = 0
+		while i < len(lines):
+			operation, meta = list(json.loads(lines[i]).items())[0]
+			i += 1
+			source = None
+			if operation != 'delete':
+				source = json.loads(lines[i])
+				i += 1
+			docs = self.get_documents(meta['_index'], meta['_type'])
+			doc_id = meta['_id']
+			result = {'_type': meta['_type'], '_id': doc_id, 'status': 200}
+			if operation == 'create' and doc_id in docs:
+				result.update(status = 409, error = {'type': 'version_conflict_engine_exception'})
+			elif operation in ('create', 'index'):
+				docs[doc_id] = {'_source': source, '_parent': meta.get('_parent'), '_routing': meta.get('_routing') or meta.get('_parent') or doc_id}
+				result['status'] = 201
+			elif operation == 'update':
+				if doc_id in docs:
+					docs[doc_id]['_source'].update(source['doc'])
+				else:
+					result.update(status = 404, error = {'type': 'document_missing_exception'})
+			elif operation == 'delete' and docs.pop(doc_id, None) is None:
+				result['status'] = 404
+			errors = errors or 'error' in result
+			items.append({operation: result})
+		return 200, {'took': 1, 'errors': errors, 'items': items}
+
+class ElasticsearchStubHandler(BaseHTTPRequestHandler):
+	"""
+	Handler of the HTTP requests of the Elasticsearch stub.
+	"""
+	def log_message(self, *args):
+		pass
+
+	def handle_request(self):
+		url = urlparse(self.path)
+		params = {key: value[0] for key, value in parse_qs(url.query).items()}
+		length = int(self.headers.get('Content-Length') or 0)
+		raw = self.rfile.read(length) if length else b''
+		if self.headers.get('Content-Encoding') == 'gzip':
+			raw = gzip.decompress(raw)
+		body = raw.decode('utf-8')
+		if body and not url.path.endswith('_bulk'):
+			try:
+				body = json.loads(body)
+			except ValueError:
+				pass
+		stub = self.server.stub
+		with stub.lock:
+			stub.numrequests += 1
+			stub.numbytes += length
+			status, response = stub.handle(self.command, url.path, params, body or None)
+		data = json.dumps(response).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data) if self.command != 'HEAD' else 0))
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(data)
+
+	do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = handle_request
+
+def start_elasticsearch_stub(port = 0):
+	"""
+	Starts an Elasticsearch stub in a separate thread.
+
+	:param port: the port of the server, or 0 for any free port.
+	:returns: the server, of which the stub is given by server.stub.
+	"""
+	server = ThreadingHTTPServer(('127.0.0.1', port), ElasticsearchStubHandler)
+	server.stub = ElasticsearchStub()
+	thread = threading.Thread(target = server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
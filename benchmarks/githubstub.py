@@ -0,0 +1,86 @@
+import json
+import hashlib
+import threading
+import subprocess
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class GithubStubHandler(BaseHTTPRequestHandler):
+	"""
+	Handler of the requests of the GitHub API stub. It serves the repository, branch and tree endpoints that are
+	used by the project downloaders, computing the responses from local git repositories.
+	"""
+	def log_message(self, *args):
+		pass
+
+	def get_response(self, parts):
+		"""
+		Computes the response of a request.
+
+		:param parts: the parts of the path of the request.
+		:returns: the response in JSON format, or None if the resource does not exist.
+		"""
+		if len(parts) < 3 or parts[0] != 'repos' or parts[1] + '/' + parts[2] not in self.server.repos:
+			return None
+		project_id = parts[1] + '/' + parts[2]
+		repo = self.server.repos[project_id]
+		repourl = 'http://%s:%d/repos/%s' % (self.server.server_address[0], self.server.server_address[1], project_id)
+		if len(parts) == 3:
+			return {'name': parts[2], 'full_name': project_id, 'owner': {'login': parts[1]}, 'default_branch': repo['branch'],
+				'url': repourl, 'trees_url': repourl + '/git/trees{/sha}', 'git_url': repo['path']}
+		if parts[3] == 'branches' and len(parts) == 5:
+			sha = subprocess.check_output([self.server.gitcommand, 'rev-parse', parts[4]], cwd = repo['path']).decode().strip()
+			return {'name': parts[4], 'commit': {'sha': sha}}
+		if parts[3:5] == ['git', 'trees'] and len(parts) == 6:
+			output = subprocess.check_output([self.server.gitcommand, 'ls-tree', '-r', '-t', '-l', '-z', parts[5]], cwd = repo['path']).decode('utf-8')
+			tree = []
+			for entry in output.split('\0'):
+				if entry:
+					meta, path = entry.split('\t', 1)
+					mode, otype, sha, size = meta.split()
+					item = {'path': path, 'mode': mode, 'type': otype, 'sha': sha, 'url': repourl + '/git/' + otype + 's/' + sha}
+					if otype == 'blob':
+						item['size'] = int(size)
+					tree.append(item)
+			return {'sha': parts[5], 'tree': tree, 'truncated': False}
+		return None
+
+	def do_GET(self):
+		parts = [part for part in urlparse(self.path).path.split('/') if part]
+		with self.server.lock:
+			self.server.numrequests += 1
+		response = self.get_response(parts)
+		data = json.dumps(response).encode('utf-8')
+		etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+		notmodified = response is not None and self.headers.get('If-None-Match') == etag
+		self.send_response(404 if response is None else (304 if notmodified else 200))
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('ETag', etag)
+		self.send_header('x-ratelimit-limit', '5000')
+		self.send_header('x-ratelimit-remaining', '4999')
+		self.send_header('x-ratelimit-reset', '9999999999')
+		if notmodified:
+			self.end_headers()
+		else:
+			self.send_header('Content-Length', str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+
+def start_github_stub(repos, gitcommand = 'git', port = 0):
+	"""
+	Starts a stub of the GitHub API in a separate thread.
+
+	:param repos: a dict mapping project ids to dicts with the path of a local repository and its default branch.
+	:param gitcommand: the git executable.
+	:param port: the port of the server, or 0 for any free port.
+	:returns: the server, of which the base URL is http://127.0.0.1:server.server_address[1].
+	"""
+	server = ThreadingHTTPServer(('127.0.0.1', port), GithubStubHandler)
+	server.repos = repos
+	server.gitcommand = gitcommand
+	server.numrequests = 0
+	server.lock = threading.Lock()
+	thread = threading.Thread(target = server.serve_forever)
+	thread.daemon = True
+	thread.start()
+	return server
@@ -0,0 +1,105 @@
+import os
+import random
+import subprocess
+
+def run_git(gitcommand, arguments, cwd):
+	"""
+	Runs a git command and raises an error if it fails.
+
+	:param gitcommand: the git executable.
+	:param arguments: the arguments of the git command.
+	:param cwd: the directory where the command is executed.
+	"""
+	subprocess.check_call([gitcommand] + arguments, cwd = cwd, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+def generate_java_file(rng, package_name, class_name, file_size):
+	"""
+	Generates the contents of a synthetic java file.
+
+	:param rng: the random number generator.
+	:param package_name: the package of the class of the file.
+	:param class_name: the name of the class of the file.
+	:param file_size: the approximate size of the file in bytes.
+	:returns: the contents of the java file.
+	"""
+	lines = ["package %s;" % package_name, "", "import java.util.List;", "import java.util.ArrayList;", "", "public class %s {" % class_name]
+	size = sum(len(line) + 1 for line in lines)
+	methodnum = 0
+	while size < file_size:
+		field = "value%d" % methodnum
+		method = ["\tprivate int %s = %d;" % (field, rng.randint(0, 1000)),
+			"\tpublic List<Integer> compute%d(int limit) {" % methodnum,
+			"\t\tList<Integer> result = new ArrayList<Integer>();",
+			"\t\tfor (int i = 0; i < limit; i++) {",
+			"\t\t\tresult.add(i * %s + %d);" % (field, rng.randint(0, 1000)),
+			"\t\t}",
+			"\t\treturn result;",
+			"\t}"]
+		lines.extend(method)
+		size += sum(len(line) + 1 for line in method)
+		methodnum += 1
+	lines.append("}")
+	return "\n".join(lines) + "\n"
+
+def generate_repository(path, num_files, file_size = 4096, num_packages = 10, seed = 0, gitcommand = 'git'):
+	"""
+	Generates a local git repository with synthetic java files in a single commit. The repository is the same
+	for the same arguments.
+
+	:param path: the path where the repository is created.
+	:param num_files: the number of java files of the repository.
+	:param file_size: the approximate size of each java file in bytes.
+	:param num_packages: the number of packages among which the java files are divided.
+	:param seed: the seed of the random number generator.
+	:param gitcommand: the git executable.
+	:returns: a list with the paths of the java files relative to the repository.
+	"""
+	rng = random.Random(seed)
+	os.makedirs(path, exist_ok = True)
+	run_git(gitcommand, ['init', '-q', '.'], path)
+	run_git(gitcommand, ['checkout', '-q', '-b', 'master'], path)
+	run_git(gitcommand, ['config', 'user.email', 'benchmark@localhost'], path)
+	run_git(gitcommand, ['config', 'user.name', 'benchmark'], path)
+	filepaths = []
+	for i in range(num_files):
+		package_name = "org.benchmark.package%d" % (i % num_packages)
+		filepath = "src/main/java/" + package_name.replace('.', '/') + "/Class%d.java" % i
+		os.makedirs(os.path.dirname(os.path.join(path, filepath)), exist_ok = True)
+		with open(os.path.join(path, filepath), 'w') as outfile:
+			outfile.write(generate_java_file(rng, package_name, "Class%d" % i, file_size))
+		filepaths.append(filepath)
+	with open(os.path.join(path, 'README.md'), 'w') as outfile:
+		outfile.write("Synthetic repository with %d java files\n" % num_files)
+	run_git(gitcommand, ['add', '-A'], path)
+	run_git(gitcommand, ['commit', '-q', '-m', 'Initial commit'], path)
+	return filepaths
+
+def modify_repository(path, filepaths, num_changes, file_size = 4096, seed = 1, gitcommand = 'git'):
+	"""
+	Modifies, adds and deletes a number of java files of a repository in a new commit.
+
+	:param path: the path of the repository.
+	:param filepaths: a list with the paths of the java files relative to the repository, which is updated.
+	:param num_changes: the number of files that are changed, divided equally among modified, added and deleted files.
+	:param file_size: the approximate size of each new java file in bytes.
+	:param seed: the seed of the random number generator.
+	:param gitcommand: the git executable.
+	"""
+	rng = random.Random(seed)
+	for i in range(num_changes):
+		if i % 3 == 0 or not filepaths:
+			class_name = "Added%d_%d" % (seed, i)
+			filepath = "src/main/java/org/benchmark/added/" + class_name + ".java"
+			os.makedirs(os.path.dirname(os.path.join(path, filepath)), exist_ok = True)
+			with open(os.path.join(path, filepath), 'w') as outfile:
+				outfile.write(generate_java_file(rng, "org.benchmark.added", class_name, file_size))
+			filepaths.append(filepath)
+		elif i % 3 == 1:
+			filepath = rng.choice(filepaths)
+			with open(os.path.join(path, filepath), 'a') as outfile:
+				outfile.write("// modified %d\n" % rng.randint(0, 1000000))
+		else:
+			filepath = filepaths.pop(rng.randrange(len(filepaths)))
+			os.remove(os.path.join(path, filepath))
+	run_git(gitcommand, ['add', '-A'], path)
+	run_git(gitcommand, ['commit', '-q', '-m', 'Change %d files' % num_changes], path)
@@ -1,7 +1,16 @@
+import os
 import sys
+import time
+import functools
+from contextlib import ExitStack
+from libs.pipeline import Pipeline
+from libs.metrics import metrics, MetricsReport
+from libs.runjournal import RunJournal
+from libs.indexingpolicy import IndexingPolicy
 from libs.filefunctions import read_ascii_file
 from libs.gitdownloader import GitDownloader
-from libs.githubprojectdownloader import GithubProjectDownloader
+from libs.clonemanager import CloneManager
+from libs.asyncgithubdownloader import AsyncGithubProjectDownloader
 from libs.javacompiler import JavaCompiler
 from libs.elasticsearchclient import ElasticSearchClient
 
@@ -17,10 +26,47 @@ class DBManager:
 		"""
 		self.properties = properties
 		self.sourcecodedir = properties["sourcecodedir"];
-		self.gitdownloader = GitDownloader(properties["sourcecodedir"], properties["gitcommand"])
-		self.gpdownloader = GithubProjectDownloader(properties["GitHubUsername"], properties["GitHubPassword"])
-		self.javaparser = JavaCompiler(properties["ASTParserPath"])
-		self.esclient = ElasticSearchClient(host = properties["host"], port = properties["port"], username = properties["AGORAUsername"], password = properties["AGORAPassword"], indexname = properties["indexname"])
+		self.gitdownloader = GitDownloader(properties["sourcecodedir"], properties["gitcommand"], properties.get("clonestrategy", "full"), int(properties.get("gittimeout", 0)) or None)
+		self.clonemanager = CloneManager(self.gitdownloader, int(properties.get("maxgitoperations", 4)), int(properties.get("gitretries", 2)), int(properties.get("sourcecodediskbudget", 0)))
+		self.githubconcurrency = int(properties.get("githubconcurrency", 1))
+		self.localtree = str(properties.get("localtree", "False")).lower() == "true"
+		self.indexingpolicy = IndexingPolicy.from_file(properties["indexingpolicy"]) if properties.get("indexingpolicy", None) else None
+		self.gpdownloader = AsyncGithubProjectDownloader(properties["GitHubUsername"], properties["GitHubPassword"], cachedir = properties.get("githubcachedir", None),
+			concurrency = self.githubconcurrency, apiurl = properties.get("githubapiurl", "https://api.github.com"), indexingpolicy = self.indexingpolicy,
+			cache_max_bytes = int(properties.get("githubcachemaxbytes", 1073741824)))
+		# All the parse workers share this compiler, whose pool hands a free parser process to each request
+		self.javaparser = JavaCompiler(properties["ASTParserPath"], int(properties.get("astparsers", properties.get("parseworkers", 1))),
+			properties.get("astcachedir", None), int(properties.get("astcachemaxbytes", 1073741824)),
+			properties.get("astparserprotocol", "base64"), str(properties.get("astparsercompression", "False")).lower() == "true",
+			properties.get("javacommand", "java"))
+		self.esclient = ElasticSearchClient(host = properties["host"], port = properties["port"], username = properties["AGORAUsername"], password = properties["AGORAPassword"], indexname = properties["indexname"],
+			serializer = properties.get("esserializer", "auto"), http_compress = str(properties.get("escompression", "False")).lower() == "true",
+			max_connections = int(properties.get("esconnections", 10)), keep_old_versions = str(properties.get("keepoldindices", "True")).lower() == "true")
+		self.bulkmaxdocuments = int(properties.get("bulkmaxdocuments", 500))
+		self.bulkmaxbytes = int(properties.get("bulkmaxbytes", 10485760))
+		self.deduplicateblobs = str(properties.get("deduplicateblobs", "False")).lower() == "true"
+		self.pipelinequeuesize = int(properties.get("pipelinequeuesize", 2))
+		self.downloadworkers = int(properties.get("downloadworkers", 1))
+		self.cloneworkers = int(properties.get("cloneworkers", 1))
+		self.parseworkers = int(properties.get("parseworkers", 1))
+		self.indexworkers = int(properties.get("indexworkers", 1))
+		self.incrementalrefresh = str(properties.get("incrementalrefresh", "False")).lower() == "true"
+		self.streamparsing = str(properties.get("streamparsing", "False")).lower() == "true"
+		self.report = MetricsReport(properties["metricsfile"]) if properties.get("metricsfile", None) else None
+		if int(properties.get("metricsport", 0)):
+			metrics.start_server(int(properties["metricsport"]))
+		self.rundir = properties.get("rundir", None)
+		self.maxattempts = int(properties.get("maxattempts", 3))
+		self.retrybackoff = float(properties.get("retrybackoff", 60))
+		self.journal = None
+		self.deletebatchsize = int(properties.get("deletebatchsize", 1000))
+		self.deleterequestspersecond = float(properties.get("deleterequestspersecond", 0)) or None
+		self.deletepollinterval = float(properties.get("deletepollinterval", 5))
+		self.bulkloadmode = str(properties.get("bulkloadmode", "False")).lower() == "true"
+		self.backupkeeplast = int(properties.get("backupkeeplast", 5))
+		self.backupkeepdaily = int(properties.get("backupkeepdaily", 7))
+		self.backupkeepweekly = int(properties.get("backupkeepweekly", 4))
+		self.backuppollinterval = float(properties.get("backuppollinterval", 5))
 
 	def create_index(self):
 		"""
@@ -28,6 +74,48 @@ class DBManager:
 		"""
 		self.esclient.create_index_and_mappings()
 
+	def update_mappings(self):
+		"""
+		Updates the mappings of the index by reindexing its documents into a new version of the index. Searches are
+		served by the current version until the new one is complete.
+		"""
+		self.esclient.create_index_and_mappings(update_mappings = True)
+
+	def rebuild_index(self, project_addresses, runname = None, seed = False):
+		"""
+		Rebuilds the index from a list of projects into a new version of the index, and switches the alias of the
+		index to it at the end. Searches are served by the current version of the index during the rebuild. If the
+		rebuild fails or any of the projects fails to be added, the new version is deleted and the current one is kept.
+		
+		:param project_addresses: a list of project addresses to be added.
+		:param runname: the name of the run, used as the name of its journal after adding the name of the new
+		version, so that the journals of add_projects runs are not affected.
+		:param seed: boolean indicating whether the new version starts with the documents of the current version
+		(True) or empty (False).
+		"""
+		aliasclient = self.esclient
+		versionedname = aliasclient.create_versioned_index()
+		self.esclient = aliasclient.get_index_client(versionedname)
+		try:
+			if seed and aliasclient.client.indices.exists(aliasclient.indexname):
+				self.esclient.reindex_from(aliasclient.indexname)
+			failedprojects = self.add_projects(project_addresses, runname + '-' + versionedname if runname else None, restart = True)
+			if failedprojects:
+				raise RuntimeError('%d projects failed to be added, the index is not switched to %s' % (len(failedprojects), versionedname))
+		except BaseException:
+			self.esclient.delete_index_and_mappings()
+			raise
+		finally:
+			self.esclient = aliasclient
+		self.esclient.switch_alias(versionedname)
+
+	def delete_old_indices(self):
+		"""
+		Deletes the previous versions of the index that were kept when the alias of the index was switched.
+		"""
+		for index in self.esclient.delete_old_versions():
+			sys.stdout.write('Deleted index %s\n' % index)
+
 	def delete_index(self):
 		"""
 		Deletes the index and its mappings.
@@ -36,15 +124,34 @@ class DBManager:
 
 	def create_backup(self):
 		"""
-		Creates a backups for the index.
+		Creates a new snapshot of the index and deletes the old snapshots that are not retained.
+		"""
+		self.esclient.backup(self.properties["backupdir"], self.backuppollinterval)
+		for snapshotname in self.esclient.delete_old_backups(self.backupkeeplast, self.backupkeepdaily, self.backupkeepweekly):
+			sys.stdout.write('Deleted snapshot %s\n' % snapshotname)
+
+	def list_backups(self):
+		"""
+		Prints the snapshots of the index.
 		"""
-		self.esclient.backup(self.properties["backupdir"])
+		for snapshot in self.esclient.get_backups():
+			sys.stdout.write('%s %s %s\n' % (snapshot['snapshot'], snapshot['state'], snapshot.get('start_time', '')))
 
-	def delete_backup(self):
+	def restore_backup(self, snapshotname = None):
 		"""
-		Deletes any backups of the index. If there are no backups, this function does nothing.
+		Restores a snapshot of the index into a new version of the index, to which the alias of the index is switched.
+		
+		:param snapshotname: the name of the snapshot, or None to restore the newest snapshot.
 		"""
-		self.esclient.delete_backup()
+		self.esclient.restore_backup(snapshotname, self.backuppollinterval)
+
+	def delete_backup(self, snapshotname = None):
+		"""
+		Deletes a snapshot or all the snapshots of the index. If there are no backups, this function does nothing.
+		
+		:param snapshotname: the name of the snapshot, or None to delete all the snapshots.
+		"""
+		self.esclient.delete_backup(snapshotname)
 
 	def flush_index(self):
 		"""
@@ -71,73 +178,403 @@ class DBManager:
 		
 		:param file_path: the path of the file of which the JSON object is updated.
 		:param afile: the JSON object of the file.
-		:param full_compiled_source: the full compiled source of the project.
+		:param full_compiled_source: the full compiled source of the project, where the files that the parser
+		rejected have None as their AST, so that they are not parsed again and are indexed without code.
 		"""
 		if afile['extension'] == 'java':
 			if len(afile['name']) <= 125:
-				if full_compiled_source and file_path in full_compiled_source:
-					afile['code'] = full_compiled_source[file_path]
+				if full_compiled_source is not None and file_path in full_compiled_source:
+					code = full_compiled_source[file_path]
 				else:
-					afile['code'] = self.javaparser.parse_file(file_path)
+					code = self.javaparser.parse_file(file_path, afile['sha'])
+				if code is not None:
+					afile['code'] = code
 				try:
 					afile['content'] = read_ascii_file(file_path)
-					afile['analyzedcontent'] = afile['content']
 				except FileNotFoundError:
 					afile['extension'] = 'ljava'
 			else:
 				afile['extension'] = 'ljava'
 	
-	def add_project(self, project_address):
+	def skip_stored_blobs(self, files):
 		"""
-		Adds a project to the index or updates it if it already exists.
+		Removes the java files of which the blobs are already stored in the index when the files are deduplicated,
+		so that they are neither read nor parsed. Out of many java files with the same sha, only the first is kept.
 		
-		:param project_address: the URL of the project to be added.
+		:param files: a list of tuples of the form (filepath, file).
+		:returns: a list with the tuples of the files of which the code and the contents must be set.
+		"""
+		if not self.deduplicateblobs:
+			return files
+		for _, afile in files:
+			# Java files with long names are never parsed, so they get the same extension as in set_file_code_and_contents
+			if afile['extension'] == 'java' and len(afile['name']) > 125:
+				afile['extension'] = 'ljava'
+		storedshas = self.esclient.get_stored_blobs(set(afile['sha'] for _, afile in files if afile['extension'] == 'java'))
+		selectedfiles = []
+		for file_path, afile in files:
+			if afile['extension'] != 'java':
+				selectedfiles.append((file_path, afile))
+			elif afile['sha'] in storedshas:
+				metrics.increment('blobs_deduplicated_total')
+			else:
+				storedshas.add(afile['sha'])
+				selectedfiles.append((file_path, afile))
+		return selectedfiles
+
+	def set_files_code_and_contents(self, files):
+		"""
+		Sets the code and the contents of many java file JSON objects. The java files are sent to the parser in
+		one batch instead of one at a time.
+		
+		:param files: a list of tuples of the form (filepath, file) for the files of which the JSON objects are updated.
+		"""
+		files = self.skip_stored_blobs(files)
+		filepaths = [file_path for file_path, afile in files if afile['extension'] == 'java' and len(afile['name']) <= 125]
+		compiled_source = dict(self.javaparser.parse_files(filepaths, {file_path: afile['sha'] for file_path, afile in files}))
+		for file_path, afile in files:
+			self.set_file_code_and_contents(file_path, afile, compiled_source)
+
+	def get_compiled_files_with_paths(self, project_path, sourcefiles, full_compiled_source = None):
+		"""
+		Enumerates all files of a project and sets the code and the contents of its java files. If the compiled
+		source of the project is not given, then the java files are parsed while the files are enumerated. When the
+		files are deduplicated, the java files of which the blobs are already stored are enumerated without code and
+		contents.
+		
+		:param project_path: the path of the project of which the files are enumerated.
+		:param sourcefiles: a list of the files of the project.
+		:param full_compiled_source: the full compiled source of the project, or None to parse the files one at a time.
+		:returns: a generator of tuples of the form (filepath, file).
+		"""
+		files = list(self.get_enumerated_files_with_paths(project_path, sourcefiles))
+		selectedpaths = set(file_path for file_path, _ in self.skip_stored_blobs(files))
+		files = [(file_path, afile, file_path in selectedpaths, afile['extension'] == 'java' and len(afile['name']) <= 125) for file_path, afile in files]
+		if full_compiled_source is None:
+			parsedfiles = self.javaparser.iterparse_files((file_path for file_path, _, isselected, isparsable in files if isselected and isparsable),
+				{file_path: afile['sha'] for file_path, afile, _, _ in files})
+		for file_path, afile, isselected, isparsable in files:
+			compiled_source = full_compiled_source
+			if full_compiled_source is None and isselected and isparsable:
+				_, ast = next(parsedfiles)
+				compiled_source = {file_path: ast}
+			if isselected:
+				self.set_file_code_and_contents(file_path, afile, compiled_source)
+			yield file_path, afile
+
+	def write_failures(self, failures):
+		"""
+		Writes a summary of the failed file actions of a bulk indexer.
+		
+		:param failures: a list with the failed actions as returned by the bulk indexer.
+		"""
+		if failures:
+			sys.stdout.write(' %d file actions failed!' % len(failures))
+
+	def get_refresh_job(self, project_id):
+		"""
+		Returns the information of a project that can be refreshed incrementally, i.e. a project that is already
+		indexed and cloned. The information of the project is retrieved from the index.
+		
+		:param project_id: the id of the project.
+		:returns: a dict containing the information of the project that is passed to the next stages, or None if
+		incremental refresh is disabled or not possible for the project.
+		"""
+		if self.incrementalrefresh and self.gitdownloader.has_project(project_id):
+			project = self.esclient.get_project(project_id)
+			if project != None and project.get('last_indexed_commit'):
+				sys.stdout.write('\nRefreshing project ' + project_id + ' from commit ' + project['last_indexed_commit'] + '\n')
+				project_path = self.sourcecodedir + '/' + project['user'] + '/' + project['name']
+				return {'project_id': project_id, 'project': project, 'sourcefiles': None, 'project_path': project_path, 'refresh': True}
+
+	def create_job(self, project_id, project, sourcefiles):
+		"""
+		Creates the information of a project that is passed to the next stages given its GitHub information.
+		
+		:param project_id: the id of the project.
+		:param project: the JSON object of the project, or None if the project is not found.
+		:param sourcefiles: a list of the files of the project, or None if the files are listed from the clone of the project.
+		:returns: a dict containing the information of the project, or None if the project is not found.
 		"""
-		project_id = '/'.join(project_address.split('/')[-2:])
-		sys.stdout.write('\nDownloading project info for project ' + project_id)
-		project, sourcefiles = self.gpdownloader.download_project(project_id)
 		if project != None:
 			sys.stdout.write('. Done!\n')
 			project_path = self.sourcecodedir + '/' + project['user'] + '/' + project['name']
+			return {'project_id': project_id, 'project': project, 'sourcefiles': sourcefiles, 'project_path': project_path}
+		else:
+			sys.stdout.write('. Project not found!\n')
+
+	def download_project_info(self, project_address):
+		"""
+		Downloads the information of a project from GitHub. If incremental refresh is enabled and the project is
+		already indexed and cloned, then the information of the project is retrieved from the index instead. This is
+		the first stage of adding a project.
 		
-			self.gitdownloader.git_pull_or_clone(project_id, project['git_url'], project_path, project['default_branch'])
+		:param project_address: the URL of the project to be added.
+		:returns: a dict containing the information of the project that is passed to the next stages, or None if
+		the project is not found.
+		"""
+		project_id = '/'.join(project_address.split('/')[-2:])
+		job = self.get_refresh_job(project_id)
+		if job == None:
+			sys.stdout.write('\nDownloading project info for project ' + project_id)
+			project, sourcefiles = self.gpdownloader.download_project(project_id, not self.localtree)
+			job = self.create_job(project_id, project, sourcefiles)
+		return job
+
+	def download_project_infos(self, project_addresses, failures):
+		"""
+		Downloads the information of many projects concurrently. This function replaces the first stage of adding
+		a list of projects when more than one concurrent GitHub requests are allowed. The download of each project
+		is reported as the first stage, where projects that are not found are skipped and projects of which the
+		download fails (e.g. due to a server error) are failed.
+		
+		:param project_addresses: a list of project addresses to be added.
+		:param failures: a list to which the failed downloads are appended as tuples of the form (stagename,
+		project_id, exception).
+		:returns: a generator of dicts containing the information of the projects that are found.
+		"""
+		project_ids = []
+		for project_address in project_addresses:
+			project_id = '/'.join(project_address.split('/')[-2:])
+			counters = {}
+			started = time.time()
+			with metrics.attribute(counters):
+				job = self.get_refresh_job(project_id)
+			if job != None:
+				self.report_stage('download', project_id, job, time.time() - started, None, counters = counters)
+				yield job
+			else:
+				project_ids.append(project_id)
+		for project_id, project, sourcefiles, elapsed, counters, error in self.gpdownloader.download_projects(project_ids, not self.localtree):
+			sys.stdout.write('\nDownloading project info for project ' + project_id)
+			if error is not None:
+				sys.stdout.write('. Failed: %s\n' % error)
+				failures.append(('download', project_id, error))
+				self.report_stage('download', project_id, None, elapsed, 'failed', str(error), counters)
+				continue
+			job = self.create_job(project_id, project, sourcefiles)
+			self.report_stage('download', project_id, job, elapsed, 'skipped' if job is None else None, counters = counters)
+			if job != None:
+				yield job
+
+	def download_project_code(self, job):
+		"""
+		Clones or pulls the code of a project. When refreshing a project incrementally, the files that changed since
+		the last indexed commit are found using git diff. If the changes cannot be found, then the information of the
+		project is downloaded from GitHub. If the files are listed from the clone, they are enumerated using git ls-tree
+		instead of the tree of the GitHub API. This is the second stage of adding a project.
 		
-			if self.esclient.has_project(project_id):
-				sys.stdout.write('Project already exists in database!\n')
-				fileidsandshas = self.esclient.get_project_fileids_and_shas(project_id)
-				sys.stdout.write('Updating database entries')
-				for file_path, afile in self.get_enumerated_files_with_paths(project_path, sourcefiles):
+		:param job: the dict containing the information of the project.
+		:returns: the given dict updated with whether the project already exists in the index, or None if the
+		project is up to date or no longer found.
+		:raises RuntimeError: if the project cannot be cloned or pulled, so that the project is failed and retried.
+		"""
+		project = job['project']
+		if not self.clonemanager.pull_or_clone(job['project_id'], project['git_url'], job['project_path'], project['default_branch']):
+			raise RuntimeError('Cloning or pulling project %s failed' % job['project_id'])
+		job['commit'] = self.gitdownloader.get_head_commit(job['project_path'])
+		if job.get('refresh'):
+			if job['commit'] == project['last_indexed_commit']:
+				sys.stdout.write('Project is up to date!\n')
+				self.clonemanager.mark_indexed(job['project_id'], job['project_path'], self.esclient.has_project)
+				return None
+			changedfiles = self.gitdownloader.get_changed_files(job['project_path'], project['last_indexed_commit'], job['commit']) if job['commit'] else None
+			if changedfiles is not None:
+				job['changedfiles'] = changedfiles
+				job['exists'] = True
+				return job
+			if not self.localtree:
+				sys.stdout.write('Changes not found, downloading project info')
+				job['project'], job['sourcefiles'] = self.gpdownloader.download_project(job['project_id'])
+				if job['project'] == None:
+					sys.stdout.write('. Project not found!\n')
+					return None
+				sys.stdout.write('. Done!\n')
+		if job['sourcefiles'] is None:
+			job['sourcefiles'] = self.gpdownloader.create_file_documents(project, self.gitdownloader.iterate_tree_entries(job['project_path'], job['commit'] or 'HEAD'))
+		job['exists'] = self.esclient.has_project(job['project_id'])
+		return job
+
+	def compile_project(self, job):
+		"""
+		Parses the java files of a project. If the project exists in the index, then only the files that are not
+		contained in the index or have changed are parsed. This is the third stage of adding a project.
+		
+		:param job: the dict containing the information of the project.
+		:returns: the given dict updated with the parsed files, or None if the project has no java files.
+		"""
+		if 'changedfiles' in job:
+			sys.stdout.write('Project already exists in database, %d changed files!\n' % len(job['changedfiles']))
+			job['sourcefiles'] = []
+			job['deletedfileids'] = []
+			for entry in job['changedfiles']:
+				# The entries of git diff have no size, so the size of the checked out file is used by the indexing policy
+				if entry['status'] != 'D' and entry['type'] == 'blob' and 'size' not in entry:
+					try:
+						entry['size'] = os.lstat(job['project_path'] + '/' + entry['path']).st_size
+					except OSError:
+						pass
+				# Files that are deleted or not indexed according to the indexing policy are removed from the index
+				if entry['status'] == 'D' or (self.indexingpolicy and not self.indexingpolicy.is_indexed(entry)):
+					job['deletedfileids'].append(job['project_id'] + '/' + entry['path'])
+				else:
+					job['sourcefiles'].append(self.gpdownloader.create_file_document(job['project'], entry))
+			sys.stdout.write('Compiling changed files')
+			self.set_files_code_and_contents(list(self.get_enumerated_files_with_paths(job['project_path'], job['sourcefiles'])))
+			sys.stdout.write(' Done!\n')
+		elif job['exists']:
+			sys.stdout.write('Project already exists in database!\n')
+			job['fileidsandshas'] = self.esclient.get_project_fileids_and_shas(job['project_id'])
+			sys.stdout.write('Compiling new files')
+			self.set_files_code_and_contents([(file_path, afile) for file_path, afile in self.get_enumerated_files_with_paths(job['project_path'], job['sourcefiles'])
+				if job['fileidsandshas'].get(afile['fullpathname']) != afile['sha']])
+			sys.stdout.write(' Done!\n')
+		elif self.streamparsing:
+			sys.stdout.write('Adding project to database!\n')
+			if not any(afile['extension'] == 'java' for afile in job['sourcefiles']):
+				sys.stdout.write('No java files found!\n')
+				return None
+			job['full_compiled_source'] = None
+		else:
+			sys.stdout.write('Adding project to database!\n')
+			sys.stdout.write('Compiling project')
+			# The shas of the tree entries are the keys of the cached ASTs, so that the files are not read to compute them
+			full_compiled_source = self.javaparser.parse_project(job['project_path'], {job['project_path'].replace('\\', '/') + '/' + afile['path']: afile['sha'] for afile in job['sourcefiles']})
+			if len(full_compiled_source.keys()) > 0:
+				sys.stdout.write('. Done!\n')
+				job['full_compiled_source'] = full_compiled_source
+			else:
+				sys.stdout.write('. No java files found!\n')
+				return None
+		return job
+
+	def index_project(self, job):
+		"""
+		Adds the project and its files to the index or updates them if the project already exists. The last
+		indexed commit of the project is also stored, provided that all files are indexed successfully. This is
+		the last stage of adding a project.
+		
+		:param job: the dict containing the information of the project.
+		"""
+		project = job['project']
+		if 'changedfiles' in job:
+			sys.stdout.write('Updating database entries')
+			with self.esclient.bulk_indexer(self.bulkmaxdocuments, self.bulkmaxbytes, self.deduplicateblobs) as indexer:
+				for oldfileid in job['deletedfileids']:
+					indexer.delete_file(oldfileid)
+				for _, afile in self.get_enumerated_files_with_paths(job['project_path'], job['sourcefiles']):
+					indexer.index_file(afile)
+		elif job['exists']:
+			fileidsandshas = job['fileidsandshas']
+			sys.stdout.write('Updating database entries')
+			with self.esclient.bulk_indexer(self.bulkmaxdocuments, self.bulkmaxbytes, self.deduplicateblobs) as indexer:
+				for _, afile in self.get_enumerated_files_with_paths(job['project_path'], job['sourcefiles']):
 					file_id = afile['fullpathname']
 					if file_id in fileidsandshas:
 						# File exists
 						if not afile['sha'] == fileidsandshas[file_id]:
-							self.esclient.update_file(afile)
+							indexer.index_file(afile)
 						del fileidsandshas[file_id]
 					else:
 						# File does not exist
-						self.set_file_code_and_contents(file_path, afile)
-						self.esclient.create_file(afile)
+						indexer.create_file(afile)
 				sys.stdout.write('.')
 				# Delete remaining files
 				for oldfileid in fileidsandshas:
-					self.esclient.delete_file(oldfileid)
-				sys.stdout.write(' Done!\n')
-			else:
-				sys.stdout.write('Adding project to database!\n')
-				sys.stdout.write('Compiling project')
-				full_compiled_source = self.javaparser.parse_project(project_path)
-				if len(full_compiled_source.keys()) > 0:
-					sys.stdout.write('. Done!\n')
-					self.esclient.create_project(project)
-					sys.stdout.write('Creating database entries')
-					for file_path, afile in self.get_enumerated_files_with_paths(project_path, sourcefiles):
-						self.set_file_code_and_contents(file_path, afile, full_compiled_source)
-						self.esclient.create_file(afile)
-					sys.stdout.write(' Done!\n')
-				else:
-					sys.stdout.write('. No java files found!\n')
+					indexer.delete_file(oldfileid)
 		else:
-			sys.stdout.write('. Project not found!\n')
+			self.esclient.create_project(project)
+			sys.stdout.write('Creating database entries')
+			with self.esclient.bulk_indexer(self.bulkmaxdocuments, self.bulkmaxbytes, self.deduplicateblobs) as indexer:
+				for _, afile in self.get_compiled_files_with_paths(job['project_path'], job['sourcefiles'], job['full_compiled_source']):
+					indexer.create_file(afile)
+					# The document is already serialized, so its code and contents are no longer needed
+					for key in ('code', 'content'):
+						afile.pop(key, None)
+		self.write_failures(indexer.failures)
+		job['documents'] = indexer.totaldocuments
+		job['bytes'] = indexer.totalbytes
+		job['failedfiles'] = len(indexer.failures)
+		if job['commit'] and not indexer.failures:
+			project['last_indexed_commit'] = job['commit']
+			self.esclient.update_project(project)
+		sys.stdout.write(' Done!\n')
+		self.clonemanager.mark_indexed(job['project_id'], job['project_path'], self.esclient.has_project)
+
+	def run_stage(self, name, function, item):
+		"""
+		Runs a stage of adding a project and measures its duration and the counters that it increments (e.g. the
+		bytes downloaded from GitHub, the cache hits and the time spent waiting for the rate limit). When the project
+		is indexed, skipped or fails, a record containing the durations and the counters of its stages is written to
+		the metrics report. If the project is skipped or fails after it is cloned, then its clone is released without
+		being marked as indexed.
+		
+		:param name: the name of the stage.
+		:param function: the function of the stage.
+		:param item: the address of the project for the first stage, or the dict containing the information of
+		the project for the other stages.
+		:returns: the result of the function of the stage.
+		"""
+		if self.journal:
+			self.journal.set_stage(item['project_id'] if type(item) == dict else '/'.join(item.split('/')[-2:]), name)
+		counters = {}
+		started = time.time()
+		try:
+			with metrics.attribute(counters):
+				result = function(item)
+		except Exception as e:
+			self.report_stage(name, item, None, time.time() - started, 'failed', str(e), counters)
+			if type(item) == dict:
+				self.clonemanager.release(item['project_id'], self.esclient.has_project)
+			raise
+		self.report_stage(name, item, result, time.time() - started, 'indexed' if name == 'index' else ('skipped' if result is None else None), counters = counters)
+		if result is None and name != 'index' and type(item) == dict:
+			self.clonemanager.release(item['project_id'], self.esclient.has_project)
+		return result
+
+	def report_stage(self, name, item, result, elapsed, status, error = None, counters = None):
+		"""
+		Records the duration and the counters of a stage of adding a project and, if the project is no longer
+		processed, writes a record of the project to the metrics report and its status to the run journal.
+		
+		:param name: the name of the stage.
+		:param item: the item given to the stage.
+		:param result: the result of the stage.
+		:param elapsed: the duration of the stage in seconds.
+		:param status: the status of the project ('indexed', 'skipped' or 'failed'), or None if the project is
+		passed to the next stage.
+		:param error: the error that caused the project to fail, if any.
+		:param counters: a dict with the counters that were incremented by the stage for the project, if any.
+		"""
+		metrics.observe('stage_seconds', elapsed, stage = name)
+		job = result if result is not None else item
+		if type(job) == dict:
+			job.setdefault('timings', {})[name] = elapsed
+			jobcounters = job.setdefault('counters', {})
+			for key, value in (counters or {}).items():
+				jobcounters[key] = jobcounters.get(key, 0) + value
+		if status:
+			metrics.increment('projects_total', status = status)
+			if self.journal:
+				self.journal.set_status(job['project_id'] if type(job) == dict else '/'.join(job.split('/')[-2:]), name, status, error)
+			if self.report:
+				if type(job) == dict:
+					self.report.write({'type': 'project', 'project': job['project_id'], 'status': status, 'stage': name, 'timings': job['timings'],
+						'documents': job.get('documents', 0), 'bytes': job.get('bytes', 0), 'failedfiles': job.get('failedfiles', 0), 'counters': job['counters']})
+				else:
+					self.report.write({'type': 'project', 'project': '/'.join(job.split('/')[-2:]), 'status': status, 'stage': name, 'timings': {name: elapsed}, 'counters': counters or {}})
+
+	def add_project(self, project_address):
+		"""
+		Adds a project to the index or updates it if it already exists.
+		
+		:param project_address: the URL of the project to be added.
+		"""
+		job = self.run_stage('download', self.download_project_info, project_address)
+		for name, stage in (('clone', self.download_project_code), ('parse', self.compile_project), ('index', self.index_project)):
+			if job == None:
+				break
+			job = self.run_stage(name, stage, job)
 	
 	def delete_project(self, project_address):
 		"""
@@ -149,20 +586,100 @@ class DBManager:
 		if self.esclient.has_project(project_id):
 			self.esclient.delete_project(project_id)
 	
-	def add_projects(self, project_addresses):
+	def add_projects(self, project_addresses, runname = None, restart = False):
 		"""
-		Adds or updates a list of projects in the index.
+		Adds or updates a list of projects in the index. If a directory for run journals is set, the stage and the
+		status of each project are recorded in the journal of the run, so that an interrupted run is resumed by
+		skipping the finished projects. The failed projects are retried with exponential backoff. If bulk load mode
+		is enabled, the index is tuned for indexing during the run and its serving settings are restored afterwards.
 		
 		:param project_addresses: a list of project addresses to be added.
+		:param runname: the name of the run, used as the name of its journal.
+		:param restart: boolean indicating whether the run should start from the beginning (True) or be resumed (False).
+		:returns: a list with the ids of the projects that failed to be added.
 		"""
-		for project_address in project_addresses:
-			self.add_project(project_address)
+		with ExitStack() as stack:
+			if self.bulkloadmode:
+				stack.enter_context(self.esclient.bulk_load_mode())
+			if not (self.rundir and runname):
+				return self.run_projects(project_addresses)
+			else:
+				return self.run_journaled_projects(project_addresses, runname, restart)
+
+	def run_journaled_projects(self, project_addresses, runname, restart = False):
+		"""
+		Adds or updates a list of projects in the index, recording the stage and the status of each project in the
+		journal of the run. The failed projects are retried with exponential backoff.
+		
+		:param project_addresses: a list of project addresses to be added.
+		:param runname: the name of the run, used as the name of its journal.
+		:param restart: boolean indicating whether the run should start from the beginning (True) or be resumed (False).
+		:returns: a list with the ids of the projects of the journal that are not finished, i.e. that failed in all
+		their attempts.
+		"""
+		self.journal = RunJournal(os.path.join(self.rundir, runname + '.sqlite'))
+		try:
+			if restart:
+				self.journal.clear()
+			self.journal.add_projects(project_addresses)
+			# Projects that used all their attempts in a previous run are attempted again in this run
+			self.journal.reset_attempts()
+			for attempt in range(self.maxattempts):
+				pending = self.journal.get_unfinished_projects(self.maxattempts)
+				if not pending:
+					break
+				if attempt > 0:
+					waitsecs = self.retrybackoff * 2 ** (attempt - 1)
+					sys.stdout.write('\nRetrying %d projects in %d seconds..\n' % (len(pending), waitsecs))
+					time.sleep(waitsecs)
+				self.journal.start_attempt(pending)
+				self.run_projects(pending)
+			sys.stdout.write('\nRun journal: %s\n' % ', '.join('%d %s' % (count, status) for status, count in sorted(self.journal.get_statistics().items())))
+			return ['/'.join(address.split('/')[-2:]) for address in self.journal.get_unfinished_projects()]
+		finally:
+			self.journal.close()
+			self.journal = None
+
+	def run_projects(self, project_addresses):
+		"""
+		Adds or updates a list of projects in the index by passing them through the pipeline of stages.
+		
+		:param project_addresses: a list of project addresses to be added.
+		:returns: a list with the ids of the projects that failed to be added.
+		"""
+		pipeline = Pipeline(self.pipelinequeuesize)
+		downloadfailures = []
+		if self.githubconcurrency > 1:
+			jobs = self.download_project_infos(project_addresses, downloadfailures)
+		else:
+			jobs = project_addresses
+			pipeline.add_stage('download', functools.partial(self.run_stage, 'download', self.download_project_info), self.downloadworkers)
+		pipeline.add_stage('clone', functools.partial(self.run_stage, 'clone', self.download_project_code), self.cloneworkers)
+		pipeline.add_stage('parse', functools.partial(self.run_stage, 'parse', self.compile_project), self.parseworkers)
+		pipeline.add_stage('index', functools.partial(self.run_stage, 'index', self.index_project), self.indexworkers)
+		started = time.time()
+		failures = pipeline.run(jobs)
+		failures = downloadfailures + failures
+		if failures:
+			sys.stdout.write('\n%d projects failed to be added!\n' % len(failures))
+		if self.javaparser.ast_cache:
+			sys.stdout.write('\nAST cache: %(hits)d hits, %(misses)d misses, %(evictions)d evictions\n' % self.javaparser.ast_cache.get_statistics())
+		if self.indexingpolicy and any(self.indexingpolicy.get_statistics().values()):
+			sys.stdout.write('\nSkipped files: %s\n' % ', '.join('%d by %s' % (count, rule) for rule, count in self.indexingpolicy.get_statistics().items() if count))
+		if self.report:
+			self.report.write({'type': 'run', 'projects': len(project_addresses), 'failures': len(failures), 'duration': time.time() - started,
+				'astcache': self.javaparser.ast_cache.get_statistics() if self.javaparser.ast_cache else None,
+				'skippedfiles': self.indexingpolicy.get_statistics() if self.indexingpolicy else None, 'metrics': metrics.get_statistics()})
+		return [item['project_id'] if type(item) == dict else '/'.join(item.split('/')[-2:]) for _, item, _ in failures]
 	
 	def delete_projects(self, project_addresses):
 		"""
-		Deleted a list of projects in the index (if they exist) and their corresponding files.
+		Deletes a list of projects from the index (if they exist) and their corresponding files. The files of many
+		projects are deleted at once by the server.
 		
 		:param project_addresses: a list of project addresses to be deleted.
 		"""
-		for project_address in project_addresses:
-			self.delete_project(project_address, self.esclient)
+		project_ids = ['/'.join(project_address.split('/')[-2:]) for project_address in project_addresses]
+		sys.stdout.write('Deleting %d projects\n' % len(project_ids))
+		deleted = self.esclient.delete_projects(project_ids, self.deletebatchsize, self.deleterequestspersecond, self.deletepollinterval)
+		sys.stdout.write('\nDeleted %d files of %d projects!\n' % (deleted, len(project_ids)))
@@ -0,0 +1,73 @@
+import os
+import hashlib
+from libs.diskcache import DiskCache
+
+def compute_parser_version(path_to_ASTParser_jar):
+	"""
+	Computes a version for the ASTParser library using the contents of its jar, so that the ASTs produced by
+	different versions of the library are never mixed.
+
+	:param path_to_ASTParser_jar: the path to the ASTParser jar.
+	:returns: a string denoting the version of the ASTParser library.
+	"""
+	sha = hashlib.sha1()
+	try:
+		with open(path_to_ASTParser_jar, 'rb') as infile:
+			for chunk in iter(lambda: infile.read(1048576), b''):
+				sha.update(chunk)
+	except OSError:
+		return "unknown"
+	return sha.hexdigest()[:12]
+
+class ASTCache(DiskCache):
+	"""
+	Class that implements an on-disk cache of ASTs. Each AST is stored in a file named after the git blob sha of the
+	source file and the version of the parser. When the total size of the cache exceeds a limit, the least recently
+	used ASTs are removed.
+	"""
+	def __init__(self, cachedir, parser_version, max_bytes = 1073741824):
+		"""
+		Initializes this AST cache.
+
+		:param cachedir: the path to the directory where the ASTs are stored.
+		:param parser_version: the version of the parser that produces the ASTs.
+		:param max_bytes: the maximum total size of the cached ASTs in bytes.
+		"""
+		self.parser_version = parser_version
+		super(ASTCache, self).__init__(cachedir, max_bytes)
+
+	def get_path(self, sha):
+		"""
+		Returns the path of the file where the AST of a blob is stored.
+
+		:param sha: the git blob sha of the source file.
+		:returns: the path of the file of the AST.
+		"""
+		return os.path.join(self.cachedir, self.parser_version, sha[:2], sha[2:] + '.json')
+
+	def get(self, sha):
+		"""
+		Returns the AST of a blob if it exists in the cache.
+
+		:param sha: the git blob sha of the source file.
+		:returns: the AST of the source file in JSON format, or None if it is not cached.
+		"""
+		path = self.get_path(sha)
+		with self.lock:
+			iscached = path in self.entries
+		data = self.read_entry(path) if iscached else None
+		with self.lock:
+			if data is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+		return data
+
+	def put(self, sha, data):
+		"""
+		Stores the AST of a blob in the cache and removes the least recently used ASTs if the cache is full.
+
+		:param sha: the git blob sha of the source file.
+		:param data: the AST of the source file in JSON format.
+		"""
+		self.write_entry(self.get_path(sha), data)
@@ -1,27 +1,120 @@
 import os
+import sys
+import zlib
+import time
+import queue
 import base64
+import struct
+import threading
 import subprocess
+from collections import deque
+from concurrent.futures import Future
 from subprocess import STDOUT, PIPE
+from libs.metrics import metrics
+
+class _PendingResponse(Future):
+	"""
+	Future that holds a response of the base64 protocol. The responses are read in the order of their requests,
+	so waiting for a response reads all the responses that precede it.
+	"""
+	def __init__(self, parser):
+		"""
+		Initializes this pending response.
+
+		:param parser: the parser that received the request of this response.
+		"""
+		super(_PendingResponse, self).__init__()
+		self.parser = parser
+
+	def result(self, timeout = None):
+		self.parser.read_pending(self)
+		return super(_PendingResponse, self).result(timeout)
 
 class _ASTParser(object):
 	"""
 	Inner python binding to the ASTParser library. It works by executing the jar file as a subprocess
 	and opening pipes to the standard input and standard output so that messages can be sent and received.
 	Instead of using this class, it is highly recommended to use the abstracted ASTParser class.
+	
+	By default, each message is base64-encoded and sent as a line, and the jar answers the lines in order, so
+	many requests can be written before their responses are read. If the framed protocol is requested and the
+	jar supports it, the messages are instead sent as binary frames of the form (magic, request id, length,
+	flags, payload) with UTF-8 payloads that may be compressed with zlib. The responses are matched to the
+	requests using their ids, so that many requests can be in flight at the same time.
 	"""
-	def __init__(self, path_to_ASTParser_jar):
+	frame_magic = b'AGPF'
+	frame_header = struct.Struct('>4sIIB')
+	frame_compressed = 1
+	compression_threshold = 4096
+
+	def __init__(self, path_to_ASTParser_jar, max_messages = 10000, protocol = 'base64', compress = False, java_command = 'java'):
 		"""
 		Initializes this inner parser.
 		
 		:param path_to_ASTParser_jar: the path to the ASTParser jar.
+		:param max_messages: the number of messages after which the parser is restarted, or None if the parser
+		should never be restarted.
+		:param protocol: the protocol of the messages, either 'base64' or 'framed'. If the jar does not support
+		the framed protocol, the base64 protocol is used.
+		:param compress: boolean indicating whether large framed messages should be compressed (True) or not (False).
+		:param java_command: the command used to run the jar.
 		"""
-		self.cmd = ['java', '-cp', path_to_ASTParser_jar, 'astparser.PythonBinder']
-		self.proc = subprocess.Popen(self.cmd, stdin = PIPE, stdout = PIPE, stderr = STDOUT)
+		self.cmd = [java_command, '-cp', path_to_ASTParser_jar, 'astparser.PythonBinder']
 		self.nummessages = 0
-		line = self.send_message("START_OF_TRANSMISSION")
-		if line != "START_OF_TRANSMISSION":
-			print("Error in Java compiler!!")
-			exit()
+		self.max_messages = max_messages
+		self.negotiate = protocol == 'framed'
+		self.compress = compress
+		self.writelock = threading.Lock()
+		self.lock = threading.Lock()
+		if not self.start_parser():
+			raise RuntimeError("Error in Java compiler!! The ASTParser could not be started")
+
+	def start_parser(self):
+		"""
+		Starts the process of the parser and negotiates the protocol of the messages. If the jar does not
+		acknowledge the framed protocol, the base64 protocol is used from then on. When the framed protocol is
+		requested, the standard error of the parser is read separately, so that it does not corrupt the frames.
+		
+		:returns: True if the parser is correctly started, or False otherwise.
+		"""
+		if self.negotiate:
+			self.proc = subprocess.Popen(self.cmd, stdin = PIPE, stdout = PIPE, stderr = PIPE)
+			drainer = threading.Thread(target = self.drain_stderr, args = (self.proc, ))
+			drainer.daemon = True
+			drainer.start()
+		else:
+			self.proc = subprocess.Popen(self.cmd, stdin = PIPE, stdout = PIPE, stderr = STDOUT)
+		self.framed = False
+		self.unread = deque()
+		if self.send_message("START_OF_TRANSMISSION") != "START_OF_TRANSMISSION":
+			return False
+		if self.negotiate:
+			self.negotiate = False
+			capabilities = "FRAMED_V1" + (",ZLIB" if self.compress else "")
+			response = self.send_message("SET_PROTOCOL_-_" + capabilities)
+			if response in ("FRAMED_V1", "FRAMED_V1,ZLIB"):
+				self.negotiate = True
+				self.framed = True
+				self.compressframes = response == "FRAMED_V1,ZLIB"
+				self.pending = {}
+				self.nextrequestid = 0
+				reader = threading.Thread(target = self.read_frames, args = (self.proc, self.pending))
+				reader.daemon = True
+				reader.start()
+			elif not self.is_alive():
+				return self.start_parser()
+		return True
+
+	def drain_stderr(self, proc):
+		"""
+		Forwards the standard error of the process of the parser (e.g. warnings or stack traces of the JVM) to the
+		standard error of this process until the process of the parser exits.
+		
+		:param proc: the process of the parser.
+		"""
+		for line in iter(proc.stderr.readline, b''):
+			sys.stderr.write(line.decode('utf-8', 'replace'))
+		proc.stderr.close()
 
 	def close_parser(self):
 		"""
@@ -33,16 +126,35 @@ class _ASTParser(object):
 
 	def restart_parser(self, force = False):
 		"""
-		Restarts the parser.
+		Restarts the parser. If the parser does not close when asked, it is killed.
+
+		:param force: boolean indicating whether the parser should be killed without asking it to close (True) or not (False).
+		"""
+		if force or self.send_message("END_OF_TRANSMISSION") != "END_OF_TRANSMISSION":
+			self.kill_parser()
+		self.nummessages = 0
+		if not self.start_parser():
+			raise RuntimeError("Error in Java compiler!! The ASTParser could not be restarted")
+
+	def is_alive(self):
+		"""
+		Checks whether the process of the parser is running.
 		
-		:param force: boolean indicating whether the parser should be restarted even if it crashed (True) or not (False).
+		:returns: True if the process of the parser is running, or False otherwise.
 		"""
-		if force or self.send_message("END_OF_TRANSMISSION") == "END_OF_TRANSMISSION":
-			self.proc = subprocess.Popen(self.cmd, stdin = PIPE, stdout = PIPE, stderr = STDOUT)
-			self.nummessages = 0
-		else:
-			print("Error in Java compiler!!")
-			exit()
+		return self.proc.poll() is None
+
+	def kill_parser(self):
+		"""
+		Kills the process of the parser without waiting for it to close.
+		"""
+		try:
+			self.proc.kill()
+			self.proc.wait()
+		except OSError:
+			pass
+		while self.unread:
+			self.unread.popleft().set_result("")
 
 	def get_ast(self, code_entity, code_entity_properties):
 		"""
@@ -52,42 +164,183 @@ class _ASTParser(object):
 		:param code_entity_properties: the properties of the code entity including its type and expected representation.
 		:returns: the AST of the given code entity.
 		"""
+		return self.submit_ast(code_entity, code_entity_properties).result()
+
+	def submit_ast(self, code_entity, code_entity_properties):
+		"""
+		Requests the AST of a code_entity without waiting for the response. Many requests can be submitted before
+		their responses are received.
+		
+		:param code_entity: the path or the contents of the code entity.
+		:param code_entity_properties: the properties of the code entity including its type and expected representation.
+		:returns: a future that holds the AST of the given code entity.
+		"""
 		self.nummessages += 1
-		if self.nummessages == 10000:
+		if not self.is_alive():
+			self.restart_parser(True)
+		elif self.max_messages and self.nummessages >= self.max_messages:
 			self.restart_parser()
-		return self.send_message(code_entity_properties + code_entity)
+		return self.submit_message(code_entity_properties + code_entity)
 
-	def send_message(self, message):
+	def submit_message(self, message):
 		"""
-		Sends a new message to the ASTParser jar.
+		Sends a new message to the ASTParser jar without waiting for the response. Using the base64 protocol, the
+		response is read when it or any later response is requested, so the requests that are in flight must be
+		small enough to fit in the pipe of the parser.
 		
 		:param message: the message to be sent.
-		:returns: the response to the sent message.
+		:returns: a future that holds the response to the sent message, which is an empty string if the parser fails.
+		The process that received the message is given by future.proc, so that an empty response of a process that
+		has exited can be told from a rejected message even after the parser is restarted.
+		"""
+		if not self.framed:
+			future = _PendingResponse(self)
+			future.proc = self.proc
+			if self.write_line(message):
+				self.unread.append(future)
+			else:
+				self.kill_parser()
+				future.set_result("")
+			return future
+		future = Future()
+		future.proc = self.proc
+		payload = message.encode(encoding = 'utf-8')
+		flags = 0
+		if self.compressframes and len(payload) >= self.compression_threshold:
+			payload = zlib.compress(payload)
+			flags |= self.frame_compressed
+		with self.lock:
+			self.nextrequestid = (self.nextrequestid + 1) % 4294967296
+			requestid = self.nextrequestid
+			if not self.is_alive():
+				future.set_result("")
+				return future
+			self.pending[requestid] = future
+		try:
+			with self.writelock:
+				self.proc.stdin.write(self.frame_header.pack(self.frame_magic, requestid, len(payload), flags) + payload)
+				self.proc.stdin.flush()
+		except (OSError, ValueError):
+			self.kill_parser()
+			with self.lock:
+				self.pending.pop(requestid, None)
+			if not future.done():
+				future.set_result("")
+		return future
+
+	def read_frames(self, proc, pending):
+		"""
+		Reads the framed responses of a process of the parser and passes each of them to the future of its
+		request. When the process exits or sends an invalid frame, it is killed and all its pending requests
+		receive an empty response.
+		
+		:param proc: the process of the parser.
+		:param pending: a dict mapping the ids of the pending requests of the process to their futures.
+		"""
+		try:
+			while True:
+				header = proc.stdout.read(self.frame_header.size)
+				if len(header) < self.frame_header.size:
+					break
+				magic, requestid, length, flags = self.frame_header.unpack(header)
+				if magic != self.frame_magic:
+					break
+				payload = proc.stdout.read(length)
+				if len(payload) < length:
+					break
+				if flags & self.frame_compressed:
+					payload = zlib.decompress(payload)
+				with self.lock:
+					future = pending.pop(requestid, None)
+				if future:
+					future.set_result(payload.decode('utf-8', errors = 'replace'))
+		except (OSError, ValueError, zlib.error):
+			pass
+		if proc.poll() is None:
+			try:
+				proc.kill()
+				proc.wait()
+			except OSError:
+				pass
+		with self.lock:
+			futures = list(pending.values())
+			pending.clear()
+		for future in futures:
+			future.set_result("")
+
+	def write_line(self, message):
+		"""
+		Sends a message to the ASTParser jar as a base64-encoded line.
+
+		:param message: the message to be sent.
+		:returns: True if the message is sent, or False if the pipe of the parser is closed.
 		"""
 		decodedbytes = message.encode(encoding = 'ascii')
 		b64encodedbytes = base64.b64encode(decodedbytes)
-		self.proc.stdin.write(b64encodedbytes + b"\r\n")
-		self.proc.stdin.flush()
-		line = self.proc.stdout.readline()
 		try:
+			self.proc.stdin.write(b64encodedbytes + b"\r\n")
+			self.proc.stdin.flush()
+		except (OSError, ValueError):
+			return False
+		return True
+
+	def read_line(self):
+		"""
+		Reads a base64-encoded response of the ASTParser jar. If the process of the parser has exited or the response
+		cannot be decoded, the process is killed, so that is_alive tells a crashed parser from a rejected message, and
+		an empty response is returned. The parser is restarted before its next message.
+
+		:returns: the response that was read.
+		"""
+		try:
+			line = self.proc.stdout.readline()
+		except (OSError, ValueError):
+			line = b""
+		try:
+			if not line:
+				raise EOFError()
 			b64decodedbytes = base64.b64decode(line)
 			decodedline = b64decodedbytes.decode()
 		except:
-			self.restart_parser(True)
+			self.kill_parser()
 			decodedline = ""
 		return decodedline
 
+	def read_pending(self, future = None):
+		"""
+		Reads the responses of the base64 protocol that are pending, in the order of their requests.
+
+		:param future: the future of the response up to which the responses are read, or None to read all of them.
+		"""
+		while self.unread and not (future and future.done()):
+			pending = self.unread.popleft()
+			pending.set_result(self.read_line())
+
+	def send_message(self, message):
+		"""
+		Sends a new message to the ASTParser jar and waits for its response.
+		
+		:param message: the message to be sent.
+		:returns: the response to the sent message.
+		"""
+		return self.submit_message(message).result()
+
 class ASTParser(_ASTParser):
 	"""
 	Class used as a python binding to the ASTParser library. It contains functions for parsing java code to AST.
 	"""
-	def __init__(self, path_to_ASTParser_jar):
+	def __init__(self, path_to_ASTParser_jar, max_messages = 10000, protocol = 'base64', compress = False, java_command = 'java'):
 		"""
 		Initializes this AST Parser.
 		
 		:param path_to_ASTParser_jar: the path to the ASTParser jar.
+		:param max_messages: the number of messages after which the parser is restarted, or None if the parser
+		should never be restarted.
+		:param protocol: the protocol of the messages, either 'base64' or 'framed'.
+		:param compress: boolean indicating whether large framed messages should be compressed (True) or not (False).
+		:param java_command: the command used to run the jar.
 		"""
-		super(ASTParser, self).__init__(path_to_ASTParser_jar)
+		super(ASTParser, self).__init__(path_to_ASTParser_jar, max_messages, protocol, compress, java_command)
 
 	def parse_string(self, file_contents):
 		"""
@@ -108,6 +361,16 @@ class ASTParser(_ASTParser):
 		filename = os.path.abspath(filename)
 		return super(ASTParser, self).get_ast(filename, "PARSE_FILE_-_")
 
+	def submit_file(self, filename):
+		"""
+		Requests the AST of a java file without waiting for the response.
+
+		:param filename: the filename of the java file to be parsed.
+		:returns: a future that holds a string containing the AST of the java file in JSON format.
+		"""
+		filename = os.path.abspath(filename)
+		return super(ASTParser, self).submit_ast(filename, "PARSE_FILE_-_")
+
 	def parse_folder(self, folder_name):
 		"""
 		Parses all the files of a folder and returns a unified AST.
@@ -124,3 +387,185 @@ class ASTParser(_ASTParser):
 		Otherwise, this may result to a memory leak.
 		"""
 		super(ASTParser, self).close_parser()
+
+class ASTParserPool(object):
+	"""
+	Class used as a pool of AST parsers. It keeps a number of ASTParser workers running and distributes the
+	requests to them, so that many files can be parsed in parallel by different threads. Any worker that crashes
+	is replaced by a new one and the request is retried, while workers that have served many messages are
+	recycled. The class has the same parsing API as the ASTParser class.
+	"""
+	def __init__(self, path_to_ASTParser_jar, num_workers = 1, max_messages = 10000, protocol = 'base64', compress = False, java_command = 'java'):
+		"""
+		Initializes this pool of AST parsers.
+		
+		:param path_to_ASTParser_jar: the path to the ASTParser jar.
+		:param num_workers: the number of parsers of the pool.
+		:param max_messages: the number of messages after which a parser is recycled, or None if the parsers
+		should never be recycled.
+		:param protocol: the protocol of the messages, either 'base64' or 'framed'.
+		:param compress: boolean indicating whether large framed messages should be compressed (True) or not (False).
+		:param java_command: the command used to run the jar.
+		"""
+		self.path_to_ASTParser_jar = path_to_ASTParser_jar
+		self.java_command = java_command
+		self.num_workers = max(1, int(num_workers))
+		self.max_messages = max_messages
+		self.protocol = protocol
+		self.compress = compress
+		self.workers = queue.Queue()
+		for _ in range(self.num_workers):
+			self.workers.put(self.create_worker())
+
+	def create_worker(self):
+		"""
+		Creates a new worker for this pool.
+		
+		:returns: a new ASTParser that is never restarted by itself.
+		"""
+		return ASTParser(self.path_to_ASTParser_jar, None, self.protocol, self.compress, self.java_command)
+
+	def run_worker(self, function_name, argument):
+		"""
+		Executes a parsing function of the first available worker. If the process of the worker exits, it is
+		replaced and the request is sent once more to the new worker. An empty response of a worker that is still
+		running means that the request was rejected, so it is returned without being retried.
+
+		:param function_name: the name of the parsing function of the ASTParser class.
+		:param argument: the argument of the parsing function.
+		:returns: the response of the worker.
+		"""
+		worker = self.workers.get()
+		try:
+			for _ in range(2):
+				with metrics.timer('parse_request_seconds', operation = function_name):
+					try:
+						response = getattr(worker, function_name)(argument)
+					except (OSError, ValueError):
+						response = ""
+				if worker.is_alive():
+					break
+				metrics.increment('parser_restarts_total')
+				worker.kill_parser()
+				worker = self.create_worker()
+			if response:
+				metrics.increment('parse_response_bytes_total', len(response), operation = function_name)
+			if self.max_messages and worker.nummessages >= self.max_messages:
+				worker.close()
+				worker = self.create_worker()
+		finally:
+			self.workers.put(worker)
+		return response
+
+	def parse_string(self, file_contents):
+		"""
+		Parses the contents of a java file and returns its AST.
+
+		:param file_contents:  the contents of a java file, given as a string.
+		:returns: a string containing the AST of the java file in JSON format.
+		"""
+		return self.run_worker('parse_string', file_contents)
+
+	def parse_file(self, filename):
+		"""
+		Parses a java file and returns its AST.
+
+		:param filename: the filename of the java file to be parsed.
+		:returns: a string containing the AST of the java file in JSON format.
+		"""
+		return self.run_worker('parse_file', filename)
+
+	def parse_files(self, filenames, window = 32):
+		"""
+		Parses many java files and yields their ASTs as soon as they are available. The files are divided among
+		the workers, and each worker receives up to window requests before its first response is read. Any files
+		that fail, e.g. because a worker crashed, are retried one at a time.
+
+		:param filenames: a list of the filenames of the java files to be parsed.
+		:param window: the maximum number of requests that are in flight on each worker.
+		:returns: a generator of tuples of the form (filename, response) in the order in which the files are parsed,
+		where response is a string containing the AST of the java file in JSON format.
+		"""
+		results = queue.Queue()
+		batches = [filenames[i::self.num_workers] for i in range(self.num_workers) if filenames[i::self.num_workers]]
+		for batch in batches:
+			thread = threading.Thread(target = self.run_worker_batch, args = (batch, window, results))
+			thread.daemon = True
+			thread.start()
+		for _ in range(len(filenames)):
+			yield results.get()
+
+	def run_worker_batch(self, filenames, window, results):
+		"""
+		Sends a batch of java files to the first available worker, keeping up to window requests in flight.
+
+		:param filenames: the filenames of the java files to be parsed.
+		:param window: the maximum number of requests that are in flight.
+		:param results: a queue where the responses are put as tuples of the form (filename, response). A response
+		is put for every file, even if the worker cannot be replaced, so that parse_files never waits forever.
+		"""
+		collectedfilenames = set()
+		failedfilenames = []
+		postedfilenames = set()
+		def post(filename, response):
+			postedfilenames.add(filename)
+			results.put((filename, response))
+		def collect(filename, future):
+			response = future.result()
+			collectedfilenames.add(filename)
+			if response:
+				metrics.increment('parse_response_bytes_total', len(response), operation = 'parse_files')
+				post(filename, response)
+			elif future.proc.poll() is None:
+				post(filename, "")
+			else:
+				failedfilenames.append(filename)
+		try:
+			worker = self.workers.get()
+			started = time.time()
+			try:
+				pending = deque()
+				for filename in filenames:
+					pending.append((filename, worker.submit_file(filename)))
+					if len(pending) >= window:
+						collect(*pending.popleft())
+				while pending:
+					collect(*pending.popleft())
+				metrics.observe('parse_batch_seconds', time.time() - started)
+				metrics.increment('parse_batch_files_total', len(filenames))
+				if not worker.is_alive():
+					metrics.increment('parser_restarts_total')
+					worker.kill_parser()
+					worker = self.create_worker()
+				elif self.max_messages and worker.nummessages >= self.max_messages:
+					worker.close()
+					worker = self.create_worker()
+			except Exception:
+				failedfilenames.extend(filename for filename in filenames if filename not in collectedfilenames)
+				worker.kill_parser()
+				worker = self.create_worker()
+			finally:
+				self.workers.put(worker)
+			for filename in failedfilenames:
+				post(filename, self.parse_file(filename))
+		finally:
+			for filename in filenames:
+				if filename not in postedfilenames:
+					results.put((filename, ""))
+
+	def parse_folder(self, folder_name):
+		"""
+		Parses all the files of a folder and returns a unified AST.
+
+		:param folder_name: the path of the folder of which the files are parsed.
+		:returns: an AST containing all the files of a folder in JSON format.
+		"""
+		return self.run_worker('parse_folder', folder_name)
+
+	def close(self):
+		"""
+		Closes all the AST parsers of the pool. Note that this function must be called after using the class.
+		Otherwise, this may result to a memory leak.
+		"""
+		for _ in range(self.num_workers):
+			self.workers.get().close()
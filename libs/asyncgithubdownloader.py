@@ -0,0 +1,222 @@
+import sys
+import time
+import json
+import queue
+import asyncio
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from libs.metrics import metrics
+from libs.githubprojectdownloader import GithubProjectDownloader
+
+class RateLimitBucket:
+	"""
+	Class that implements a token bucket for one of the resources of the GitHub API (core or search). The tokens
+	are the remaining requests of the resource as given by the x-ratelimit-* headers of the responses, minus a
+	reserve and the requests that are in flight. When the bucket is empty, any new request waits until the
+	reset time of the resource.
+	"""
+	def __init__(self, name, reserve, margin):
+		"""
+		Initializes this rate limit bucket.
+
+		:param name: the name of the resource of the GitHub API.
+		:param reserve: the number of requests that are never used.
+		:param margin: the number of seconds to wait after the reset time of the resource.
+		"""
+		self.name = name
+		self.reserve = reserve
+		self.margin = margin
+		self.remaining = None
+		self.resettime = 0
+		self.inflight = 0
+		self.waits = 0
+		self.waitseconds = 0
+
+	async def acquire(self):
+		"""
+		Waits until a request can be sent and reserves a token for it.
+		"""
+		while self.remaining is not None and self.remaining - self.inflight <= self.reserve:
+			waitsecs = self.resettime + self.margin - time.time()
+			if waitsecs <= 0:
+				self.remaining = None
+				break
+			if self.inflight == 0:
+				sys.stdout.write('\nOops! You have exceeded the requests limit!\nYou have to wait %d seconds..\n' % waitsecs)
+			self.waits += 1
+			started = time.time()
+			await asyncio.sleep(min(waitsecs, 10))
+			self.waitseconds += time.time() - started
+			metrics.increment('github_ratelimit_waits_total', resource = self.name)
+			metrics.increment('github_ratelimit_wait_seconds_total', time.time() - started, resource = self.name)
+		self.inflight += 1
+
+	def release(self, remaining, resettime):
+		"""
+		Releases the token of a request and updates the bucket given the x-ratelimit-* headers of its response.
+
+		:param remaining: the number of remaining requests, or None if the request failed.
+		:param resettime: the time of the next renewal of allowed requests, or None if the request failed.
+		"""
+		self.inflight -= 1
+		if remaining is not None and resettime is not None:
+			remaining, resettime = int(remaining), int(resettime)
+			if self.remaining is None or resettime > self.resettime:
+				self.remaining = remaining
+				self.resettime = resettime
+			else:
+				self.remaining = min(self.remaining, remaining)
+
+class AsyncGithubProjectDownloader(GithubProjectDownloader):
+	"""
+	Implements a project information downloader for GitHub that downloads many projects concurrently. The requests
+	are scheduled on an asyncio event loop and executed by a pool of threads that share the keep-alive connections
+	of the downloader. The core and the search limits of the GitHub API are honored separately.
+	"""
+	def __init__(self, username, password, check = False, cachedir = None, concurrency = 10, apiurl = "https://api.github.com", indexingpolicy = None,
+		cache_max_bytes = 1073741824):
+		"""
+		Initializes this asynchronous GitHub project downloader.
+
+		:param username: the GitHub username.
+		:param password: the GitHub password.
+		:param check: boolean indicating whether the credentials should be checked (True) or not (False).
+		:param cachedir: the path to the directory where the responses of the GitHub API are cached, or None if
+		the responses should not be cached.
+		:param concurrency: the maximum number of requests that are sent concurrently.
+		:param apiurl: the base URL of the GitHub API.
+		:param indexingpolicy: the policy that selects the files that are indexed, or None to index all files.
+		:param cache_max_bytes: the maximum total size of the cached responses in bytes.
+		"""
+		super(AsyncGithubProjectDownloader, self).__init__(username, password, check, cachedir, concurrency, apiurl, cache_max_bytes)
+		self.indexingpolicy = indexingpolicy
+		self.concurrency = concurrency
+		self.buckets = {'core': RateLimitBucket('core', 100, 60), 'search': RateLimitBucket('search', 5, 20)}
+
+	async def async_download_request(self, executor, address, parameters = None):
+		"""
+		Implements a download request without blocking the event loop.
+
+		:param executor: the executor that runs the requests.
+		:param address: the URL of the request.
+		:param parameters: the parameters of the request.
+		:returns: the response of the request.
+		"""
+		url = address + ('?' + '&'.join(parameters) if parameters else "")
+		bucket = self.buckets['search' if address.startswith(self.apiurl + "/search") else 'core']
+		await bucket.acquire()
+		r = None
+		started = time.time()
+		try:
+			entry = self.httpcache.load_entry(url) if self.httpcache else None
+			headers = self.httpcache.get_conditional_headers(entry) if self.httpcache else None
+			r = await asyncio.get_event_loop().run_in_executor(executor, functools.partial(self.session.get, url, headers = headers or None))
+		finally:
+			bucket.release(r.headers.get('x-ratelimit-remaining') if r is not None else None, r.headers.get('x-ratelimit-reset') if r is not None else None)
+		metrics.observe('github_request_seconds', time.time() - started, resource = bucket.name)
+		metrics.increment('github_requests_total', resource = bucket.name, status = r.status_code)
+		metrics.increment('github_response_bytes_total', len(r.content), resource = bucket.name)
+		if self.httpcache:
+			if int(r.status_code) == 304:
+				metrics.increment('github_cache_hits_total', resource = bucket.name)
+				r = self.httpcache.load_response(entry, r)
+			else:
+				self.httpcache.store_response(url, r)
+		return r
+
+	async def async_download_object(self, executor, address, parameters = None):
+		"""
+		Downloads an object of the GitHub API without blocking the event loop.
+
+		:param executor: the executor that runs the requests.
+		:param address: the URL of the GitHub request.
+		:param parameters: the parameters of the GitHub request.
+		:returns: the contents of the response of the request, or None if the object is not found.
+		"""
+		r = await self.async_download_request(executor, address, parameters)
+		if r.ok:
+			content = json.loads(r.text or r.content)
+			if type(content) == dict and 'ETag' in r.headers:
+				content['ETag'] = r.headers['ETag']
+			return content
+		elif int(r.status_code) != 404:
+			r.raise_for_status()
+
+	async def async_download_project(self, executor, project_id, include_tree = True):
+		"""
+		Downloads GitHub information about a project without blocking the event loop.
+
+		:param executor: the executor that runs the requests.
+		:param project_id: the project id for which information is downloaded.
+		:param include_tree: boolean indicating whether the tree of the project is downloaded (True) or not (False).
+		:returns: a JSON object containing the main information of the project and a list containing the filenames of its files,
+		or None instead of the list if the tree is not downloaded.
+		"""
+		project = await self.async_download_object(executor, self.apiurl + "/repos/" + project_id)
+		if project != None:
+			if not include_tree:
+				return self.create_project_document(project), None
+			if project['default_branch'] == 'master':
+				sourcecode = await self.async_download_object(executor, project['trees_url'].split('{')[0] + '/master', ["recursive=1"])
+			else:
+				branch = await self.async_download_object(executor, project['url'] + '/branches/' + project['default_branch'], ["recursive=1"])
+				sourcecode = await self.async_download_object(executor, project['trees_url'].split('{')[0] + '/' + branch['commit']['sha'], ["recursive=1"])
+			projectdoc = self.create_project_document(project)
+			return projectdoc, self.create_file_documents(projectdoc, sourcecode['tree'])
+		else:
+			return None, None
+
+	async def async_download_projects(self, project_ids, results, include_tree = True):
+		"""
+		Downloads GitHub information about many projects concurrently.
+
+		:param project_ids: the project ids for which information is downloaded.
+		:param results: a queue where the downloaded projects are put as tuples of the form (project_id, projectdoc,
+		sourcedocs, elapsed, counters, error).
+		:param include_tree: boolean indicating whether the trees of the projects are downloaded (True) or not (False).
+		"""
+		loop = asyncio.get_event_loop()
+		semaphore = asyncio.Semaphore(self.concurrency)
+		with ThreadPoolExecutor(self.concurrency) as executor:
+			async def download(project_id):
+				async with semaphore:
+					counters = {}
+					started = time.time()
+					try:
+						with metrics.attribute(counters):
+							projectdoc, sourcedocs = await self.async_download_project(executor, project_id, include_tree)
+						error = None
+					except Exception as e:
+						projectdoc, sourcedocs, error = None, None, e
+					await loop.run_in_executor(None, results.put, (project_id, projectdoc, sourcedocs, time.time() - started, counters, error))
+			await asyncio.gather(*[download(project_id) for project_id in project_ids])
+
+	def download_projects(self, project_ids, include_tree = True):
+		"""
+		Downloads GitHub information about many projects concurrently. The projects are downloaded by an event loop
+		that runs in a separate thread, while no more than a few downloaded projects are kept waiting to be consumed.
+
+		:param project_ids: the project ids for which information is downloaded.
+		:param include_tree: boolean indicating whether the trees of the projects are downloaded (True) or not (False).
+		:returns: a generator of tuples of the form (project_id, projectdoc, sourcedocs, elapsed, counters, error) in
+		the order in which the projects are downloaded, where projectdoc is None if the project is not found, elapsed
+		is the duration of the download in seconds, counters is a dict with the counters incremented by the download
+		(e.g. the downloaded bytes and the cache hits) and error is the exception that caused the download to fail,
+		if any. If the event loop fails, its exception is raised.
+		"""
+		results = queue.Queue(self.concurrency)
+		def run_event_loop():
+			try:
+				asyncio.run(self.async_download_projects(project_ids, results, include_tree))
+			except BaseException as e:
+				results.put(e)
+		thread = threading.Thread(target = run_event_loop)
+		thread.daemon = True
+		thread.start()
+		for _ in range(len(project_ids)):
+			result = results.get()
+			if isinstance(result, BaseException):
+				raise result
+			yield result
+		thread.join()
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+
+def get_directory_size(path):
+	"""
+	Computes the total size of the files of a directory.
+
+	:param path: the path of the directory.
+	:returns: the total size of the files of the directory in bytes.
+	"""
+	size = 0
+	for dirpath, _, filenames in os.walk(path):
+		for filename in filenames:
+			try:
+				size += os.lstat(os.path.join(dirpath, filename)).st_size
+			except OSError:
+				pass
+	return size
+
+class CloneManager:
+	"""
+	Class that manages the cloned repositories. It bounds the number of git operations that run in parallel,
+	retries the operations that fail or time out, and keeps the total size of the cloned repositories within a
+	disk budget by removing the working trees that were indexed least recently. All the repositories of the source
+	code directory are counted, including the ones that were never indexed or were cloned before the journal of
+	this manager existed, but only the repositories of projects that are contained in the index are removed.
+	"""
+	def __init__(self, gitdownloader, max_operations = 4, retries = 2, disk_budget = 0):
+		"""
+		Initializes this clone manager.
+
+		:param gitdownloader: the git downloader used to clone and pull the repositories.
+		:param max_operations: the maximum number of git operations that run in parallel.
+		:param retries: the number of times a failed git operation is retried.
+		:param disk_budget: the maximum total size of the cloned repositories in bytes, or 0 for no limit.
+		"""
+		self.gitdownloader = gitdownloader
+		self.semaphore = threading.BoundedSemaphore(max_operations)
+		self.retries = retries
+		self.disk_budget = disk_budget
+		self.lock = threading.Lock()
+		self.activeprojects = set()
+		self.journalpath = os.path.join(gitdownloader.sourcecodedir, '.clones.json')
+		try:
+			with open(self.journalpath) as infile:
+				self.clones = json.load(infile)
+		except (OSError, ValueError):
+			self.clones = {}
+		if self.disk_budget:
+			self.scan_clones()
+
+	def scan_clones(self):
+		"""
+		Synchronizes the journal with the repositories of the source code directory, i.e. the directories of the
+		form sourcecodedir/user/name. Repositories that are not in the journal are added to it as never indexed and
+		last used at their modification time, while the repositories of the journal that no longer exist are removed.
+		"""
+		sourcecodedir = self.gitdownloader.sourcecodedir
+		try:
+			users = [user for user in os.listdir(sourcecodedir) if os.path.isdir(os.path.join(sourcecodedir, user))]
+		except OSError:
+			users = []
+		found = {}
+		for user in users:
+			try:
+				names = os.listdir(os.path.join(sourcecodedir, user))
+			except OSError:
+				continue
+			for name in names:
+				if os.path.isdir(os.path.join(sourcecodedir, user, name)):
+					found[user + '/' + name] = sourcecodedir + '/' + user + '/' + name
+		with self.lock:
+			for project_id in list(self.clones):
+				if project_id not in found:
+					del self.clones[project_id]
+			for project_id, repo_path in found.items():
+				if project_id not in self.clones:
+					self.clones[project_id] = {'path': repo_path, 'size': get_directory_size(repo_path), 'used': os.path.getmtime(repo_path), 'indexed': None}
+			self.save_journal()
+
+	def save_journal(self):
+		"""
+		Saves the size and the times of use and of indexing of each cloned repository. This function must be called
+		while holding the lock of this manager.
+		"""
+		tmppath = self.journalpath + '.tmp'
+		try:
+			os.makedirs(os.path.dirname(self.journalpath) or '.', exist_ok = True)
+			with open(tmppath, 'w') as outfile:
+				json.dump(self.clones, outfile)
+			os.replace(tmppath, self.journalpath)
+		except OSError:
+			pass
+
+	def record_clone(self, project_id, repo_path, size, indexed = False):
+		"""
+		Records the size of a cloned repository and the time it was used. This function must be called while
+		holding the lock of this manager.
+
+		:param project_id: the id of the project.
+		:param repo_path: the path of the repository in the file system.
+		:param size: the size of the repository in bytes.
+		:param indexed: boolean indicating whether the repository was indexed (True) or only used (False).
+		"""
+		now = time.time()
+		previous = self.clones.get(project_id, {})
+		self.clones[project_id] = {'path': repo_path, 'size': size, 'used': now, 'indexed': now if indexed else previous.get('indexed')}
+		self.save_journal()
+
+	def pull_or_clone(self, project_id, repo_url, repo_path, repo_branch):
+		"""
+		Clones a repository or pulls it if it already exists, retrying with exponential backoff if the git
+		operation fails. The repository is counted in the disk budget as soon as it is cloned, and it is protected
+		from eviction until it is marked as indexed or released.
+
+		:param project_id: the id of the project.
+		:param repo_url: the URL of the repository to be cloned or pulled.
+		:param repo_path: the path of the file system to clone or pull the repository.
+		:param repo_branch: the branch to be cloned or pulled.
+		:returns: True if the repository is cloned or pulled successfully, or False otherwise.
+		"""
+		with self.lock:
+			self.activeprojects.add(project_id)
+		for attempt in range(self.retries + 1):
+			if attempt > 0:
+				sys.stdout.write('Retrying git operation for project %s\n' % project_id)
+				time.sleep(2 ** attempt)
+			with self.semaphore:
+				success = self.gitdownloader.git_pull_or_clone(project_id, repo_url, repo_path, repo_branch)
+			if success:
+				size = get_directory_size(repo_path)
+				with self.lock:
+					self.record_clone(project_id, repo_path, size)
+				return True
+		with self.lock:
+			self.activeprojects.discard(project_id)
+		return False
+
+	def release(self, project_id, is_indexed = None):
+		"""
+		Marks a repository as no longer being processed without marking it as indexed, and removes the least
+		recently indexed repositories if the disk budget is exceeded.
+
+		:param project_id: the id of the project.
+		:param is_indexed: a function that receives a project id and checks whether the project is contained in
+		the index. Repositories are removed only if their projects are contained in the index.
+		"""
+		with self.lock:
+			self.activeprojects.discard(project_id)
+		if self.disk_budget:
+			self.enforce_disk_budget(is_indexed)
+
+	def mark_indexed(self, project_id, repo_path, is_indexed = None):
+		"""
+		Marks a repository as indexed and removes the least recently indexed repositories if the disk budget is
+		exceeded.
+
+		:param project_id: the id of the project.
+		:param repo_path: the path of the repository in the file system.
+		:param is_indexed: a function that receives a project id and checks whether the project is contained in
+		the index. Repositories are removed only if their projects are contained in the index.
+		"""
+		size = get_directory_size(repo_path)
+		with self.lock:
+			self.activeprojects.discard(project_id)
+			self.record_clone(project_id, repo_path, size, True)
+		if self.disk_budget:
+			self.enforce_disk_budget(is_indexed)
+
+	def enforce_disk_budget(self, is_indexed = None):
+		"""
+		Removes the least recently indexed repositories until their total size does not exceed the disk budget.
+		Only the repositories of projects that are confirmed to be contained in the index are removed, while
+		repositories that are being processed are never removed. Repositories without a time of indexing, e.g. the
+		ones that were cloned before the journal existed, are considered the least recently indexed.
+
+		:param is_indexed: a function that receives a project id and checks whether the project is contained in
+		the index, or None to consider only the repositories that the journal records as indexed.
+		:returns: a list with the ids of the projects of which the repositories are removed.
+		"""
+		evicted = []
+		with self.lock:
+			totalsize = sum(clone['size'] for clone in self.clones.values())
+			candidates = sorted(self.clones.items(), key = lambda item: item[1].get('indexed') or 0)
+		for project_id, clone in candidates:
+			if totalsize <= self.disk_budget:
+				break
+			if not (is_indexed(project_id) if is_indexed else clone.get('indexed')):
+				continue
+			with self.lock:
+				if project_id in self.activeprojects:
+					continue
+				sys.stdout.write('Removing repository of project %s to free disk space\n' % project_id)
+				shutil.rmtree(clone['path'], ignore_errors = True)
+				self.clones.pop(project_id, None)
+			totalsize -= clone['size']
+			evicted.append(project_id)
+		with self.lock:
+			self.save_journal()
+		return evicted
@@ -0,0 +1,120 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+
+class DiskCache(object):
+	"""
+	Base class of the on-disk caches. Each entry of a cache is stored as a JSON file in the cache directory. The
+	files are kept in least recently used order, using their modification times to restore the order when the cache
+	is loaded, and the least recently used files are removed when the total size of the cache exceeds a limit.
+	"""
+	def __init__(self, cachedir, max_bytes = 1073741824):
+		"""
+		Initializes this disk cache.
+
+		:param cachedir: the path to the directory where the entries are stored.
+		:param max_bytes: the maximum total size of the stored entries in bytes.
+		"""
+		self.cachedir = cachedir
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.numbytes = 0
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.load_entries()
+		with self.lock:
+			self.evict()
+
+	def load_entries(self):
+		"""
+		Loads the entries that are already stored in the cache directory, ordered from the least to the most
+		recently used.
+		"""
+		entries = []
+		for dirpath, _, filenames in os.walk(self.cachedir):
+			for filename in filenames:
+				if filename.endswith('.json'):
+					path = os.path.join(dirpath, filename)
+					try:
+						stat = os.stat(path)
+					except OSError:
+						continue
+					entries.append((stat.st_mtime, path, stat.st_size))
+		for _, path, size in sorted(entries):
+			self.entries[path] = size
+			self.numbytes += size
+
+	def read_entry(self, path):
+		"""
+		Reads a stored entry and marks it as the most recently used one. If the file of the entry cannot be read,
+		then the entry is forgotten.
+
+		:param path: the path of the file of the entry.
+		:returns: the stored entry in JSON format, or None if it cannot be read.
+		"""
+		with self.lock:
+			if path in self.entries:
+				self.entries.move_to_end(path)
+		try:
+			with open(path) as infile:
+				data = json.load(infile)
+			os.utime(path)
+		except (OSError, ValueError):
+			with self.lock:
+				if path in self.entries:
+					self.numbytes -= self.entries.pop(path)
+			return None
+		return data
+
+	def write_entry(self, path, data):
+		"""
+		Stores an entry, replacing its file atomically, and removes the least recently used entries if the cache
+		is full.
+
+		:param path: the path of the file of the entry.
+		:param data: the entry in JSON format.
+		:returns: True if the entry is stored, or False otherwise.
+		"""
+		tmppath = path + '.' + str(threading.get_ident()) + '.tmp'
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok = True)
+			with open(tmppath, 'w') as outfile:
+				json.dump(data, outfile)
+			os.replace(tmppath, path)
+			size = os.path.getsize(path)
+		except OSError:
+			return False
+		with self.lock:
+			if path in self.entries:
+				self.numbytes -= self.entries.pop(path)
+			self.entries[path] = size
+			self.numbytes += size
+			self.evict()
+		return True
+
+	def evict(self):
+		"""
+		Removes the least recently used entries until the total size of the cache does not exceed its limit. Note
+		that the most recently used entry is never removed. This function must be called while holding the lock of
+		this cache.
+		"""
+		while self.numbytes > self.max_bytes and len(self.entries) > 1:
+			oldpath, oldsize = self.entries.popitem(last = False)
+			self.numbytes -= oldsize
+			self.evictions += 1
+			try:
+				os.remove(oldpath)
+			except OSError:
+				pass
+
+	def get_statistics(self):
+		"""
+		Returns the statistics of this cache.
+
+		:returns: a dict containing the hits, the misses, the evictions, the number of entries and the size of the cache.
+		"""
+		with self.lock:
+			return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.numbytes}
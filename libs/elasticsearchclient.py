@@ -1,16 +1,134 @@
 import os
+import re
 import sys
+import copy
+import gzip
+import time
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
 from elasticsearch.client import SnapshotClient
+from libs.metrics import metrics
 from libs.filefunctions import load_file_to_json
 from elasticsearch.client.indices import IndicesClient
+from elasticsearch.serializer import JSONSerializer
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 from elasticsearch.exceptions import NotFoundError, TransportError
+try:
+	import orjson
+except ImportError:
+	orjson = None
+try:
+	import ujson
+except ImportError:
+	ujson = None
+
+class FastJSONSerializer(JSONSerializer):
+	"""
+	Serializer that uses a fast JSON library (orjson or ujson) if it is installed. Any data that the fast library
+	cannot handle, as well as all data if no fast library is installed, is handled by the json module of the
+	standard library.
+	"""
+	def __init__(self, library = 'auto'):
+		"""
+		Initializes this serializer.
+		
+		:param library: the JSON library used, one of 'orjson', 'ujson', 'json' or 'auto' for the fastest one that
+		is installed. If the library is not installed, then the json module is used.
+		"""
+		if library == 'auto':
+			library = 'orjson' if orjson else 'ujson' if ujson else 'json'
+		if (library == 'orjson' and not orjson) or (library == 'ujson' and not ujson) or library not in ('orjson', 'ujson'):
+			library = 'json'
+		self.library = library
+
+	def dumps(self, data):
+		"""
+		Serializes data to a JSON string. Strings are not serialized.
+		
+		:param data: the data to be serialized.
+		:returns: the data as a JSON string.
+		"""
+		if isinstance(data, str):
+			return data
+		try:
+			if self.library == 'orjson':
+				return orjson.dumps(data).decode('utf-8')
+			elif self.library == 'ujson':
+				return ujson.dumps(data, ensure_ascii = False)
+		except (TypeError, ValueError, OverflowError):
+			pass
+		return JSONSerializer.dumps(self, data)
+
+	def loads(self, s):
+		"""
+		Deserializes a JSON string.
+		
+		:param s: the JSON string.
+		:returns: the deserialized data.
+		"""
+		try:
+			if self.library == 'orjson':
+				return orjson.loads(s)
+			elif self.library == 'ujson':
+				return ujson.loads(s)
+		except (TypeError, ValueError):
+			pass
+		return JSONSerializer.loads(self, s)
+
+class GzipHTTPAdapter(HTTPAdapter):
+	"""
+	Transport adapter that compresses the bodies of the requests using gzip.
+	"""
+	def __init__(self, compress_level = 1, **kwargs):
+		"""
+		Initializes this adapter.
+		
+		:param compress_level: the gzip compression level, from 1 (fastest) to 9 (smallest).
+		:param kwargs: the arguments of the HTTPAdapter, e.g. the size of its pool of connections.
+		"""
+		self.compress_level = compress_level
+		HTTPAdapter.__init__(self, **kwargs)
+
+	def send(self, request, **kwargs):
+		"""
+		Compresses the body of a request, if any, and sends the request.
+		
+		:param request: the prepared request.
+		:param kwargs: the arguments of the send function of the HTTPAdapter.
+		:returns: the response of the request.
+		"""
+		if request.body:
+			body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+			request.body = gzip.compress(body, self.compress_level)
+			request.headers['Content-Encoding'] = 'gzip'
+			request.headers['Content-Length'] = str(len(request.body))
+			metrics.increment('es_compressed_bytes_total', len(request.body))
+		return HTTPAdapter.send(self, request, **kwargs)
 
 class SafeRequestsHttpConnection(RequestsHttpConnection):
 	"""
 	Overrides the default RequestsHttpConnection to allow throwing errors when the credentials
-	are not correct.
+	are not correct. The keep-alive connections of its session are pooled, so that they are reused by
+	concurrent requests, and the bodies of the requests can be compressed.
 	"""
+	def __init__(self, http_compress = False, pool_maxsize = 10, **kwargs):
+		"""
+		Initializes this connection.
+		
+		:param http_compress: boolean indicating whether the bodies of the requests are compressed using gzip
+		and compressed responses are accepted (True) or not (False).
+		:param pool_maxsize: the maximum number of keep-alive connections that are kept for reuse.
+		:param kwargs: the arguments of the RequestsHttpConnection, e.g. the host and the port.
+		"""
+		RequestsHttpConnection.__init__(self, **kwargs)
+		if http_compress:
+			adapter = GzipHTTPAdapter(pool_connections = 1, pool_maxsize = pool_maxsize)
+			self.session.headers = dict(self.session.headers or {}, **{'Accept-Encoding': 'gzip'})
+		else:
+			adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_maxsize)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+
 	def perform_request(self, method, url, params = None, body = None, timeout = None, ignore = ()):
 		"""
 		Performs an HTTP request.
@@ -34,11 +152,161 @@ class SafeRequestsHttpConnection(RequestsHttpConnection):
 			else:
 				return e.status_code, None, None
 
+class BulkIndexer:
+	"""
+	Class used to group the create, update and delete actions on files into bulk requests. The pending actions
+	are sent to the Elasticsearch server whenever their number or their size exceeds a limit, as well as when
+	the indexer is flushed or closed.
+	"""
+	blob_fields = ('content', 'code')
+
+	def __init__(self, esclient, max_documents = 500, max_bytes = 10485760, deduplicate = False):
+		"""
+		Initializes this bulk indexer.
+		
+		:param esclient: the Elasticsearch client used to send the bulk requests.
+		:param max_documents: the maximum number of actions of a bulk request.
+		:param max_bytes: the maximum size of a bulk request in bytes.
+		:param deduplicate: boolean indicating whether the contents and the code of the files are stored once per
+		blob sha in separate documents (True) or in the documents of the files (False).
+		"""
+		self.esclient = esclient
+		self.max_documents = max_documents
+		self.max_bytes = max_bytes
+		self.deduplicate = deduplicate
+		self.actions = []
+		self.numbytes = 0
+		self.failures = []
+		self.totaldocuments = 0
+		self.totalbytes = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		# The last pending actions are not sent if an exception is raised. Batches that were flushed earlier are
+		# already in the index, so the caller has to remove the partial project if it must not be searchable
+		if exc_type is None:
+			self.close()
+
+	def add_action(self, action, source = None):
+		"""
+		Adds an action to the pending bulk request and sends the request if any of the limits is exceeded.
+		
+		:param action: the action and its metadata in JSON format.
+		:param source: the document or the partial document of the action (if any) in JSON format.
+		"""
+		serializer = self.esclient.client.transport.serializer
+		data = serializer.dumps(action) + '\n'
+		if source is not None:
+			data += serializer.dumps(source) + '\n'
+		self.actions.append(data)
+		self.numbytes += len(data.encode('utf-8'))
+		if len(self.actions) >= self.max_documents or self.numbytes >= self.max_bytes:
+			self.flush()
+
+	def create_blob(self, afile):
+		"""
+		Adds a create action for the blob of a file, i.e. a document with the contents and the code of the file that
+		is identified by the sha of the file, if the file has contents or code. If the blob already exists, the action
+		fails without being counted as a failure.
+		
+		:param afile: the data of the file in JSON format.
+		:returns: the data of the file without its contents and code.
+		"""
+		blob = {key: afile[key] for key in self.blob_fields if key in afile}
+		if not blob:
+			return afile
+		self.add_action({"create": {"_index": self.esclient.indexname, "_type": "blobs", "_id": afile['sha']}}, blob)
+		return {key: value for key, value in afile.items() if key not in self.blob_fields}
+
+	def create_file(self, afile):
+		"""
+		Adds a create action for a file.
+		
+		:param afile: the data of the file in JSON format.
+		"""
+		if self.deduplicate:
+			afile = self.create_blob(afile)
+		self.add_action({"create": {"_index": self.esclient.indexname, "_type": "files", "_id": afile['fullpathname'], "_parent": afile['project']}}, afile)
+
+	def index_file(self, afile):
+		"""
+		Adds an index action for a file, which creates the file or replaces it if it already exists.
+		
+		:param afile: the data of the file in JSON format.
+		"""
+		if self.deduplicate:
+			afile = self.create_blob(afile)
+		self.add_action({"index": {"_index": self.esclient.indexname, "_type": "files", "_id": afile['fullpathname'], "_parent": afile['project']}}, afile)
+
+	def update_file(self, afile):
+		"""
+		Adds an update action for a file.
+		
+		:param afile: the data of the file in JSON format.
+		"""
+		self.add_action({"update": {"_index": self.esclient.indexname, "_type": "files", "_id": afile['fullpathname'], "_parent": afile['project']}}, {'doc': afile})
+
+	def delete_file(self, afile_id):
+		"""
+		Adds a delete action for a file.
+		
+		:param afile_id: the id of the file to be deleted.
+		"""
+		self.add_action({"delete": {"_index": self.esclient.indexname, "_type": "files", "_id": afile_id, "_routing": '/'.join(afile_id.split('/')[0:2])}})
+
+	def delete_project(self, project_id):
+		"""
+		Adds a delete action for a project. Note that the files of the project are not deleted.
+		
+		:param project_id: the id of the project to be deleted.
+		"""
+		self.add_action({"delete": {"_index": self.esclient.indexname, "_type": "projects", "_id": project_id}})
+
+	def flush(self):
+		"""
+		Sends all pending actions to the Elasticsearch server as a bulk request.
+		
+		:returns: a list with the actions of the request that have failed, each given as a dict with the keys
+		'action', 'id', 'status' and 'error'.
+		"""
+		failures = []
+		if self.actions:
+			with metrics.timer('es_bulk_seconds'):
+				response = self.esclient.client.bulk(body = ''.join(self.actions))
+			metrics.increment('es_bulk_requests_total')
+			metrics.increment('es_documents_total', len(self.actions))
+			metrics.increment('es_bulk_bytes_total', self.numbytes)
+			self.totaldocuments += len(self.actions)
+			self.totalbytes += self.numbytes
+			self.actions = []
+			self.numbytes = 0
+			if response and response['errors']:
+				for item in response['items']:
+					for action, result in item.items():
+						if 'error' in result and not (action == 'create' and result.get('_type') == 'blobs' and result['status'] == 409):
+							failures.append({'action': action, 'id': result['_id'], 'status': result['status'], 'error': result['error']})
+							metrics.increment('es_document_failures_total', action = action)
+							sys.stdout.write('\nAction \'%s\' on file \'%s\' failed (%d)!\n' % (action, result['_id'], result['status']))
+			self.failures.extend(failures)
+		return failures
+
+	def close(self):
+		"""
+		Closes this bulk indexer after sending any pending actions.
+		"""
+		self.flush()
+
 class ElasticSearchClient:
 	"""
 	Class used as a client to the Elasticsearch server.
 	"""
-	def __init__(self, host, port, username, password, indexname):
+	bulk_load_settings = {"index.refresh_interval": "-1", "index.number_of_replicas": 0, "index.translog.durability": "async"}
+	# Fields that older versions of the index stored in the source, while they are now copied by the mappings
+	copied_fields = ["analyzedcontent"]
+
+	def __init__(self, host, port, username, password, indexname, serializer = 'json', http_compress = False, max_connections = 10, keep_old_versions = True):
 		"""
 		Initializes this Elasticsearch Client.
 		
@@ -47,42 +315,208 @@ class ElasticSearchClient:
 		:param username: the username for connecting to the index.
 		:param password: the password for connecting to the index.
 		:param indexname: the name of the Elasticsearch index.
+		:param serializer: the JSON library used to serialize the requests, one of 'orjson', 'ujson', 'json' or 'auto'.
+		:param http_compress: boolean indicating whether the requests are compressed using gzip (True) or not (False).
+		:param max_connections: the maximum number of keep-alive connections that are kept for reuse.
+		:param keep_old_versions: boolean indicating whether the versioned indices that the alias of the index pointed
+		to are kept when the alias is switched, until they are deleted by delete_old_versions (True), or deleted at
+		once (False).
 		"""
 		self.indexname = indexname
-		self.client = Elasticsearch(connection_class = SafeRequestsHttpConnection, host = host, port = int(port), http_auth = [username, password])
+		self.keep_old_versions = keep_old_versions
+		self.client = Elasticsearch(connection_class = SafeRequestsHttpConnection, host = host, port = int(port), http_auth = [username, password],
+			serializer = FastJSONSerializer(serializer), http_compress = http_compress, pool_maxsize = max_connections)
 		self.snapshotclient = SnapshotClient(self.client)
 		self.indicesclient = IndicesClient(self.client)
 
-	def delete_index_and_mappings(self):
+	def get_index_client(self, indexname):
 		"""
-		Deletes the index and all its mappings.
+		Returns a client to another index of the same Elasticsearch server, sharing the connections of this client.
+		
+		:param indexname: the name of the other index.
+		:returns: an ElasticSearchClient object for the other index.
+		"""
+		esclient = copy.copy(self)
+		esclient.indexname = indexname
+		return esclient
+
+	def get_aliased_indices(self):
+		"""
+		Returns the versioned indices that the alias of the index points to. The name of the index is used as an alias
+		to the versioned index that serves the searches, so that the index can be rebuilt without downtime.
+		
+		:returns: a sorted list with the names of the versioned indices, which is empty if there is no alias (either
+		because the index does not exist or because it is a legacy concrete index).
 		"""
 		try:
-			self.client.indices.delete(index = self.indexname)
+			return sorted(self.client.indices.get_alias(name = self.indexname))
 		except NotFoundError:
-			pass
+			return []
+
+	def get_versioned_indices(self):
+		"""
+		Returns all the versioned indices of the index, whether the alias of the index points to them or not.
+		
+		:returns: a sorted list with the names of the versioned indices.
+		"""
+		try:
+			indices = self.client.indices.get_alias(index = self.indexname + '-*')
+		except NotFoundError:
+			return []
+		pattern = re.compile(re.escape(self.indexname) + r'-\d{14}(-\d+)?$')
+		return sorted(index for index in indices if pattern.match(index))
+
+	def get_versioned_index_name(self):
+		"""
+		Returns a name for a new versioned index, i.e. a physical index named after the index and the current time.
+		
+		:returns: the name of the versioned index, which is not used by any index.
+		"""
+		versionedname = self.indexname + '-' + time.strftime('%Y%m%d%H%M%S')
+		suffix = 1
+		while self.client.indices.exists(versionedname):
+			versionedname = self.indexname + '-' + time.strftime('%Y%m%d%H%M%S') + '-' + str(suffix)
+			suffix += 1
+		return versionedname
+
+	def get_mappings(self):
+		"""
+		Returns the mappings of the document types of the index.
+		
+		:returns: a dict mapping each document type to its mapping.
+		"""
+		mappings = load_file_to_json("properties/filesproperties.json")
+		mappings.update(load_file_to_json("properties/projectsproperties.json"))
+		mappings.update(load_file_to_json("properties/blobsproperties.json"))
+		return mappings
+
+	def create_versioned_index(self):
+		"""
+		Creates a new versioned index with the settings and the mappings of the index. The alias of the index is not
+		changed.
+		
+		:returns: the name of the versioned index.
+		"""
+		versionedname = self.get_versioned_index_name()
+		body = load_file_to_json("properties/indexsettings.json")
+		body['mappings'] = self.get_mappings()
+		self.client.indices.create(index = versionedname, body = body)
+		return versionedname
+
+	def reindex_from(self, source, poll_interval = 5):
+		"""
+		Copies all the documents of another index to the index using the server-side reindex API, keeping their
+		parents and routing. Any fields that are copied by the mappings of the index are removed from the source of
+		the documents. Documents that are written to the other index while reindexing may not be copied.
+		
+		:param source: the name of the other index.
+		:param poll_interval: the number of seconds between two consecutive checks of the progress of the server.
+		:returns: the number of documents that were copied.
+		"""
+		sys.stdout.write('Reindexing %s into %s..\n' % (source, self.indexname))
+		with metrics.timer('es_reindex_seconds'):
+			script = {"inline": "for (def field : params.fields) { ctx._source.remove(field) }", "lang": "painless", "params": {"fields": self.copied_fields}}
+			response = self.client.reindex(body = {"source": {"index": source}, "dest": {"index": self.indexname}, "script": script}, wait_for_completion = False)
+			result = self.wait_for_task(response['task'], poll_interval)
+		if result.get('failures'):
+			raise TransportError(500, 'reindex_failures', result['failures'])
+		sys.stdout.write('\n%d documents reindexed\n' % (result.get('created', 0) + result.get('updated', 0)))
+		return result.get('created', 0) + result.get('updated', 0)
+
+	def switch_alias(self, versionedname, delete_old = None):
+		"""
+		Points the alias of the index to a versioned index, removing it from the versioned indices that it pointed
+		to in a single atomic request. A legacy concrete index with the name of the alias is removed in the same
+		request, since the alias cannot be created while it exists, so that the name of the index is always served.
+		
+		:param versionedname: the name of the versioned index.
+		:param delete_old: boolean indicating whether the versioned indices that the alias pointed to are deleted, or
+		None to delete them only if this client does not keep old versions.
+		"""
+		if delete_old is None:
+			delete_old = not self.keep_old_versions
+		self.client.indices.refresh(index = versionedname)
+		aliasedindices = self.get_aliased_indices()
+		oldindices = [index for index in aliasedindices if index != versionedname]
+		actions = []
+		if not aliasedindices and self.client.indices.exists(self.indexname):
+			sys.stdout.write('Replacing legacy index %s with alias to %s..\n' % (self.indexname, versionedname))
+			actions.append({"remove_index": {"index": self.indexname}})
+		actions += [{"remove": {"index": index, "alias": self.indexname}} for index in oldindices]
+		actions.append({"add": {"index": versionedname, "alias": self.indexname}})
+		self.client.indices.update_aliases(body = {"actions": actions})
+		if delete_old:
+			for index in oldindices:
+				self.client.indices.delete(index = index)
+		elif oldindices:
+			sys.stdout.write('Keeping previous versions %s of index %s\n' % (', '.join(oldindices), self.indexname))
+
+	def delete_old_versions(self):
+		"""
+		Deletes the versioned indices of the index that its alias does not point to, i.e. the previous versions that
+		were kept when the alias was switched. Note that this function must not be called while the index is being
+		rebuilt, since the new version is not yet pointed to by the alias.
+		
+		:returns: a list with the names of the deleted indices.
+		"""
+		aliasedindices = set(self.get_aliased_indices())
+		deleted = []
+		for index in self.get_versioned_indices():
+			if aliasedindices and index not in aliasedindices:
+				self.client.indices.delete(index = index)
+				deleted.append(index)
+		return deleted
+
+	def rebuild_index(self, seed = True, poll_interval = 5):
+		"""
+		Rebuilds the index in a new versioned index with the current settings and mappings, and points the alias of
+		the index to it, so that searches are served by the old version until the new one is complete. Legacy
+		concrete indices are migrated to an alias in the same way.
+		
+		:param seed: boolean indicating whether the documents of the current version are copied to the new one.
+		:param poll_interval: the number of seconds between two consecutive checks of the progress of the server.
+		:returns: the name of the new versioned index.
+		"""
+		versionedname = self.create_versioned_index()
+		try:
+			if seed and self.client.indices.exists(self.indexname):
+				self.get_index_client(versionedname).reindex_from(self.indexname, poll_interval)
+		except BaseException:
+			self.client.indices.delete(index = versionedname)
+			raise
+		self.switch_alias(versionedname)
+		return versionedname
+
+	def delete_index_and_mappings(self):
+		"""
+		Deletes the index and all its mappings, i.e. all the versioned indices of the index (including the previous
+		versions that were kept) or the legacy concrete index.
+		"""
+		for index in sorted(set(self.get_aliased_indices()) | set(self.get_versioned_indices())) or [self.indexname]:
+			try:
+				self.client.indices.delete(index = index)
+			except NotFoundError:
+				pass
 
 	def create_index_and_mappings(self, update_mappings = False):
 		"""
-		Creates or updates the index and its mappings.
+		Creates or updates the index and its mappings. The index is created as a versioned index behind an alias. When
+		the mappings are updated, or when the index is a legacy concrete index, the documents are reindexed into a new
+		versioned index and the alias is switched to it, so that searches are not interrupted.
 		
 		:param update_mappings: boolean denoting whether the mappings should be created (False) or updated (True).
 		"""
-		if not self.client.indices.exists(self.indexname):
-			self.client.indices.create(index = self.indexname, body = load_file_to_json("properties/indexsettings.json"))
-		mappings = {}
-		if self.indexname in self.client.indices.get_mapping(self.indexname):
-			mappings = self.client.indices.get_mapping(self.indexname)[self.indexname]['mappings']
-		if update_mappings:
-			self.client.indices.close(self.indexname)
-		if 'files' not in mappings or update_mappings:
-			self.client.indices.put_mapping(index = self.indexname, doc_type = 'files',
-				body = load_file_to_json("properties/filesproperties.json"))
-		if 'projects' not in mappings or update_mappings:
-			self.client.indices.put_mapping(index = self.indexname, doc_type = 'projects',
-				body = load_file_to_json("properties/projectsproperties.json"))
-		if update_mappings:
-			self.client.indices.open(self.indexname)
+		aliasedindices = self.get_aliased_indices()
+		if update_mappings or (not aliasedindices and self.client.indices.exists(self.indexname)):
+			self.rebuild_index(seed = True)
+		elif not aliasedindices:
+			self.switch_alias(self.create_versioned_index())
+		else:
+			# Document types that were added after the index was created are added to its mappings
+			currentmappings = list(self.client.indices.get_mapping(self.indexname).values())[0]['mappings']
+			for doc_type, mapping in self.get_mappings().items():
+				if doc_type not in currentmappings:
+					self.client.indices.put_mapping(index = self.indexname, doc_type = doc_type, body = {doc_type: mapping})
 
 	def has_project(self, project_id):
 		"""
@@ -110,6 +544,26 @@ class ElasticSearchClient:
 		"""
 		self.client.create(index = self.indexname, doc_type = 'projects', id = project['fullname'], body = project)
 
+	def get_project(self, project_id):
+		"""
+		Returns a project of the index.
+		
+		:param project_id: the id of the project to be returned.
+		:returns: the data of the project in JSON format, or None if the index does not contain the project.
+		"""
+		try:
+			return self.client.get(index = self.indexname, doc_type = 'projects', id = project_id)['_source']
+		except NotFoundError:
+			return None
+
+	def update_project(self, project):
+		"""
+		Updates a project in the index.
+		
+		:param project: the data of the project in JSON format.
+		"""
+		self.client.update(index = self.indexname, doc_type = 'projects', id = project['fullname'], body = {'doc': project})
+
 	def create_file(self, afile):
 		"""
 		Creates a file in the index.
@@ -134,14 +588,111 @@ class ElasticSearchClient:
 		"""
 		self.client.delete(index = self.indexname, doc_type = 'files', id = afile_id, routing = '/'.join(afile_id.split('/')[0:2]))
 
+	def bulk_indexer(self, max_documents = 500, max_bytes = 10485760, deduplicate = False):
+		"""
+		Returns a bulk indexer that groups the create, update and delete actions on files into bulk requests.
+		
+		:param max_documents: the maximum number of actions of a bulk request.
+		:param max_bytes: the maximum size of a bulk request in bytes.
+		:param deduplicate: boolean indicating whether the contents and the code of the files are stored once per blob.
+		:returns: a new bulk indexer for the index.
+		"""
+		return BulkIndexer(self, max_documents, max_bytes, deduplicate)
+
+	def get_stored_blobs(self, shas, batch_size = 1000):
+		"""
+		Finds which blobs are stored in the index, using multi get requests that do not load the blobs.
+		
+		:param shas: an iterable of the shas of the blobs.
+		:param batch_size: the number of blobs of each request.
+		:returns: a set with the shas of the blobs that are stored.
+		"""
+		shas = list(shas)
+		stored = set()
+		for i in range(0, len(shas), batch_size):
+			response = self.client.mget(index = self.indexname, doc_type = 'blobs', body = {"ids": shas[i:i + batch_size]}, _source = False)
+			stored.update(doc['_id'] for doc in response['docs'] if doc.get('found'))
+		return stored
+
 	def delete_project(self, project_id):
 		"""
 		Deletes a project from the index. Note that this function also deletes all the files of the project.
 		
 		:param project_id: the id of the project to be deleted.
 		"""
-		self.client.delete_by_query(index = self.indexname, doc_type = 'files', body = {"query": { "bool": { "must": { "match_all": {} }, "filter": { "term": { "_routing": project_id } } } } })
-		self.client.delete(index = self.indexname, doc_type = 'projects', id = project_id)
+		with metrics.timer('es_delete_seconds'):
+			self.client.delete_by_query(index = self.indexname, doc_type = 'files', body = {"query": { "bool": { "must": { "match_all": {} }, "filter": { "term": { "_routing": project_id } } } } })
+			self.client.delete(index = self.indexname, doc_type = 'projects', id = project_id)
+
+	def delete_projects(self, project_ids, batch_size = 1000, requests_per_second = None, poll_interval = 5):
+		"""
+		Deletes many projects from the index along with their files. The files of each batch of projects are
+		deleted by a single delete by query request that runs as a task on the server and is polled until it is
+		completed. The projects themselves are then deleted using bulk requests.
+		
+		:param project_ids: a list of the ids of the projects to be deleted.
+		:param batch_size: the maximum number of projects of which the files are deleted by a single request.
+		:param requests_per_second: the maximum number of documents deleted per second, or None for no throttling.
+		:param poll_interval: the number of seconds between two consecutive checks of the status of the task.
+		:returns: the number of deleted files.
+		"""
+		deleted = 0
+		for i in range(0, len(project_ids), batch_size):
+			batch = project_ids[i:i + batch_size]
+			params = {'wait_for_completion': 'false', 'conflicts': 'proceed'}
+			if requests_per_second:
+				params['requests_per_second'] = requests_per_second
+			with metrics.timer('es_delete_seconds'):
+				response = self.client.delete_by_query(index = self.indexname, doc_type = 'files', body = {"query": { "terms": { "_routing": batch } } }, **params)
+				result = self.wait_for_task(response['task'], poll_interval)
+			for failure in result.get('failures', []):
+				sys.stdout.write('\nDeleting file \'%s\' failed!\n' % failure.get('id'))
+			deleted += result.get('deleted', 0)
+			with self.bulk_indexer() as indexer:
+				for project_id in batch:
+					indexer.delete_project(project_id)
+		return deleted
+
+	def wait_for_task(self, task_id, poll_interval = 5):
+		"""
+		Waits until a task of the server is completed, writing its progress.
+		
+		:param task_id: the id of the task.
+		:param poll_interval: the number of seconds between two consecutive checks of the status of the task.
+		:returns: the response of the task if it is completed, or an empty dict if the task is not found.
+		"""
+		while True:
+			try:
+				task = self.client.tasks.get(task_id = task_id)
+			except NotFoundError:
+				return {}
+			if task.get('completed'):
+				return task.get('response', task['task'].get('status', {}))
+			status = task['task'].get('status', {})
+			processed = status.get('created', 0) + status.get('updated', 0) + status.get('deleted', 0)
+			sys.stdout.write('\rTask %s: %d of %d documents processed' % (task_id, processed, status.get('total', 0)))
+			time.sleep(poll_interval)
+
+	def iterate_project_fileids_and_shas(self, project_id, page_size = 1000):
+		"""
+		Iterates over the files of a project and their corresponding shas using a scroll search. Only the ids and
+		the shas of the files are loaded, one page at a time.
+		
+		:param project_id: the id of the project of which the files and the shas are returned.
+		:param page_size: the number of files of each page.
+		:returns: a generator of pages, where each page is a list of tuples of the form (file_id, sha).
+		"""
+		response = self.client.search(index = self.indexname, doc_type = 'files', routing = project_id, scroll = '1m', size = page_size,
+			body = {"query": { "term" : { "_routing": project_id } }, "_source": ["sha"], "sort": ["_doc"] })
+		scroll_id = response.get('_scroll_id')
+		try:
+			while response['hits']['hits']:
+				yield [(afile['_id'], afile['_source']['sha']) for afile in response['hits']['hits']]
+				response = self.client.scroll(scroll_id = scroll_id, scroll = '1m')
+				scroll_id = response.get('_scroll_id', scroll_id)
+		finally:
+			if scroll_id:
+				self.client.clear_scroll(scroll_id = scroll_id, ignore = 404)
 
 	def get_project_fileids_and_shas(self, project_id):
 		"""
@@ -150,11 +701,9 @@ class ElasticSearchClient:
 		:param project_id: the id of the project of which the files and the shas are returned.
 		:returns: a dict containing the files of the project as keys and their shas as values.
 		"""
-		sourcefiles = self.client.search(index = self.indexname, doc_type = 'files',
-			body = {"query": { "term" : { "_routing": project_id } } }, routing = project_id, size = 100000000)['hits']['hits']  # Limitation! Each project must have no more than 100000000 files
 		fileidsandshas = {}
-		for afile in sourcefiles:
-			fileidsandshas[afile['_id']] = afile['_source']['sha']
+		for page in self.iterate_project_fileids_and_shas(project_id):
+			fileidsandshas.update(page)
 		return fileidsandshas
 
 	def execute_query(self, query, doc_type = 'files'):
@@ -178,45 +727,176 @@ class ElasticSearchClient:
 		result = self.indicesclient.analyze(index = self.indexname, analyzer = analyzer, body = text)
 		return [r['token'] for r in result['tokens']]
 
-	def backup(self, backupdir):
+	def get_backup_repository(self, backupdir = None):
 		"""
-		Backups the index.
+		Returns the snapshot repository of the index, creating it if it does not exist. All the snapshots of the index
+		are stored in the same repository, so that each snapshot only copies the segments that are not already stored.
 		
-		:param backupdir: the directory used to backup the index.
+		:param backupdir: the directory used to backup the index, required only if the repository does not exist.
+		:returns: the name of the repository.
 		"""
 		repositoryname = os.path.basename("backup" + self.indexname)
 		try:
 			self.snapshotclient.get_repository(repository = repositoryname)
-		except:
+		except NotFoundError:
+			if backupdir is None:
+				raise
 			self.snapshotclient.create_repository(repository = repositoryname, body = {"type": "fs", "settings": {"location": backupdir + os.sep + self.indexname}})
-		try:
-			self.snapshotclient.get(repository = repositoryname, snapshot = self.indexname + "snapshot")
-		except:
-			self.snapshotclient.create(repository = repositoryname, snapshot = self.indexname + "snapshot", body = {"indices": self.indexname}, wait_for_completion = True)
+		return repositoryname
 
-	def delete_backup(self):
+	def get_backups(self):
 		"""
-		Removes any backups of the index. If there are no backups, this function does nothing.
+		Returns the backups of the index.
+		
+		:returns: a list with the snapshots of the index sorted from the oldest to the newest, each given as a dict with
+		the keys 'snapshot', 'state', 'indices' and 'start_time_in_millis' among others, which is empty if there is no
+		repository.
 		"""
-		repositoryname = os.path.basename("backup" + self.indexname)
 		try:
-			self.snapshotclient.delete(repository = repositoryname, snapshot = self.indexname + "snapshot")
-		except:
-			pass
+			repositoryname = self.get_backup_repository()
+		except NotFoundError:
+			return []
+		snapshots = self.snapshotclient.get(repository = repositoryname, snapshot = '_all')['snapshots']
+		return sorted(snapshots, key = lambda snapshot: snapshot.get('start_time_in_millis', 0))
 
-	def restore_backup(self):
+	def backup(self, backupdir, poll_interval = 5):
 		"""
-		Restores a backup of the index.
+		Backups the index in a new timestamped snapshot. The snapshot is started without blocking the server and its
+		progress is polled until it is finished, while documents can still be indexed.
+		
+		:param backupdir: the directory used to backup the index.
+		:param poll_interval: the number of seconds between two consecutive checks of the progress of the server.
+		:returns: the name of the snapshot.
+		"""
+		repositoryname = self.get_backup_repository(backupdir)
+		snapshotname = self.indexname + '-' + time.strftime('%Y%m%d-%H%M%S')
+		sys.stdout.write('Creating snapshot %s..\n' % snapshotname)
+		with metrics.timer('es_snapshot_seconds'):
+			self.snapshotclient.create(repository = repositoryname, snapshot = snapshotname, body = {"indices": self.indexname, "include_global_state": False}, wait_for_completion = False)
+			while True:
+				status = self.snapshotclient.status(repository = repositoryname, snapshot = snapshotname)['snapshots'][0]
+				if status['state'] not in ('INIT', 'STARTED'):
+					break
+				stats = status.get('shards_stats', {})
+				sys.stdout.write('\rSnapshot %s: %d of %d shards done' % (snapshotname, stats.get('done', 0), stats.get('total', 0)))
+				time.sleep(poll_interval)
+		sys.stdout.write('\nSnapshot %s finished with state %s\n' % (snapshotname, status['state']))
+		if status['state'] != 'SUCCESS':
+			raise TransportError(500, 'snapshot_failed', status)
+		return snapshotname
+
+	def delete_old_backups(self, keep_last = 5, keep_daily = 7, keep_weekly = 4):
 		"""
-		repositoryname = os.path.basename("backup" + self.indexname)
-		if not self.client.indices.exists(self.indexname):
-			self.client.indices.create(index = self.indexname, body = load_file_to_json("properties/indexsettings.json"))
-		self.client.indices.close(self.indexname)
-		self.snapshotclient.restore(repository = repositoryname, snapshot = self.indexname + "snapshot", body = {"indices": self.indexname}, wait_for_completion = True)
-		self.client.indices.open(self.indexname)
+		Deletes the backups of the index that are not retained. The last successful snapshots are retained, as well as
+		the newest successful snapshot of each of the last days and weeks that have snapshots. Snapshots that have
+		failed are deleted, while snapshots that are in progress are kept.
+		
+		:param keep_last: the number of last snapshots that are retained.
+		:param keep_daily: the number of days of which the newest snapshot is retained.
+		:param keep_weekly: the number of weeks of which the newest snapshot is retained.
+		:returns: a list with the names of the deleted snapshots.
+		"""
+		snapshots = list(reversed(self.get_backups()))
+		successful = [snapshot for snapshot in snapshots if snapshot['state'] == 'SUCCESS']
+		retained = set(snapshot['snapshot'] for snapshot in successful[:keep_last])
+		for keep, timeformat in ((keep_daily, '%Y-%m-%d'), (keep_weekly, '%G-%V')):
+			periods = set()
+			for snapshot in successful:
+				period = time.strftime(timeformat, time.localtime(snapshot['start_time_in_millis'] / 1000.0))
+				if period not in periods and len(periods) < keep:
+					periods.add(period)
+					retained.add(snapshot['snapshot'])
+		deleted = []
+		for snapshot in snapshots:
+			if snapshot['snapshot'] not in retained and snapshot['state'] != 'IN_PROGRESS':
+				self.snapshotclient.delete(repository = self.get_backup_repository(), snapshot = snapshot['snapshot'])
+				deleted.append(snapshot['snapshot'])
+		return deleted
+
+	def delete_backup(self, snapshotname = None):
+		"""
+		Removes a backup of the index, or all its backups. If there are no backups, this function does nothing.
+		
+		:param snapshotname: the name of the snapshot to remove, or None to remove all the snapshots of the index.
+		"""
+		for snapshot in self.get_backups():
+			if snapshotname is None or snapshot['snapshot'] == snapshotname:
+				self.snapshotclient.delete(repository = self.get_backup_repository(), snapshot = snapshot['snapshot'])
+
+	def restore_backup(self, snapshotname = None, poll_interval = 5, timeout = 3600):
+		"""
+		Restores a backup of the index into a new versioned index and switches the alias of the index to it when all
+		its primary shards are recovered (i.e. when its health is at least yellow), so that the current version of the
+		index is not closed during the restore. Only the versioned index of the snapshot is restored. If the restored
+		index is still red when the timeout expires, it is deleted and the alias is left unchanged.
+		
+		:param snapshotname: the name of the snapshot to restore, or None to restore the newest successful snapshot.
+		:param poll_interval: the number of seconds between two consecutive checks of the progress of the server.
+		:param timeout: the maximum number of seconds to wait for the restored index to recover.
+		:returns: the name of the new versioned index.
+		"""
+		snapshots = [snapshot for snapshot in self.get_backups() if snapshot['state'] == 'SUCCESS' and snapshotname in (None, snapshot['snapshot'])]
+		if not snapshots:
+			raise NotFoundError(404, 'snapshot_missing_exception', snapshotname)
+		snapshot = snapshots[-1]
+		# Snapshots of the alias contain its versioned index, while older snapshots contain the index itself
+		indices = sorted(index for index in snapshot['indices'] if index == self.indexname or index.startswith(self.indexname + '-'))
+		if not indices:
+			raise NotFoundError(404, 'index_not_found_exception', '%s in snapshot %s' % (self.indexname, snapshot['snapshot']))
+		versionedname = self.get_versioned_index_name()
+		sys.stdout.write('Restoring index %s of snapshot %s into %s..\n' % (indices[-1], snapshot['snapshot'], versionedname))
+		with metrics.timer('es_restore_seconds'):
+			self.snapshotclient.restore(repository = self.get_backup_repository(), snapshot = snapshot['snapshot'], body = {"indices": indices[-1],
+				"rename_pattern": re.escape(indices[-1]), "rename_replacement": versionedname, "include_aliases": False, "include_global_state": False}, wait_for_completion = False)
+			deadline = time.time() + timeout
+			while True:
+				try:
+					health = self.client.cluster.health(index = versionedname, wait_for_status = 'yellow', timeout = '%ds' % max(1, poll_interval))
+				except TransportError as e:
+					# A timed out health check returns status 408 with the current health of the index
+					if e.status_code != 408:
+						raise
+					health = e.info if isinstance(e.info, dict) else {'timed_out': True}
+				if not health.get('timed_out') and health.get('status') in ('yellow', 'green'):
+					break
+				if time.time() >= deadline:
+					sys.stdout.write('\nIndex %s is %s after %d seconds, deleting it..\n' % (versionedname, health.get('status'), timeout))
+					self.client.indices.delete(index = versionedname, ignore = 404)
+					raise TransportError(408, 'restore_timed_out', health)
+				sys.stdout.write('.')
+		sys.stdout.write('\n')
+		self.switch_alias(versionedname)
+		return versionedname
 
 	def flush(self):
 		"""
 		Flushes the index.
 		"""
 		self.indicesclient.flush(index = self.indexname)
+
+	@contextmanager
+	def bulk_load_mode(self, max_num_segments = 1):
+		"""
+		Context manager that tunes the index for a bulk load, by disabling refreshes and replicas and syncing the
+		translog asynchronously. When the load finishes, the serving settings of the index are restored, even if the
+		load has failed. If the load has succeeded, the index is also force-merged. Finally, the index is refreshed.
+		
+		:param max_num_segments: the number of segments to which each shard is merged after the load.
+		"""
+		response = self.indicesclient.get_settings(index = self.indexname, flat_settings = True)
+		current = list(response.values())[0]['settings']
+		# Settings that were not set explicitly are restored to their defaults by setting them to null
+		serving = {key: current.get(key) for key in self.bulk_load_settings}
+		sys.stdout.write('Switching index %s to bulk load mode..\n' % self.indexname)
+		self.indicesclient.put_settings(index = self.indexname, body = self.bulk_load_settings)
+		succeeded = False
+		try:
+			yield
+			succeeded = True
+		finally:
+			sys.stdout.write('\nRestoring the serving settings of index %s..\n' % self.indexname)
+			self.indicesclient.put_settings(index = self.indexname, body = serving)
+			if succeeded:
+				with metrics.timer('es_forcemerge_seconds'):
+					self.indicesclient.forcemerge(index = self.indexname, max_num_segments = max_num_segments, request_timeout = 3600)
+			self.indicesclient.refresh(index = self.indexname)
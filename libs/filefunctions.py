@@ -1,4 +1,5 @@
 import json
+import hashlib
 
 def load_file_to_json(filename):
 	"""
@@ -49,6 +50,17 @@ def read_ascii_file(file_path):
 	data = data.decode('ascii', 'ignore')
 	return data
 
+def compute_git_blob_sha(file_path):
+	"""
+	Computes the git blob sha of a file, i.e. the sha1 of its contents prefixed by the git blob header.
+	
+	:param file_path: the path of the file of which the sha is computed.
+	:returns: the git blob sha of the file as a hex string.
+	"""
+	with open(file_path, 'rb') as infile:
+		data = infile.read()
+	return hashlib.sha1(b'blob ' + str(len(data)).encode('ascii') + b'\0' + data).hexdigest()
+
 def read_file_in_lines(filename):
 	"""
 	Reads a file into lines.
@@ -1,40 +1,173 @@
 import subprocess
+import shutil
 import os
 import sys
+import pathlib
+from libs.metrics import metrics
+
+def get_git_object_type(mode):
+	"""
+	Returns the type of a git object given its mode.
+	
+	:param mode: the git mode of the object.
+	:returns: the git type of the object, one of 'tree', 'commit' or 'blob'.
+	"""
+	if mode == '040000':
+		return 'tree'
+	elif mode == '160000':
+		return 'commit'
+	return 'blob'
 
 class GitDownloader():
 	"""
 	Class that implements a downloader using the git command.
 	"""
-	def __init__(self, sourcecodedir, gitcommand):
+	def __init__(self, sourcecodedir, gitcommand, clone_strategy = 'full', timeout = None):
 		"""
 		Initializes this Git Downloader.
 		
 		:param sourcecodedir: the path to the directory where repos are cloned.
 		:param gitcommand: the path to the git command of the system.
+		:param clone_strategy: the strategy used to clone and pull repositories, one of 'full' (the whole history),
+		'shallow' (only the last commit of the branch) or 'blobless' (the whole history without the file contents
+		of old commits, which are downloaded on demand).
+		:param timeout: the maximum number of seconds of each git command, or None for no timeout.
 		"""
+		if clone_strategy not in ('full', 'shallow', 'blobless'):
+			raise ValueError('Unknown clone strategy \'%s\'' % clone_strategy)
 		self.sourcecodedir = sourcecodedir
 		self.gitcommand = gitcommand
+		self.clone_strategy = clone_strategy
+		self.timeout = timeout
+
+	def run_git(self, arguments, cwd = None):
+		"""
+		Runs a git command. The command is killed if it exceeds the timeout of this downloader.
+		
+		:param arguments: the arguments of the git command.
+		:param cwd: the directory where the command is executed.
+		:returns: True if the command is completed successfully, or False otherwise.
+		"""
+		try:
+			with metrics.timer('git_command_seconds', command = arguments[0]):
+				success = subprocess.call([self.gitcommand] + arguments, cwd = cwd, timeout = self.timeout) == 0
+		except subprocess.TimeoutExpired:
+			sys.stdout.write('Git command \'%s\' timed out!\n' % ' '.join(arguments[:1]))
+			metrics.increment('git_timeouts_total', command = arguments[0])
+			return False
+		if not success:
+			metrics.increment('git_failures_total', command = arguments[0])
+		return success
 
 	def git_pull(self, repo_url, repo_path, repo_branch):
 		"""
-		Implements the git pull command.
+		Implements the git pull command. If the clone strategy is not 'full', then only the last commit of the
+		branch is fetched and the working tree is reset to it. If the server refuses the shallow fetch, then the
+		branch is fetched as a whole.
 		
 		:param repo_url: the URL of the repository to be pulled.
 		:param repo_path: the path of the repository in the file system.
 		:param repo_branch: the branch to be pulled.
+		:returns: True if the repository is pulled successfully, or False otherwise.
 		"""
-		subprocess.call([self.gitcommand, 'pull', 'origin', repo_branch], cwd = repo_path)
+		if self.clone_strategy == 'full':
+			return self.run_git(['pull', 'origin', repo_branch], cwd = repo_path)
+		if not self.run_git(['fetch', '--depth', '1', 'origin', repo_branch], cwd = repo_path):
+			sys.stdout.write('Shallow fetch failed, fetching the whole branch\n')
+			if not self.run_git(['fetch', 'origin', repo_branch], cwd = repo_path):
+				return False
+		return self.run_git(['reset', '--hard', 'FETCH_HEAD'], cwd = repo_path)
 
 	def git_clone(self, repo_url, repo_path, repo_branch = None):
 		"""
-		Implements the git clone command.
+		Implements the git clone command. If the clone strategy is not 'full' and the server refuses the shallow
+		or the partial clone, then the repository is cloned as a whole. Any partially cloned repository is removed.
 		
 		:param repo_url: the URL of the repository to be cloned.
 		:param repo_path: the path of the file system to clone the repository.
 		:param repo_branch: the branch to be cloned.
+		:returns: True if the repository is cloned successfully, or False otherwise.
+		"""
+		if self.clone_strategy != 'full':
+			# Git ignores --depth and --filter when cloning a local path, so local repositories are cloned using file:// URLs
+			if os.path.isdir(repo_url):
+				repo_url = pathlib.Path(os.path.abspath(repo_url)).as_uri()
+			options = ['--depth', '1'] if self.clone_strategy == 'shallow' else ['--filter=blob:none']
+			options += ['--single-branch'] + (['--branch', repo_branch] if repo_branch else [])
+			if self.run_git(['clone'] + options + [repo_url, repo_path]):
+				return True
+			sys.stdout.write('The %s clone failed, cloning the whole repository\n' % self.clone_strategy)
+			shutil.rmtree(repo_path, ignore_errors = True)
+		if self.run_git(['clone', repo_url, repo_path]):
+			return True
+		shutil.rmtree(repo_path, ignore_errors = True)
+		return False
+
+	def get_head_commit(self, repo_path):
+		"""
+		Returns the commit at the head of a repository.
+		
+		:param repo_path: the path of the repository in the file system.
+		:returns: the sha of the head commit, or None if the repository is not valid.
+		"""
+		try:
+			return subprocess.check_output([self.gitcommand, 'rev-parse', 'HEAD'], cwd = repo_path).decode('ascii').strip()
+		except (subprocess.CalledProcessError, OSError):
+			return None
+
+	def get_changed_files(self, repo_path, old_commit, new_commit):
+		"""
+		Returns the files and the directories of a repository that have changed between two commits, using the
+		git diff command. Renamed files are given as a deleted and an added file.
+		
+		:param repo_path: the path of the repository in the file system.
+		:param old_commit: the sha of the old commit.
+		:param new_commit: the sha of the new commit.
+		:returns: a list of tree entries containing the status ('A', 'M', 'D' or 'T'), the path, the mode, the sha
+		and the type of each changed file, or None if the diff cannot be computed (e.g. if the old commit is missing).
+		"""
+		try:
+			output = subprocess.check_output([self.gitcommand, 'diff', '--raw', '-z', '--no-abbrev', '--no-renames', '-t', old_commit, new_commit], cwd = repo_path)
+		except (subprocess.CalledProcessError, OSError):
+			return None
+		fields = output.decode('utf-8', 'replace').split('\0')
+		changedfiles = []
+		for metadata, path in zip(fields[0::2], fields[1::2]):
+			oldmode, newmode, oldsha, newsha, status = metadata[1:].split()
+			mode, sha = (oldmode, oldsha) if status == 'D' else (newmode, newsha)
+			changedfiles.append({'status': status, 'path': path, 'mode': mode, 'sha': sha, 'type': get_git_object_type(mode)})
+		return changedfiles
+
+	def iterate_tree_entries(self, repo_path, commit = 'HEAD', chunk_size = 65536):
+		"""
+		Iterates over the files and the directories of a commit of a repository using the git ls-tree command. The
+		output of the command is read as a stream, so that the whole listing is never held in memory.
+		
+		:param repo_path: the path of the repository in the file system.
+		:param commit: the sha of the commit.
+		:param chunk_size: the number of bytes of the output that are read at a time.
+		:returns: a generator of tree entries containing the path, the mode, the sha, the type and (for files) the
+		size of each file and directory, as in the recursive trees of the GitHub API.
 		"""
-		subprocess.call([self.gitcommand, 'clone', repo_url, repo_path])
+		process = subprocess.Popen([self.gitcommand, 'ls-tree', '-r', '-t', '-l', '-z', commit], cwd = repo_path, stdout = subprocess.PIPE)
+		try:
+			remainder = b''
+			for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+				records = (remainder + chunk).split(b'\0')
+				remainder = records.pop()
+				for record in records:
+					metadata, path = record.decode('utf-8', 'replace').split('\t', 1)
+					mode, otype, sha, size = metadata.split()
+					entry = {'path': path, 'mode': mode, 'type': otype, 'sha': sha}
+					if size != '-':
+						entry['size'] = int(size)
+					yield entry
+		finally:
+			process.stdout.close()
+			returncode = process.wait()
+		if returncode != 0:
+			metrics.increment('git_failures_total', command = 'ls-tree')
+			raise subprocess.CalledProcessError(returncode, 'git ls-tree')
 
 	def has_project(self, project_id):
 		"""
@@ -54,11 +187,13 @@ class GitDownloader():
 		:param repo_url: the URL of the repository to be cloned or pulled.
 		:param repo_path: the path of the file system to clone or pull the repository.
 		:param repo_branch: the branch to be cloned or pulled.
+		:returns: True if the repository is cloned or pulled successfully, or False otherwise.
 		"""
 		if self.has_project(project_id):
 			sys.stdout.write('Pulling project\n')
-			self.git_pull(repo_url, repo_path, repo_branch)
+			success = self.git_pull(repo_url, repo_path, repo_branch)
 		else:
 			sys.stdout.write('Cloning project\n')
-			self.git_clone(repo_url, repo_path, repo_branch)
-		sys.stdout.write('.. Done!\n')
+			success = self.git_clone(repo_url, repo_path, repo_branch)
+		sys.stdout.write('.. Done!\n' if success else '.. Failed!\n')
+		return success
@@ -3,22 +3,36 @@ import json
 import time
 import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from libs.metrics import metrics
+from libs.httpcache import HTTPCache
 
 class GithubDownloader:
 	"""
 	Class that implements a downloader for the GitHub API.
 	"""
-	def __init__(self, username, password, check = False):
+	def __init__(self, username, password, check = False, cachedir = None, max_connections = 10, apiurl = "https://api.github.com", cache_max_bytes = 1073741824):
 		"""
 		Initializes this GitHub API Downloader.
 		
 		:param username: the GitHub username.
 		:param password: the GitHub password.
 		:param check: boolean indicating whether the credentials should be checked (True) or not (False).
+		:param cachedir: the path to the directory where the responses of the GitHub API are cached, or None if
+		the responses should not be cached.
+		:param max_connections: the maximum number of connections that are kept alive for reuse.
+		:param apiurl: the base URL of the GitHub API.
+		:param cache_max_bytes: the maximum total size of the cached responses in bytes.
 		"""
+		self.apiurl = apiurl.rstrip('/')
+		self.httpcache = HTTPCache(cachedir, cache_max_bytes) if cachedir else None
 		self.remaining_requests = -1
 		self.resettime = -1
 		self.credentials = (username, password)
+		self.session = requests.Session()
+		self.session.auth = self.credentials
+		self.session.mount('https://', HTTPAdapter(pool_connections = 1, pool_maxsize = max_connections))
+		self.session.mount('http://', HTTPAdapter(pool_connections = 1, pool_maxsize = max_connections))
 		if check and not self.check_credentials(self.credentials):
 			sys.stdout.write("Wrong Credentials!\n")
 			exit()
@@ -39,6 +53,8 @@ class GithubDownloader:
 			sys.stdout.write('\nOops! You have exceeded the requests limit!\nYou have to wait until ' + self.resettime + '..\n')
 			waitsecs = int(resettime) - int(time.time())
 			waitsecs += (20 if is_search else 60)
+			metrics.increment('github_ratelimit_waits_total', resource = 'search' if is_search else 'core')
+			metrics.increment('github_ratelimit_wait_seconds_total', max(waitsecs, 0), resource = 'search' if is_search else 'core')
 			while waitsecs > 0:
 				time.sleep(1)
 				sys.stdout.write('\rRemaining time: %d seconds' % waitsecs)
@@ -53,7 +69,7 @@ class GithubDownloader:
 		:returns: True if the credentials are correct, or False otherwise.
 		"""
 		try:
-			r = requests.get("https://api.github.com/rate_limit", auth = credentials)
+			r = requests.get(self.apiurl + "/rate_limit", auth = credentials)
 			if int(r.status_code) == 200:
 				content = json.loads(r.text or r.content)
 				self.set_request_number(content["resources"]["core"]["remaining"], content["resources"]["core"]["reset"])
@@ -84,8 +100,23 @@ class GithubDownloader:
 					headers = {headers.split(':')[0].strip() : headers.split(':')[1].strip()}
 				else:
 					headers = None
-				r = requests.get(address + parameters, auth = self.credentials, headers = headers)
-				self.set_request_number(r.headers['x-ratelimit-remaining'], r.headers['x-ratelimit-reset'], "api.github.com/search" in address)
+				usecache = self.httpcache and not headers
+				if usecache:
+					# The stored response is kept, since it may be removed from the cache before the server responds
+					entry = self.httpcache.load_entry(address + parameters)
+					headers = self.httpcache.get_conditional_headers(entry) or None
+				resource = 'search' if address.startswith(self.apiurl + "/search") else 'core'
+				with metrics.timer('github_request_seconds', resource = resource):
+					r = self.session.get(address + parameters, headers = headers)
+				metrics.increment('github_requests_total', resource = resource, status = r.status_code)
+				metrics.increment('github_response_bytes_total', len(r.content), resource = resource)
+				self.set_request_number(r.headers['x-ratelimit-remaining'], r.headers['x-ratelimit-reset'], resource == 'search')
+				if usecache:
+					if int(r.status_code) == 304:
+						metrics.increment('github_cache_hits_total', resource = resource)
+						r = self.httpcache.load_response(entry, r)
+					else:
+						self.httpcache.store_response(address + parameters, r)
 				return r
 			except TimeoutError:
 				return None
@@ -97,7 +128,7 @@ class GithubDownloader:
 		:param address: the URL of the GitHub request.
 		:param parameters: the parameters of the GitHub request.
 		:param headers: the headers of the GitHub request.
-		:returns: the contents of the response of the request.
+		:returns: the contents of the response of the request, or None if the object is not found.
 		"""
 		r = self.download_request(address, parameters, headers)
 		if r.ok:
@@ -105,6 +136,9 @@ class GithubDownloader:
 			if type(content) == dict and 'ETag' in r.headers:
 				content['ETag'] = r.headers['ETag']
 			return content  # if not isinstance(content, list) else content[0]
+		elif int(r.status_code) != 404:
+			# Errors other than a missing object (e.g. server errors) are raised, so that they are not taken for a missing object
+			r.raise_for_status()
 
 	def update_object(self, originalobject, address, parameters = None):
 		"""
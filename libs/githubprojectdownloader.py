@@ -8,6 +8,8 @@ class GithubProjectDownloader(GithubDownloader):
 	"""
 	Implements a project information downloader for GitHub.
 	"""
+	indexingpolicy = None
+
 	def download_most_important_repos(self, language, numrepos, sort = "stars", starting_from = 0, use_api = True):
 		"""
 		Retrieves a list with the most important repositories of GitHub.
@@ -24,7 +26,7 @@ class GithubProjectDownloader(GithubDownloader):
 		if numrepos + starting_from > 300 or starting_from > 0:
 			use_api = False
 		if use_api:
-			address = "https://api.github.com/search/repositories"
+			address = self.apiurl + "/search/repositories"
 			pagenum = 1
 			reponum = 1
 			parameters = ["page=" + str(pagenum), "q=language:" + language, "sort=" + sort, "order=desc", "per_page=100"]
@@ -59,45 +61,82 @@ class GithubProjectDownloader(GithubDownloader):
 					bandanger = True
 		return repourls
 
-	def download_project(self, project_id):
+	def create_project_document(self, project):
+		"""
+		Creates the document of a project given its GitHub information.
+		
+		:param project: the JSON object of the project as returned by the GitHub API.
+		:returns: a JSON object containing the main information of the project.
+		"""
+		projectdoc = {}
+		# projectdoc['_id'] = project['owner']['login'] + '/' + project['name']
+		projectdoc['fullname'] = project['owner']['login'] + '/' + project['name']
+		projectdoc['default_branch'] = project['default_branch']
+		projectdoc['trees_url'] = project['trees_url']
+		projectdoc['url'] = project['url']
+		projectdoc['user'] = project['owner']['login']
+		projectdoc['name'] = project['name']
+		projectdoc['git_url'] = project['git_url']
+		return projectdoc
+
+	def create_file_document(self, projectdoc, afile):
+		"""
+		Creates the document of a file of a project given its entry in the git tree of the project.
+		
+		:param projectdoc: the JSON object of the project.
+		:param afile: the tree entry of the file, containing its path, mode, sha, type and (optionally) url.
+		:returns: a JSON object containing the information of the file.
+		"""
+		newfile = {}
+		# newfile['_id'] = project['_id'] + '/' + afile['path']
+		newfile['fullpathname'] = projectdoc['fullname'] + '/' + afile['path']
+		newfile['project'] = projectdoc['fullname']
+		newfile['mode'] = afile['mode']
+		newfile['path'] = afile['path']
+		newfile['name'] = os.path.basename(afile['path'])
+		newfile['sha'] = afile['sha']
+		newfile['type'] = afile['type']
+		newfile['extension'] = '' if len(afile['path'].split('.')) <= 1 else afile['path'].split('.')[-1]
+		if 'url' in afile:
+			newfile['url'] = afile['url']
+		elif afile['type'] in ('blob', 'tree'):
+			newfile['url'] = projectdoc['url'] + '/git/' + afile['type'] + 's/' + afile['sha']
+		else:
+			newfile['url'] = ''
+		return newfile
+
+	def create_file_documents(self, projectdoc, tree):
+		"""
+		Creates the documents of the files of a project given the entries of its git tree. If an indexing policy is
+		set, then only the entries that are indexed according to the policy are included.
+		
+		:param projectdoc: the JSON object of the project.
+		:param tree: the list of the tree entries of the project.
+		:returns: a list containing the JSON objects of the files.
+		"""
+		return [self.create_file_document(projectdoc, afile) for afile in tree if self.indexingpolicy is None or self.indexingpolicy.is_indexed(afile)]
+
+	def download_project(self, project_id, include_tree = True):
 		"""
 		Downloads GitHub information about a project.
 		
 		:param project_id: the project id for which information is downloaded.
-		:returns: a JSON object containing the main information of the project and a list containing the filenames of its files.
+		:param include_tree: boolean indicating whether the tree of the project is downloaded (True) or not (False).
+		:returns: a JSON object containing the main information of the project and a list containing the filenames of its files,
+		or None instead of the list if the tree is not downloaded.
 		"""
-		project = self.download_object("https://api.github.com/repos/" + project_id)
+		project = self.download_object(self.apiurl + "/repos/" + project_id)
 		if project != None:
 			sys.stdout.write('.')
+			if not include_tree:
+				return self.create_project_document(project), None
 			if project['default_branch'] == 'master':
 				sourcecode = self.download_object(project['trees_url'].split('{')[0] + '/master', ["recursive=1"])
 			else:
 				branch = self.download_object(project['url'] + '/branches/' + project['default_branch'], ["recursive=1"])
 				sys.stdout.write('.')
 				sourcecode = self.download_object(project['trees_url'].split('{')[0] + '/' + branch['commit']['sha'], ["recursive=1"])
-			projectdoc = {}
-			# projectdoc['_id'] = project['owner']['login'] + '/' + project['name']
-			projectdoc['fullname'] = project['owner']['login'] + '/' + project['name']
-			projectdoc['default_branch'] = project['default_branch']
-			projectdoc['trees_url'] = project['trees_url']
-			projectdoc['url'] = project['url']
-			projectdoc['user'] = project['owner']['login']
-			projectdoc['name'] = project['name']
-			projectdoc['git_url'] = project['git_url']
-			sourcedocs = []
-			for afile in sourcecode['tree']:
-				newfile = {}
-				# newfile['_id'] = project['_id'] + '/' + afile['path']
-				newfile['fullpathname'] = projectdoc['fullname'] + '/' + afile['path']
-				newfile['project'] = projectdoc['fullname']
-				newfile['mode'] = afile['mode']
-				newfile['path'] = afile['path']
-				newfile['name'] = os.path.basename(afile['path'])
-				newfile['sha'] = afile['sha']
-				newfile['type'] = afile['type']
-				newfile['extension'] = '' if len(afile['path'].split('.')) <= 1 else afile['path'].split('.')[-1]
-				newfile['url'] = afile['url'] if 'url' in afile else ''
-				sourcedocs.append(newfile)
-			return projectdoc, sourcedocs
+			projectdoc = self.create_project_document(project)
+			return projectdoc, self.create_file_documents(projectdoc, sourcecode['tree'])
 		else:
 			return None, None
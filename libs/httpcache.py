@@ -0,0 +1,92 @@
+import os
+import hashlib
+from libs.diskcache import DiskCache
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+class HTTPCache(DiskCache):
+	"""
+	Class that implements an on-disk cache of HTTP responses. The responses are stored along with their validators
+	(ETag and Last-Modified), so that they can be revalidated using conditional requests and served from the cache
+	when the server responds with 304 Not Modified. When the total size of the cache exceeds a limit, the least
+	recently used responses are removed.
+	"""
+	stored_headers = ['ETag', 'Last-Modified', 'Link', 'Content-Type']
+
+	def get_path(self, url):
+		"""
+		Returns the path of the file where the response of a URL is stored.
+
+		:param url: the URL of the request.
+		:returns: the path of the file of the response.
+		"""
+		key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+		return os.path.join(self.cachedir, key[:2], key[2:] + '.json')
+
+	def load_entry(self, url):
+		"""
+		Loads the stored response of a URL. The loaded response must be kept by the caller until the request is
+		completed, since the stored response may be removed in the meantime.
+
+		:param url: the URL of the request.
+		:returns: a dict containing the headers and the content of the response, or None if it is not stored.
+		"""
+		entry = self.read_entry(self.get_path(url))
+		return entry if entry is not None and entry.get('url') == url and 'content' in entry else None
+
+	def get_conditional_headers(self, entry):
+		"""
+		Returns the headers that make a request conditional on its stored response.
+
+		:param entry: the stored response of the request as returned by load_entry, or None if it is not stored.
+		:returns: a dict with the If-None-Match and/or the If-Modified-Since headers, or an empty dict if no
+		response is stored.
+		"""
+		headers = {}
+		if entry:
+			if 'ETag' in entry['headers']:
+				headers['If-None-Match'] = entry['headers']['ETag']
+			if 'Last-Modified' in entry['headers']:
+				headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+		return headers
+
+	def store_response(self, url, response):
+		"""
+		Stores a successful response if it has any validators.
+
+		:param url: the URL of the request.
+		:param response: the response of the request.
+		"""
+		headers = {header: response.headers[header] for header in self.stored_headers if header in response.headers}
+		if response.status_code != 200 or not ('ETag' in headers or 'Last-Modified' in headers):
+			return
+		try:
+			content = response.content.decode('utf-8')
+		except UnicodeDecodeError:
+			content = None
+		if content is not None:
+			self.write_entry(self.get_path(url), {'url': url, 'headers': headers, 'content': content})
+		with self.lock:
+			self.misses += 1
+
+	def load_response(self, entry, notmodified):
+		"""
+		Creates a response from the stored response of a request. This function is called when the server responds
+		with 304 Not Modified.
+
+		:param entry: the stored response of the request as returned by load_entry, or None if it is not stored.
+		:param notmodified: the 304 response of the server, of which the headers are kept.
+		:returns: the stored response with status 200, or the given response if no response is stored.
+		"""
+		if entry is None:
+			return notmodified
+		response = Response()
+		response.status_code = 200
+		response.url = entry['url']
+		response.encoding = 'utf-8'
+		response.headers = CaseInsensitiveDict(notmodified.headers)
+		response.headers.update(entry['headers'])
+		response._content = entry['content'].encode('utf-8')
+		with self.lock:
+			self.hits += 1
+		return response
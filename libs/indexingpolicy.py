@@ -0,0 +1,89 @@
+import threading
+from fnmatch import fnmatch
+from libs.metrics import metrics
+from libs.filefunctions import load_file_to_json
+
+class IndexingPolicy:
+	"""
+	Class that implements a policy that selects which entries of the git tree of a project are indexed. The policy
+	is applied to the tree entries before any file is read or parsed, and counts the skipped entries per rule.
+	"""
+	rules = ('type', 'mode', 'size', 'include', 'exclude', 'vendored', 'generated')
+
+	def __init__(self, policy):
+		"""
+		Initializes this indexing policy.
+
+		:param policy: a dict with the rules of the policy, i.e. the allowed git types ('types'), the excluded git
+		modes ('excludemodes'), the maximum blob size in bytes ('maxsize'), the globs of the paths that are included
+		('include') and excluded ('exclude'), and the names of the vendored ('vendoreddirectories') and generated
+		('generateddirectories') directories. Any missing rule does not exclude any entries.
+		"""
+		self.types = set(policy.get('types', []))
+		self.excludemodes = set(policy.get('excludemodes', []))
+		self.maxsize = int(policy.get('maxsize', 0))
+		self.include = policy.get('include', [])
+		self.exclude = policy.get('exclude', [])
+		self.vendoreddirectories = set(policy.get('vendoreddirectories', []))
+		self.generateddirectories = set(policy.get('generateddirectories', []))
+		self.lock = threading.Lock()
+		self.counters = {rule: 0 for rule in self.rules}
+
+	@classmethod
+	def from_file(cls, filename):
+		"""
+		Creates an indexing policy given a JSON file with its rules.
+
+		:param filename: the filename of the file with the rules of the policy.
+		:returns: an IndexingPolicy object.
+		"""
+		return cls(load_file_to_json(filename))
+
+	def get_skip_rule(self, entry):
+		"""
+		Finds the rule of this policy that excludes a tree entry.
+
+		:param entry: the tree entry, containing its path, mode, type and (optionally) size.
+		:returns: the name of the rule that excludes the entry, or None if the entry is indexed.
+		"""
+		path = entry['path']
+		directories = path.split('/')[:-1]
+		if self.types and entry.get('type') not in self.types:
+			return 'type'
+		if entry.get('mode') in self.excludemodes:
+			return 'mode'
+		if self.maxsize and entry.get('size', 0) > self.maxsize:
+			return 'size'
+		if self.include and not any(fnmatch(path, pattern) for pattern in self.include):
+			return 'include'
+		if any(fnmatch(path, pattern) for pattern in self.exclude):
+			return 'exclude'
+		if any(directory in self.vendoreddirectories for directory in directories):
+			return 'vendored'
+		if any(directory in self.generateddirectories for directory in directories):
+			return 'generated'
+		return None
+
+	def is_indexed(self, entry):
+		"""
+		Checks whether a tree entry is indexed according to this policy, counting it if it is skipped.
+
+		:param entry: the tree entry, containing its path, mode, type and (optionally) size.
+		:returns: True if the entry is indexed, or False otherwise.
+		"""
+		rule = self.get_skip_rule(entry)
+		if rule is None:
+			return True
+		with self.lock:
+			self.counters[rule] += 1
+		metrics.increment('files_skipped_total', rule = rule)
+		return False
+
+	def get_statistics(self):
+		"""
+		Returns the number of entries that were skipped by each rule of this policy.
+
+		:returns: a dict mapping the names of the rules to the number of skipped entries.
+		"""
+		with self.lock:
+			return dict(self.counters)
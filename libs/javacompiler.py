@@ -1,25 +1,77 @@
+import os
 import json
-from libs.astparser import ASTParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from libs.metrics import metrics
+from libs.astparser import ASTParserPool
+from libs.filefunctions import compute_git_blob_sha
+from libs.astcache import ASTCache, compute_parser_version
 
 class JavaCompiler:
 	"""
 	Implements an API for a Java compiler.
 	"""
-	def __init__(self, parser_executable):
+	def __init__(self, parser_executable, num_parsers = 1, cachedir = None, cache_max_bytes = 1073741824, protocol = 'base64', compress = False, java_command = 'java'):
 		"""
 		Initializes this Java compiler.
 		
 		:param parser_executable: the path to the Java Compiler executable.
+		:param num_parsers: the number of parsers that are used to parse files in parallel.
+		:param cachedir: the path to the directory where the ASTs of the parsed files are cached, or None if the
+		ASTs should not be cached.
+		:param cache_max_bytes: the maximum total size of the cached ASTs in bytes.
+		:param protocol: the protocol of the messages exchanged with the parsers, either 'base64' or 'framed'.
+		:param compress: boolean indicating whether large framed messages should be compressed (True) or not (False).
+		:param java_command: the command used to run the parsers.
 		"""
-		self.ast_parser = ASTParser(parser_executable)
+		self.num_parsers = num_parsers
+		self.ast_parser = ASTParserPool(parser_executable, num_parsers, protocol = protocol, compress = compress, java_command = java_command)
+		# Only the ASTs of files that are parsed one at a time are cached, so the version of the cache includes this mode
+		self.ast_cache = ASTCache(cachedir, compute_parser_version(parser_executable) + '-file', cache_max_bytes) if cachedir else None
 
-	def parse_project(self, project_folder):
+	def find_java_files(self, project_folder):
 		"""
-		Parses all the files of a project and returns a unified AST.
+		Finds all the java files of a project.
+
+		:param project_folder: the path of the project of which the java files are found.
+		:returns: a list with the paths of the java files of the project.
+		"""
+		project_folder = project_folder.replace('\\', '/')
+		filepaths = []
+		for dirpath, dirnames, filenames in os.walk(project_folder):
+			dirnames[:] = [dirname for dirname in dirnames if dirname != '.git']
+			for filename in filenames:
+				if filename.endswith('.java'):
+					filepaths.append(project_folder + '/' + os.path.relpath(os.path.join(dirpath, filename), project_folder).replace(os.sep, '/'))
+		return filepaths
+
+	def try_parse_file(self, filepath, sha = None):
+		"""
+		Parses a java file and returns its AST, or None if the file cannot be parsed.
+
+		:param filepath: the filename of the java file to be parsed.
+		:param sha: the git blob sha of the java file, or None if it must be computed from the file.
+		:returns: a string containing the AST of the java file in JSON format, or None if the file cannot be parsed.
+		"""
+		try:
+			return self.parse_file(filepath, sha)
+		except ValueError:
+			return None
+
+	def parse_project(self, project_folder, shas = None):
+		"""
+		Parses all the files of a project and returns a unified AST. If more than one parsers are used or the ASTs
+		are cached, then the files of the project are always parsed one at a time (and in parallel), so that the
+		ASTs do not depend on which files are cached. Otherwise, the project is parsed as a folder.
 
 		:param project_folder: the path of the project of which the files are parsed.
-		:returns: an AST containing all the files of a project in JSON format.
+		:param shas: a dict mapping the filenames of the java files to their git blob shas, or None if the shas
+		must be computed from the files.
+		:returns: an AST containing all the files of a project in JSON format. When the files are parsed one at a
+		time, the files that cannot be parsed are included with None as their AST.
 		"""
+		if self.num_parsers > 1 or self.ast_cache:
+			return dict(self.parse_files(self.find_java_files(project_folder), shas))
 		data = self.ast_parser.parse_folder(project_folder)
 		data = data.replace('\\', '/')
 		data = json.loads(data)
@@ -27,18 +79,118 @@ class JavaCompiler:
 			data[afilename] = self.delete_nested_inner_classes(data[afilename])
 		return data
 
-	def parse_file(self, filepath):
+	def iterparse_files(self, filepaths, shas = None):
+		"""
+		Parses a sequence of java files and yields their ASTs one at a time, in the order of the files. Only a few
+		files per parser are parsed ahead of the consumer, so that the ASTs of a project are never all kept in memory.
+
+		:param filepaths: an iterable of the filenames of the java files to be parsed.
+		:param shas: a dict mapping the filenames of the java files to their git blob shas, or None if the shas
+		must be computed from the files.
+		:returns: a generator of tuples of the form (filepath, ast), where ast is None if the file cannot be parsed.
+		"""
+		with ThreadPoolExecutor(self.num_parsers) as executor:
+			pending = deque()
+			for filepath in filepaths:
+				pending.append((filepath, executor.submit(self.try_parse_file, filepath, (shas or {}).get(filepath))))
+				if len(pending) >= 2 * self.num_parsers:
+					filepath, future = pending.popleft()
+					yield filepath, future.result()
+			while pending:
+				filepath, future = pending.popleft()
+				yield filepath, future.result()
+
+	def parse_files(self, filepaths, shas = None):
+		"""
+		Parses many java files and yields their ASTs as soon as they are available. The cached ASTs are yielded
+		first, while the rest of the files are sent to the parsers in batches, so that the parsers do not wait for
+		each file to be returned before receiving the next one.
+
+		:param filepaths: an iterable of the filenames of the java files to be parsed.
+		:param shas: a dict mapping the filenames of the java files to their git blob shas, or None if the shas
+		must be computed from the files.
+		:returns: a generator of tuples of the form (filepath, ast) in the order in which the files are parsed,
+		where ast is None if the file cannot be parsed.
+		"""
+		shas = shas or {}
+		missingfilepaths = []
+		for filepath in filepaths:
+			ast = self.get_cached_ast(filepath, shas.get(filepath))
+			if ast is not None:
+				yield filepath, ast
+			else:
+				missingfilepaths.append(filepath)
+		for filepath, ast in self.parse_uncached_files(missingfilepaths, shas):
+			yield filepath, ast
+
+	def parse_uncached_files(self, filepaths, shas = None):
+		"""
+		Sends many java files to the parsers in batches and yields their ASTs as soon as they are available. The
+		ASTs are stored in the cache.
+
+		:param filepaths: a list of the filenames of the java files to be parsed.
+		:param shas: a dict mapping the filenames of the java files to their git blob shas, or None if the shas
+		must be computed from the files.
+		:returns: a generator of tuples of the form (filepath, ast) in the order in which the files are parsed,
+		where ast is None if the file cannot be parsed.
+		"""
+		shas = shas or {}
+		for filepath, response in self.ast_parser.parse_files(filepaths):
+			try:
+				data = self.delete_nested_inner_classes(json.loads(response))
+			except ValueError:
+				yield filepath, None
+				continue
+			self.put_cached_ast(filepath, data, shas.get(filepath))
+			yield filepath, data
+
+	def parse_file(self, filepath, sha = None):
 		"""
 		Parses a java file and returns its AST.
 
 		:param filepath: the filename of the java file to be parsed.
+		:param sha: the git blob sha of the java file, or None if it must be computed from the file.
 		:returns: a string containing the AST of the java file in JSON format.
 		"""
-		data = self.ast_parser.parse_file(filepath)
-		data = json.loads(data)
-		data = self.delete_nested_inner_classes(data)
+		data = self.get_cached_ast(filepath, sha)
+		if data is None:
+			data = self.ast_parser.parse_file(filepath)
+			data = json.loads(data)
+			data = self.delete_nested_inner_classes(data)
+			self.put_cached_ast(filepath, data, sha)
 		return data
 
+	def get_cached_ast(self, filepath, sha = None):
+		"""
+		Returns the cached AST of a java file, using the git blob sha of the file as key.
+
+		:param filepath: the filename of the java file.
+		:param sha: the git blob sha of the java file, or None if it must be computed from the file.
+		:returns: the AST of the java file in JSON format, or None if the AST is not cached.
+		"""
+		if self.ast_cache:
+			try:
+				data = self.ast_cache.get(sha or compute_git_blob_sha(filepath))
+			except OSError:
+				return None
+			metrics.increment('ast_cache_hits_total' if data is not None else 'ast_cache_misses_total')
+			return data
+		return None
+
+	def put_cached_ast(self, filepath, data, sha = None):
+		"""
+		Stores the AST of a java file in the cache, using the git blob sha of the file as key.
+
+		:param filepath: the filename of the java file.
+		:param data: the AST of the java file in JSON format.
+		:param sha: the git blob sha of the java file, or None if it must be computed from the file.
+		"""
+		if self.ast_cache:
+			try:
+				self.ast_cache.put(sha or compute_git_blob_sha(filepath), data)
+			except OSError:
+				pass
+
 	def delete_nested_inner_classes(self, data):
 		"""
 		Deletes the nested inner classes of an AST.
@@ -0,0 +1,197 @@
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+class Histogram:
+	"""
+	Class that implements a histogram of observed values with fixed bucket boundaries, following the
+	conventions of Prometheus.
+	"""
+	boundaries = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+	def __init__(self):
+		"""
+		Initializes this histogram.
+		"""
+		self.bucketcounts = [0] * (len(self.boundaries) + 1)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		"""
+		Adds a value to this histogram.
+
+		:param value: the value to be added.
+		"""
+		index = len(self.boundaries)
+		for i, boundary in enumerate(self.boundaries):
+			if value <= boundary:
+				index = i
+				break
+		self.bucketcounts[index] += 1
+		self.count += 1
+		self.sum += value
+
+class Metrics:
+	"""
+	Class that implements a registry of counters and histograms. Each metric is identified by its name and its
+	labels, e.g. the stage or the operation that it measures. The registry can be exported as a dict or in the
+	text format of Prometheus, which is optionally served over HTTP. The counters that are incremented while
+	processing an item (e.g. a project) can also be attributed to the item.
+	"""
+	def __init__(self):
+		"""
+		Initializes this registry.
+		"""
+		self.counters = {}
+		self.histograms = {}
+		self.lock = threading.Lock()
+		self.server = None
+		self.attributed = contextvars.ContextVar('attributed', default = None)
+
+	def increment(self, name, value = 1, **labels):
+		"""
+		Increments a counter, as well as the counter with the same name that is attributed to the current item, if any.
+
+		:param name: the name of the counter.
+		:param value: the value to be added to the counter.
+		:param labels: the labels of the counter.
+		"""
+		key = (name, tuple(sorted(labels.items())))
+		attributed = self.attributed.get()
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+			if attributed is not None:
+				attributed[name] = attributed.get(name, 0) + value
+
+	@contextmanager
+	def attribute(self, counters):
+		"""
+		Attributes the counters that are incremented in a block of code to an item, by adding them to a dict
+		regardless of their labels. The counters are attributed only in the current thread or asyncio task.
+
+		:param counters: the dict of the counters of the item, which maps their names to their values.
+		"""
+		token = self.attributed.set(counters)
+		try:
+			yield
+		finally:
+			self.attributed.reset(token)
+
+	def observe(self, name, value, **labels):
+		"""
+		Adds a value to a histogram.
+
+		:param name: the name of the histogram.
+		:param value: the value to be added.
+		:param labels: the labels of the histogram.
+		"""
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			if key not in self.histograms:
+				self.histograms[key] = Histogram()
+			self.histograms[key].observe(value)
+
+	@contextmanager
+	def timer(self, name, **labels):
+		"""
+		Measures the time spent in a block of code and adds it to a histogram in seconds.
+
+		:param name: the name of the histogram.
+		:param labels: the labels of the histogram.
+		"""
+		started = time.time()
+		try:
+			yield
+		finally:
+			self.observe(name, time.time() - started, **labels)
+
+	def get_statistics(self):
+		"""
+		Returns the values of all metrics.
+
+		:returns: a dict containing a list of the counters and a list of the histograms, where each metric is a
+		dict with its name, its labels and its values.
+		"""
+		with self.lock:
+			counters = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self.counters.items())]
+			histograms = [{'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum}
+				for (name, labels), histogram in sorted(self.histograms.items(), key = lambda item: item[0])]
+		return {'counters': counters, 'histograms': histograms}
+
+	def to_prometheus(self):
+		"""
+		Exports all metrics in the text format of Prometheus.
+
+		:returns: a string containing the metrics.
+		"""
+		def format_labels(labels, extra = ()):
+			labels = list(labels) + list(extra)
+			return '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels) + '}' if labels else ''
+		lines = []
+		with self.lock:
+			for (name, labels), value in sorted(self.counters.items()):
+				lines.append('agora_%s%s %s' % (name, format_labels(labels), value))
+			for (name, labels), histogram in sorted(self.histograms.items(), key = lambda item: item[0]):
+				cumulative = 0
+				for boundary, count in zip(histogram.boundaries + ('+Inf',), histogram.bucketcounts):
+					cumulative += count
+					lines.append('agora_%s_bucket%s %d' % (name, format_labels(labels, [('le', boundary)]), cumulative))
+				lines.append('agora_%s_sum%s %f' % (name, format_labels(labels), histogram.sum))
+				lines.append('agora_%s_count%s %d' % (name, format_labels(labels), histogram.count))
+		return '\n'.join(lines) + '\n'
+
+	def start_server(self, port, host = '127.0.0.1'):
+		"""
+		Serves the metrics in the text format of Prometheus at http://host:port/metrics from a separate thread.
+
+		:param port: the port of the server.
+		:param host: the address of the server.
+		"""
+		registry = self
+		class MetricsHandler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] != '/metrics':
+					self.send_error(404)
+					return
+				body = registry.to_prometheus().encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+			def log_message(self, *args):
+				pass
+		self.server = HTTPServer((host, int(port)), MetricsHandler)
+		thread = threading.Thread(target = self.server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+class MetricsReport:
+	"""
+	Class that writes a machine-readable report of a run, where each record is a JSON object in a separate line.
+	"""
+	def __init__(self, path):
+		"""
+		Initializes this report.
+
+		:param path: the path of the file of the report, to which the records are appended.
+		"""
+		self.path = path
+		self.lock = threading.Lock()
+
+	def write(self, record):
+		"""
+		Appends a record to the report.
+
+		:param record: the record to be written in JSON format.
+		"""
+		record = dict(record, time = time.time())
+		with self.lock:
+			with open(self.path, 'a') as outfile:
+				outfile.write(json.dumps(record) + '\n')
+
+metrics = Metrics()
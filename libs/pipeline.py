@@ -0,0 +1,89 @@
+import sys
+import queue
+import threading
+
+class Pipeline:
+	"""
+	Class that implements a pipeline of stages that are executed concurrently. Each stage has its own worker
+	threads and passes its results to the next stage through a bounded queue, so that all stages are kept busy
+	without loading too many items in memory.
+	"""
+	_END = object()
+
+	def __init__(self, queue_size = 2):
+		"""
+		Initializes this pipeline.
+
+		:param queue_size: the maximum number of items waiting between two consecutive stages.
+		"""
+		self.queue_size = queue_size
+		self.stages = []
+		self.failures = []
+		self.lock = threading.Lock()
+
+	def add_stage(self, name, function, num_workers = 1):
+		"""
+		Adds a stage at the end of the pipeline.
+
+		:param name: the name of the stage.
+		:param function: the function of the stage, which receives an item and returns the item to be passed to
+		the next stage or None if the item should not be processed further.
+		:param num_workers: the number of threads that execute the stage.
+		"""
+		self.stages.append({'name': name, 'function': function, 'num_workers': max(1, int(num_workers))})
+
+	def run_worker(self, stage, inqueue, outqueue, numnextworkers, remaining):
+		"""
+		Executes the function of a stage for the items of its input queue until the end of the input is reached.
+
+		:param stage: the stage executed by this worker.
+		:param inqueue: the queue from which the items of the stage are received.
+		:param outqueue: the queue to which the results of the stage are sent, or None for the last stage.
+		:param numnextworkers: the number of workers of the next stage.
+		:param remaining: a list containing the number of workers of the stage that are still running.
+		"""
+		while True:
+			item = inqueue.get()
+			if item is Pipeline._END:
+				break
+			try:
+				result = stage['function'](item)
+			except Exception as e:
+				sys.stdout.write('\nStage \'%s\' failed: %s\n' % (stage['name'], e))
+				with self.lock:
+					self.failures.append((stage['name'], item, e))
+				result = None
+			if result is not None and outqueue is not None:
+				outqueue.put(result)
+		with self.lock:
+			remaining[0] -= 1
+			islastworker = remaining[0] == 0
+		if islastworker and outqueue is not None:
+			for _ in range(numnextworkers):
+				outqueue.put(Pipeline._END)
+
+	def run(self, items):
+		"""
+		Passes a list of items through all the stages of the pipeline and waits until all of them are processed.
+
+		:param items: an iterable of the items given to the first stage.
+		:returns: a list of the failures as tuples of the form (stagename, item, exception).
+		"""
+		queues = [queue.Queue(self.queue_size) for _ in self.stages]
+		threads = []
+		for i, stage in enumerate(self.stages):
+			outqueue = queues[i + 1] if i + 1 < len(self.stages) else None
+			numnextworkers = self.stages[i + 1]['num_workers'] if i + 1 < len(self.stages) else 0
+			remaining = [stage['num_workers']]
+			for _ in range(stage['num_workers']):
+				thread = threading.Thread(target = self.run_worker, args = (stage, queues[i], outqueue, numnextworkers, remaining))
+				thread.daemon = True
+				thread.start()
+				threads.append(thread)
+		for item in items:
+			queues[0].put(item)
+		for _ in range(self.stages[0]['num_workers']):
+			queues[0].put(Pipeline._END)
+		for thread in threads:
+			thread.join()
+		return self.failures
@@ -0,0 +1,116 @@
+import os
+import time
+import sqlite3
+import threading
+
+class RunJournal:
+	"""
+	Class that implements a persistent journal of a run of adding many projects. The journal is an SQLite database
+	that records the stage, the status and the number of attempts of each project, so that an interrupted run can be
+	resumed without processing again the projects that are finished, while the failed ones are retried.
+	"""
+	finished_statuses = ('indexed', 'skipped')
+
+	def __init__(self, path):
+		"""
+		Initializes this run journal, creating its database if it does not exist.
+
+		:param path: the path of the database file of the journal.
+		"""
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+		self.path = path
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, check_same_thread = False)
+		with self.lock, self.connection:
+			self.connection.execute("CREATE TABLE IF NOT EXISTS projects (project_id TEXT PRIMARY KEY, address TEXT, stage TEXT, "
+				"status TEXT, attempts INTEGER, error TEXT, updated REAL)")
+
+	def clear(self):
+		"""
+		Removes all the projects from this journal, so that the run starts from the beginning.
+		"""
+		with self.lock, self.connection:
+			self.connection.execute("DELETE FROM projects")
+
+	def add_projects(self, project_addresses):
+		"""
+		Adds the projects of a run to this journal. Any projects that already exist keep their status.
+
+		:param project_addresses: a list of project addresses.
+		"""
+		with self.lock, self.connection:
+			self.connection.executemany("INSERT OR IGNORE INTO projects VALUES (?, ?, NULL, 'pending', 0, NULL, ?)",
+				[('/'.join(address.split('/')[-2:]), address, time.time()) for address in project_addresses])
+
+	def reset_attempts(self):
+		"""
+		Resets the number of attempts of the projects that are not finished, so that each run of the journal
+		attempts them up to the maximum number of attempts.
+		"""
+		with self.lock, self.connection:
+			self.connection.execute("UPDATE projects SET attempts = 0 WHERE status NOT IN (?, ?)", self.finished_statuses)
+
+	def start_attempt(self, project_addresses):
+		"""
+		Marks the beginning of a new attempt to add some projects.
+
+		:param project_addresses: a list of project addresses.
+		"""
+		with self.lock, self.connection:
+			self.connection.executemany("UPDATE projects SET attempts = attempts + 1, status = 'pending', updated = ? WHERE project_id = ?",
+				[(time.time(), '/'.join(address.split('/')[-2:])) for address in project_addresses])
+
+	def set_stage(self, project_id, stage):
+		"""
+		Records that a project has entered a stage.
+
+		:param project_id: the id of the project.
+		:param stage: the name of the stage.
+		"""
+		with self.lock, self.connection:
+			self.connection.execute("UPDATE projects SET stage = ?, status = 'running', updated = ? WHERE project_id = ?", (stage, time.time(), project_id))
+
+	def set_status(self, project_id, stage, status, error = None):
+		"""
+		Records the final status of a project in the current attempt.
+
+		:param project_id: the id of the project.
+		:param stage: the name of the stage where the project was indexed, skipped or failed.
+		:param status: the status of the project, i.e. 'indexed', 'skipped' or 'failed'.
+		:param error: the error that caused the project to fail, if any.
+		"""
+		with self.lock, self.connection:
+			self.connection.execute("UPDATE projects SET stage = ?, status = ?, error = ?, updated = ? WHERE project_id = ?",
+				(stage, status, error, time.time(), project_id))
+
+	def get_unfinished_projects(self, max_attempts = None):
+		"""
+		Returns the projects that are not finished and may be attempted again.
+
+		:param max_attempts: the maximum number of attempts of each project, or None to return all the projects that
+		are not finished regardless of their attempts.
+		:returns: a list with the addresses of the projects in the order in which they were added.
+		"""
+		with self.lock:
+			if max_attempts is None:
+				rows = self.connection.execute("SELECT address FROM projects WHERE status NOT IN (?, ?) ORDER BY rowid", self.finished_statuses).fetchall()
+			else:
+				rows = self.connection.execute("SELECT address FROM projects WHERE status NOT IN (?, ?) AND attempts < ? ORDER BY rowid",
+					self.finished_statuses + (max_attempts, )).fetchall()
+		return [row[0] for row in rows]
+
+	def get_statistics(self):
+		"""
+		Returns the number of projects of this journal per status.
+
+		:returns: a dict mapping each status to the number of projects that have it.
+		"""
+		with self.lock:
+			return dict(self.connection.execute("SELECT status, COUNT(*) FROM projects GROUP BY status").fetchall())
+
+	def close(self):
+		"""
+		Closes the database of this journal.
+		"""
+		with self.lock:
+			self.connection.close()
@@ -1,3 +1,4 @@
+import os
 import sys
 from configparser import ConfigParser
 from libs.filefunctions import read_file_in_lines
@@ -11,11 +12,20 @@ def print_usage():
 	print("where arg can be one of the following:")
 	print("   create_index: creates the index and the mappings")
 	print("   add_project name: adds or updates a project given its github url")
-	print("   add_projects file: adds or updates projects given a list of github urls (in a txt file)")
+	print("   add_projects file [restart]: adds or updates projects given a list of github urls (in a txt file),")
+	print("                                resuming any interrupted run of the same file unless restart is given")
+	print("   update_mappings: reindexes the index into a new version with the current mappings")
+	print("   rebuild_index file [seed]: rebuilds the index in a new version given a list of github urls (in a txt file),")
+	print("                              starting from the documents of the current version if seed is given")
+	print("   delete_old_indices: deletes the previous versions of the index that were kept when it was switched")
 	print("   flush_index: flushes the index")
 	print("   delete_project name: deletes a project given its github url")
 	print("   delete_projects file: deletes projects given a list of github urls (in a txt file)")
 	print("   delete_index: deletes the index and the mappings")
+	print("   create_backup: creates a new snapshot of the index and deletes the snapshots that are not retained")
+	print("   list_backups: lists the snapshots of the index")
+	print("   restore_backup [name]: restores a snapshot (the newest if not given) into a new version of the index")
+	print("   delete_backup [name]: deletes a snapshot of the index (all snapshots if not given)")
 
 if __name__ == "__main__":
 	conparser = ConfigParser()
@@ -30,7 +40,13 @@ if __name__ == "__main__":
 	elif(sys.argv[1] == "add_project"):
 		dbmanager.add_project(sys.argv[2])
 	elif(sys.argv[1] == "add_projects"):
-		dbmanager.add_projects(read_file_in_lines(sys.argv[2]))
+		dbmanager.add_projects(read_file_in_lines(sys.argv[2]), os.path.splitext(os.path.basename(sys.argv[2]))[0], len(sys.argv) > 3 and sys.argv[3] == "restart")
+	elif(sys.argv[1] == "update_mappings"):
+		dbmanager.update_mappings()
+	elif(sys.argv[1] == "rebuild_index"):
+		dbmanager.rebuild_index(read_file_in_lines(sys.argv[2]), os.path.splitext(os.path.basename(sys.argv[2]))[0], len(sys.argv) > 3 and sys.argv[3] == "seed")
+	elif(sys.argv[1] == "delete_old_indices"):
+		dbmanager.delete_old_indices()
 	elif(sys.argv[1] == "flush_index"):
 		dbmanager.flush_index()
 	elif(sys.argv[1] == "delete_project"):
@@ -39,5 +55,13 @@ if __name__ == "__main__":
 		dbmanager.delete_projects(read_file_in_lines(sys.argv[2]))
 	elif(sys.argv[1] == "delete_index"):
 		dbmanager.delete_index()
+	elif(sys.argv[1] == "create_backup"):
+		dbmanager.create_backup()
+	elif(sys.argv[1] == "list_backups"):
+		dbmanager.list_backups()
+	elif(sys.argv[1] == "restore_backup"):
+		dbmanager.restore_backup(sys.argv[2] if len(sys.argv) > 2 else None)
+	elif(sys.argv[1] == "delete_backup"):
+		dbmanager.delete_backup(sys.argv[2] if len(sys.argv) > 2 else None)
 	else:
 		print_usage()
@@ -0,0 +1,70 @@
+import os
+import sys
+import subprocess
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.elasticsearchstub import start_elasticsearch_stub
+
+def run_git(arguments, cwd):
+	"""
+	Runs a git command with a fixed identity and returns its output.
+
+	:param arguments: the arguments of the git command.
+	:param cwd: the directory where the command is executed.
+	:returns: the output of the command as a stripped string.
+	"""
+	environment = dict(os.environ, GIT_AUTHOR_NAME = 'test', GIT_AUTHOR_EMAIL = 'test@example.com',
+		GIT_COMMITTER_NAME = 'test', GIT_COMMITTER_EMAIL = 'test@example.com')
+	return subprocess.check_output(['git'] + arguments, cwd = cwd, env = environment, stderr = subprocess.DEVNULL).decode('utf-8').strip()
+
+def commit_files(repo_path, files, message):
+	"""
+	Writes some files to a working tree and commits them.
+
+	:param repo_path: the path of the working tree.
+	:param files: a dict mapping the relative paths of the files to their contents.
+	:param message: the message of the commit.
+	:returns: the sha of the new commit.
+	"""
+	for path, contents in files.items():
+		os.makedirs(os.path.dirname(os.path.join(repo_path, path)), exist_ok = True)
+		with open(os.path.join(repo_path, path), 'w') as outfile:
+			outfile.write(contents)
+	run_git(['add', '-A'], repo_path)
+	run_git(['commit', '-q', '-m', message], repo_path)
+	return run_git(['rev-parse', 'HEAD'], repo_path)
+
+@pytest.fixture
+def bare_repository(tmp_path):
+	"""
+	Creates a bare repository with three commits on its master branch, which allows partial clones.
+
+	:returns: a dict with the path of the bare repository and of its working tree, and the shas of the commits.
+	"""
+	worktree = str(tmp_path / 'worktree')
+	bare = str(tmp_path / 'origin.git')
+	os.makedirs(worktree)
+	run_git(['init', '-q', '-b', 'master'], worktree)
+	commits = [commit_files(worktree, {'src/A.java': 'class A { int v = %d; }\n' % i}, 'commit %d' % i) for i in range(3)]
+	run_git(['clone', '-q', '--bare', worktree, bare], str(tmp_path))
+	run_git(['config', 'uploadpack.allowFilter', 'true'], bare)
+	run_git(['remote', 'add', 'bare', bare], worktree)
+	return {'path': bare, 'worktree': worktree, 'commits': commits}
+
+@pytest.fixture
+def esclient(monkeypatch):
+	"""
+	Starts an Elasticsearch stub and creates an index with the mappings of the system on it.
+
+	:returns: an ElasticSearchClient for the index, of which the stub and its port are given by esclient.stub and esclient.port.
+	"""
+	from libs.elasticsearchclient import ElasticSearchClient
+	monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	server = start_elasticsearch_stub()
+	client = ElasticSearchClient('127.0.0.1', server.server_address[1], '', '', 'agora-test')
+	client.stub = server.stub
+	client.port = server.server_address[1]
+	client.create_index_and_mappings()
+	yield client
+	server.shutdown()
+	server.server_close()
@@ -0,0 +1,55 @@
+import json
+import pytest
+from benchmarks.benchmark import create_java_command
+from libs.astparser import ASTParser, ASTParserPool
+
+@pytest.fixture
+def java_files(tmp_path):
+	paths = []
+	for i in range(20):
+		path = tmp_path / ('C%d.java' % i)
+		path.write_text('package p;\nclass C%d { void run() { } }\n' % i)
+		paths.append(str(path))
+	return paths
+
+def get_worker_pids(pool):
+	workers = [pool.workers.get() for _ in range(pool.num_workers)]
+	for worker in workers:
+		pool.workers.put(worker)
+	return sorted(worker.proc.pid for worker in workers)
+
+@pytest.mark.parametrize('protocol', ['base64', 'framed'])
+def test_rejected_files_do_not_restart_workers(tmp_path, java_files, protocol):
+	pool = ASTParserPool('astparserstub.jar', 2, protocol = protocol, java_command = create_java_command(str(tmp_path)))
+	try:
+		pids = get_worker_pids(pool)
+		missing = str(tmp_path / 'Missing.java')
+		responses = dict(pool.parse_files(java_files + [missing], window = 4))
+		assert responses.pop(missing) == ""
+		assert {path: json.loads(response)['class']['name'] for path, response in responses.items()} == {path: 'C%d' % i for i, path in enumerate(java_files)}
+		assert pool.parse_file(missing) == ""
+		assert get_worker_pids(pool) == pids
+	finally:
+		pool.close()
+
+@pytest.mark.parametrize('protocol', ['base64', 'framed'])
+def test_dead_workers_are_replaced(tmp_path, java_files, protocol):
+	pool = ASTParserPool('astparserstub.jar', 2, protocol = protocol, java_command = create_java_command(str(tmp_path)))
+	try:
+		for worker in pool.workers.queue:
+			worker.kill_parser()
+		assert json.loads(pool.parse_file(java_files[0]))['class']['name'] == 'C0'
+		responses = dict(pool.parse_files(java_files))
+		assert all(json.loads(responses[path])['class']['name'] == 'C%d' % i for i, path in enumerate(java_files))
+		assert all(worker.is_alive() for worker in pool.workers.queue)
+	finally:
+		pool.close()
+
+def test_base64_requests_are_pipelined(tmp_path, java_files):
+	parser = ASTParser('astparserstub.jar', max_messages = 7, java_command = create_java_command(str(tmp_path)))
+	try:
+		futures = [parser.submit_file(path) for path in java_files]
+		assert len(parser.unread) > 1
+		assert [json.loads(future.result())['class']['name'] for future in reversed(futures)] == ['C%d' % i for i in reversed(range(20))]
+	finally:
+		parser.close()
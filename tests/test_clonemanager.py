@@ -0,0 +1,31 @@
+import os
+from libs.clonemanager import CloneManager
+
+class LocalDownloader:
+	def __init__(self, sourcecodedir):
+		self.sourcecodedir = sourcecodedir
+
+def create_clone(manager, project_id, size, indexed):
+	repo_path = os.path.join(manager.gitdownloader.sourcecodedir, project_id)
+	os.makedirs(repo_path)
+	with open(os.path.join(repo_path, 'data'), 'w') as outfile:
+		outfile.write('x' * size)
+	manager.clones[project_id] = {'path': repo_path, 'size': size, 'used': 1000, 'indexed': indexed}
+	return repo_path
+
+def test_least_recently_indexed_clones_in_the_index_are_evicted(tmp_path):
+	manager = CloneManager(LocalDownloader(str(tmp_path)), disk_budget = 15)
+	indexed = {'user/old': True, 'user/recent': True, 'user/newest': True, 'user/unindexed': False, 'user/deleted': False}
+	for project_id, indexedtime in (('user/recent', 100), ('user/unindexed', None), ('user/deleted', 50), ('user/newest', 300), ('user/old', None)):
+		create_clone(manager, project_id, 10, indexedtime)
+	manager.activeprojects.add('user/newest')
+	assert manager.enforce_disk_budget(indexed.get) == ['user/old', 'user/recent']
+	assert sorted(manager.clones) == ['user/deleted', 'user/newest', 'user/unindexed']
+	assert not os.path.exists(str(tmp_path / 'user' / 'old')) and os.path.exists(str(tmp_path / 'user' / 'unindexed'))
+
+def test_without_index_check_only_journaled_indexed_clones_are_evicted(tmp_path):
+	manager = CloneManager(LocalDownloader(str(tmp_path)), disk_budget = 5)
+	create_clone(manager, 'user/unindexed', 10, None)
+	create_clone(manager, 'user/indexed', 10, 100)
+	assert manager.enforce_disk_budget() == ['user/indexed']
+	assert list(manager.clones) == ['user/unindexed']
@@ -0,0 +1,62 @@
+import os
+import pytest
+from benchmarks.benchmark import create_java_command
+from benchmarks.githubstub import start_github_stub
+from benchmarks.repogenerator import generate_repository, modify_repository
+from libs.runjournal import RunJournal
+
+@pytest.fixture
+def dbmanager(tmp_path, esclient):
+	"""
+	Creates a DBManager that adds the projects of a GitHub stub to the index of the Elasticsearch stub, using the
+	stub parser in place of the ASTParser jar.
+
+	:returns: the DBManager, of which the local repository of the project user/project is given by dbmanager.origin.
+	"""
+	from dbmanager import DBManager
+	origin = str(tmp_path / 'origin' / 'user' / 'project')
+	filepaths = generate_repository(origin, 12, 512)
+	github = start_github_stub({'user/project': {'path': origin, 'branch': 'master'}, 'user/broken': {'path': origin, 'branch': 'master'}})
+	properties = {'sourcecodedir': str(tmp_path / 'src'), 'gitcommand': 'git', 'GitHubUsername': '', 'GitHubPassword': '',
+		'githubapiurl': 'http://127.0.0.1:%d' % github.server_address[1], 'host': '127.0.0.1', 'port': str(esclient.port),
+		'AGORAUsername': '', 'AGORAPassword': '', 'indexname': esclient.indexname, 'backupdir': str(tmp_path / 'backup'),
+		'ASTParserPath': 'astparserstub.jar', 'javacommand': create_java_command(str(tmp_path)), 'rundir': str(tmp_path / 'runs'),
+		'maxattempts': '2', 'retrybackoff': '0', 'gitretries': '0', 'incrementalrefresh': 'True', 'parseworkers': '2', 'indexworkers': '2'}
+	manager = DBManager(properties)
+	manager.origin = origin
+	manager.filepaths = filepaths
+	yield manager
+	manager.javaparser.ast_parser.close()
+	github.shutdown()
+	github.server_close()
+
+def get_journal_statistics(dbmanager, runname):
+	journal = RunJournal(os.path.join(dbmanager.rundir, runname + '.sqlite'))
+	try:
+		return journal.get_statistics()
+	finally:
+		journal.close()
+
+def test_add_projects_indexes_projects_and_journals_failures(dbmanager, esclient, monkeypatch):
+	# The repository of user/broken cannot be cloned, so the project fails in every attempt
+	git_pull_or_clone = dbmanager.gitdownloader.git_pull_or_clone
+	monkeypatch.setattr(dbmanager.gitdownloader, 'git_pull_or_clone', lambda project_id, *arguments: project_id != 'user/broken' and git_pull_or_clone(project_id, *arguments))
+	projects = ['https://github.com/user/project', 'https://github.com/user/missing', 'https://github.com/user/broken']
+	assert dbmanager.add_projects(projects, 'run') == ['user/broken']
+	fileids = esclient.get_project_fileids_and_shas('user/project')
+	assert len([fileid for fileid in fileids if fileid.endswith('.java')]) == 12
+	assert get_journal_statistics(dbmanager, 'run') == {'indexed': 1, 'skipped': 1, 'failed': 1}
+	# A resumed run retries the failed project and keeps the finished ones
+	assert dbmanager.add_projects(projects, 'run') == ['user/broken']
+	assert get_journal_statistics(dbmanager, 'run') == {'indexed': 1, 'skipped': 1, 'failed': 1}
+
+def test_refresh_applies_the_diff(dbmanager, esclient):
+	dbmanager.add_project('https://github.com/user/project')
+	before = esclient.get_project_fileids_and_shas('user/project')
+	modify_repository(dbmanager.origin, dbmanager.filepaths, 3, 512)
+	dbmanager.add_project('https://github.com/user/project')
+	after = esclient.get_project_fileids_and_shas('user/project')
+	expected = set('user/project/' + path for path in dbmanager.filepaths)
+	assert set(fileid for fileid in after if fileid.endswith('.java')) == expected
+	assert after != before
+	assert esclient.get_project('user/project')['last_indexed_commit'] == dbmanager.gitdownloader.get_head_commit(dbmanager.origin)
@@ -0,0 +1,87 @@
+import pytest
+from elasticsearch.exceptions import TransportError
+
+def add_project(esclient, project_id, numfiles):
+	esclient.create_project({'fullname': project_id, 'user': project_id.split('/')[0]})
+	with esclient.bulk_indexer(max_documents = 7) as indexer:
+		for i in range(numfiles):
+			indexer.create_file({'fullpathname': '%s/src/C%d.java' % (project_id, i), 'project': project_id, 'sha': 'sha%d' % i})
+	assert not indexer.failures
+
+def test_index_is_served_through_alias(esclient):
+	versions = esclient.get_aliased_indices()
+	assert len(versions) == 1 and versions[0].startswith('agora-test-')
+	add_project(esclient, 'user/one', 3)
+	assert esclient.has_project('user/one')
+	assert esclient.stub.get_documents(versions[0], 'files').keys() == {'user/one/src/C0.java', 'user/one/src/C1.java', 'user/one/src/C2.java'}
+
+def test_switch_alias_keeps_old_versions_until_deleted(esclient):
+	oldversion = esclient.get_aliased_indices()[0]
+	newversion = esclient.create_versioned_index()
+	esclient.switch_alias(newversion)
+	assert esclient.get_aliased_indices() == [newversion]
+	assert esclient.get_versioned_indices() == sorted([oldversion, newversion])
+	assert esclient.delete_old_versions() == [oldversion]
+	assert esclient.get_versioned_indices() == [newversion]
+	lastversion = esclient.create_versioned_index()
+	esclient.switch_alias(lastversion, delete_old = True)
+	assert esclient.get_versioned_indices() == [lastversion]
+
+def test_rebuild_copies_documents_to_new_version(esclient):
+	add_project(esclient, 'user/one', 3)
+	oldversion = esclient.get_aliased_indices()[0]
+	newversion = esclient.rebuild_index(poll_interval = 0)
+	assert newversion != oldversion and esclient.get_aliased_indices() == [newversion]
+	assert esclient.get_project_fileids_and_shas('user/one') == {'user/one/src/C%d.java' % i: 'sha%d' % i for i in range(3)}
+
+def test_legacy_index_is_replaced_by_alias(esclient):
+	legacyclient = esclient.get_index_client('agora-legacy')
+	esclient.client.indices.create(index = 'agora-legacy')
+	add_project(legacyclient, 'user/one', 2)
+	legacyclient.create_index_and_mappings()
+	versions = legacyclient.get_aliased_indices()
+	assert len(versions) == 1 and versions[0].startswith('agora-legacy-')
+	assert legacyclient.has_project('user/one')
+	assert len(legacyclient.get_project_fileids_and_shas('user/one')) == 2
+
+def test_scroll_returns_files_in_pages(esclient):
+	add_project(esclient, 'user/one', 25)
+	add_project(esclient, 'user/two', 4)
+	pages = list(esclient.iterate_project_fileids_and_shas('user/one', page_size = 10))
+	assert [len(page) for page in pages] == [10, 10, 5]
+	assert dict(fileidandsha for page in pages for fileidandsha in page) == {'user/one/src/C%d.java' % i: 'sha%d' % i for i in range(25)}
+	assert not esclient.stub.scrolls
+
+def test_delete_projects_removes_only_their_files(esclient):
+	add_project(esclient, 'user/one', 5)
+	add_project(esclient, 'user/two', 3)
+	add_project(esclient, 'user/three', 2)
+	assert esclient.delete_projects(['user/one', 'user/three'], batch_size = 1, poll_interval = 0) == 7
+	assert not esclient.has_project('user/one') and not esclient.has_project('user/three')
+	assert esclient.has_project('user/two')
+	assert esclient.get_project_fileids_and_shas('user/one') == {}
+	assert len(esclient.get_project_fileids_and_shas('user/two')) == 3
+
+def test_bulk_indexer_counts_utf8_bytes(esclient):
+	with esclient.bulk_indexer(max_bytes = 10 ** 6) as indexer:
+		indexer.add_action({'delete': {'_index': esclient.indexname, '_type': 'files', '_id': 'u/p/é', '_routing': 'u/p'}})
+		assert indexer.numbytes == len(''.join(indexer.actions).encode('utf-8'))
+
+def test_restore_switches_alias_to_restored_version(esclient, tmp_path):
+	add_project(esclient, 'user/one', 3)
+	oldversion = esclient.get_aliased_indices()[0]
+	snapshotname = esclient.backup(str(tmp_path), poll_interval = 0)
+	esclient.stub.indices[oldversion + '-other'] = esclient.stub.indices[oldversion]
+	newversion = esclient.restore_backup(snapshotname, poll_interval = 0)
+	assert newversion != oldversion and esclient.get_aliased_indices() == [newversion]
+	assert sorted(esclient.stub.indices) == sorted([oldversion, oldversion + '-other', newversion])
+	assert len(esclient.get_project_fileids_and_shas('user/one')) == 3
+
+def test_restore_that_stays_red_is_aborted(esclient, tmp_path):
+	oldversion = esclient.get_aliased_indices()[0]
+	snapshotname = esclient.backup(str(tmp_path), poll_interval = 0)
+	esclient.stub.health = 'red'
+	with pytest.raises(TransportError):
+		esclient.restore_backup(snapshotname, poll_interval = 0, timeout = 0)
+	assert esclient.get_aliased_indices() == [oldversion]
+	assert list(esclient.stub.indices) == [oldversion]
@@ -0,0 +1,47 @@
+import os
+import pytest
+from conftest import run_git, commit_files
+from libs.gitdownloader import GitDownloader
+
+def count_commits(repo_path):
+	return int(run_git(['rev-list', '--count', 'HEAD'], repo_path))
+
+@pytest.mark.parametrize('strategy, numcommits', [('full', 3), ('shallow', 1), ('blobless', 3)])
+def test_clone_strategy(tmp_path, bare_repository, strategy, numcommits):
+	downloader = GitDownloader(str(tmp_path / 'src'), 'git', strategy)
+	repo_path = str(tmp_path / 'src' / 'user' / 'project')
+	assert downloader.git_clone(bare_repository['path'], repo_path, 'master')
+	assert downloader.get_head_commit(repo_path) == bare_repository['commits'][-1]
+	assert count_commits(repo_path) == numcommits
+	if strategy == 'blobless':
+		assert run_git(['config', 'remote.origin.partialclonefilter'], repo_path) == 'blob:none'
+
+def test_clone_falls_back_to_full_clone(tmp_path, bare_repository, monkeypatch):
+	downloader = GitDownloader(str(tmp_path / 'src'), 'git', 'shallow')
+	# The server refuses shallow clones, so only the full clone succeeds
+	original = downloader.run_git
+	monkeypatch.setattr(downloader, 'run_git', lambda arguments, cwd = None: '--depth' not in arguments and original(arguments, cwd))
+	repo_path = str(tmp_path / 'src' / 'user' / 'project')
+	assert downloader.git_clone(bare_repository['path'], repo_path, 'master')
+	assert count_commits(repo_path) == 3
+
+def test_clone_of_missing_repository_leaves_nothing(tmp_path):
+	downloader = GitDownloader(str(tmp_path / 'src'), 'git', 'shallow')
+	repo_path = tmp_path / 'src' / 'user' / 'project'
+	assert not downloader.git_clone(str(tmp_path / 'missing.git'), str(repo_path), 'master')
+	assert not repo_path.exists()
+
+@pytest.mark.parametrize('strategy', ['full', 'shallow', 'blobless'])
+def test_pull_fetches_new_commit(tmp_path, bare_repository, strategy):
+	downloader = GitDownloader(str(tmp_path / 'src'), 'git', strategy)
+	repo_path = str(tmp_path / 'src' / 'user' / 'project')
+	assert downloader.git_clone(bare_repository['path'], repo_path, 'master')
+	newcommit = commit_files(bare_repository['worktree'], {'src/B.java': 'class B {}\n'}, 'new commit')
+	run_git(['push', '-q', 'bare', 'master'], bare_repository['worktree'])
+	assert downloader.git_pull(bare_repository['path'], repo_path, 'master')
+	assert downloader.get_head_commit(repo_path) == newcommit
+	assert os.path.isfile(os.path.join(repo_path, 'src', 'B.java'))
+
+def test_unknown_strategy_is_rejected(tmp_path):
+	with pytest.raises(ValueError):
+		GitDownloader(str(tmp_path), 'git', 'sparse')
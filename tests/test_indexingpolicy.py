@@ -0,0 +1,25 @@
+import json
+from libs.indexingpolicy import IndexingPolicy
+
+def test_rules_are_applied_in_order_and_counted(tmp_path):
+	path = tmp_path / 'policy.json'
+	path.write_text(json.dumps({'types': ['blob'], 'excludemodes': ['120000'], 'maxsize': 100, 'include': ['*.java', '*.xml'],
+		'exclude': ['*Test.java'], 'vendoreddirectories': ['vendor'], 'generateddirectories': ['generated']}))
+	policy = IndexingPolicy.from_file(str(path))
+	entries = {'src/A.java': None, 'src': 'type', 'src/Link.java': 'mode', 'src/Big.java': 'size', 'README.md': 'include',
+		'src/ATest.java': 'exclude', 'vendor/lib/B.java': 'vendored', 'target/generated/C.java': 'generated', 'pom.xml': None}
+	for path, rule in entries.items():
+		entry = {'path': path, 'mode': '100644', 'type': 'blob', 'size': 10}
+		if rule == 'type':
+			entry.update(mode = '040000', type = 'tree')
+		elif rule == 'mode':
+			entry['mode'] = '120000'
+		elif rule == 'size':
+			entry['size'] = 101
+		assert policy.get_skip_rule(entry) == rule
+		assert policy.is_indexed(entry) == (rule is None)
+	assert policy.get_statistics() == {'type': 1, 'mode': 1, 'size': 1, 'include': 1, 'exclude': 1, 'vendored': 1, 'generated': 1}
+
+def test_empty_policy_indexes_everything():
+	policy = IndexingPolicy({})
+	assert policy.is_indexed({'path': 'vendor/generated/A.java', 'mode': '120000', 'type': 'commit', 'size': 10 ** 9})
@@ -0,0 +1,28 @@
+import threading
+from libs.pipeline import Pipeline
+
+def test_items_pass_through_all_stages():
+	results = []
+	lock = threading.Lock()
+	def collect(item):
+		with lock:
+			results.append(item)
+	pipeline = Pipeline(queue_size = 1)
+	pipeline.add_stage('double', lambda item: item * 2, 3)
+	pipeline.add_stage('increment', lambda item: item + 1, 2)
+	pipeline.add_stage('collect', collect)
+	assert pipeline.run(range(20)) == []
+	assert sorted(results) == [2 * item + 1 for item in range(20)]
+
+def test_skipped_and_failed_items_are_not_passed_on():
+	results = []
+	def check(item):
+		if item == 3:
+			raise ValueError('bad item')
+		return item if item % 2 == 0 else None
+	pipeline = Pipeline()
+	pipeline.add_stage('check', check, 2)
+	pipeline.add_stage('collect', results.append)
+	failures = pipeline.run(range(6))
+	assert sorted(results) == [0, 2, 4]
+	assert [(stage, item, str(error)) for stage, item, error in failures] == [('check', 3, 'bad item')]
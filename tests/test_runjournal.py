@@ -0,0 +1,34 @@
+from libs.runjournal import RunJournal
+
+projects = ['https://github.com/user/one', 'https://github.com/user/two', 'https://github.com/user/three']
+
+def test_interrupted_run_is_resumed(tmp_path):
+	path = str(tmp_path / 'runs' / 'journal.sqlite')
+	journal = RunJournal(path)
+	journal.add_projects(projects)
+	journal.start_attempt(projects)
+	journal.set_stage('user/one', 'index')
+	journal.set_status('user/one', 'index', 'indexed')
+	journal.set_stage('user/two', 'clone')
+	journal.set_status('user/two', 'clone', 'failed', 'clone failed')
+	journal.set_stage('user/three', 'parse')
+	journal.close()
+	journal = RunJournal(path)
+	journal.add_projects(projects)
+	assert journal.get_unfinished_projects() == projects[1:]
+	assert journal.get_statistics() == {'indexed': 1, 'failed': 1, 'running': 1}
+	journal.close()
+
+def test_attempts_are_limited_and_reset(tmp_path):
+	journal = RunJournal(str(tmp_path / 'journal.sqlite'))
+	journal.add_projects(projects)
+	for _ in range(2):
+		journal.start_attempt(projects[:1])
+		journal.set_status('user/one', 'clone', 'failed')
+	journal.set_status('user/two', 'download', 'skipped')
+	assert journal.get_unfinished_projects(2) == [projects[2]]
+	journal.reset_attempts()
+	assert journal.get_unfinished_projects(2) == [projects[0], projects[2]]
+	journal.clear()
+	assert journal.get_unfinished_projects() == []
+	journal.close()